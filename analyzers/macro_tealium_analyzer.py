@@ -1,12 +1,15 @@
-import asyncio
 import json
+import orjson
 import re
+import time
 import traceback
 from datetime import datetime
 from typing import Dict, List, Any, AsyncGenerator
 from urllib.parse import parse_qs, unquote
 
-from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError, Error as PlaywrightError, Page, Browser, BrowserContext
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError, Error as PlaywrightError, Page, Browser, BrowserContext
+
+from core.browser_manager import get_shared_browser, dismiss_cookie_overlays, consent_scoped
 
 # Reuse scripts, helpers, and vendor definitions from the manual analyzer to ensure identical reporting
 from .tealium_manual_analyzer import (
@@ -16,20 +19,93 @@ from .tealium_manual_analyzer import (
     POST_CLICK_WAIT_MS,
     PRIVACY_PROMPT_ACCEPT_SELECTOR,
     MINICART_OVERLAY_SELECTOR,
-    get_data_from_page,
-    clear_tracking_data,
+    get_multiple_data_from_page,
     dismiss_overlays,
     find_vendors_in_requests,
+    match_tag_vendor,
     analyze_vendors_on_page,
-    TAG_VENDORS,
+    block_heavy_resources,
+    ANALYSIS_BROWSER_ARGS,
     GLOBAL_VENDOR_OBJECTS,
 )
 
+# Patterns used on every captured Tealium collect request
+MULTIPART_BOUNDARY_RE = re.compile(r'------WebKitFormBoundary([A-Za-z0-9]+)')
+UTAG_INITIATOR_RE = re.compile(r'utag[\._](\d+)')
+
+# Built once at import: the vendor list is static, so there is no need to re-serialize it per snapshot
+DETECT_TAGS_AND_OBJECTS_SCRIPT = """
+    (clearTracking) => {
+        const scripts = Array.from(document.querySelectorAll('script[src]')).map(script => ({
+            src: script.src,
+            type: script.type || 'text/javascript'
+        }));
+        const objects = [];
+        const vendors = """ + json.dumps(GLOBAL_VENDOR_OBJECTS) + """;
+        
+        vendors.forEach(vendor => {
+            try {
+                if (window[vendor.object] !== undefined) {
+                    objects.push({
+                        name: vendor.name,
+                        category: vendor.category,
+                        object: vendor.object,
+                        type: typeof window[vendor.object]
+                    });
+                }
+            } catch (e) {
+                // Object might be protected, skip it
+            }
+        });
+        
+        // Optionally reset the monitor logs in the same round-trip (same as clear_tracking_data)
+        if (clearTracking) {
+            if (window.tealiumSpecificEvents) { window.tealiumSpecificEvents = []; }
+            if (window.generalTrackingEvents) { window.generalTrackingEvents = { network: [], analyticsCalls: [], dataLayer: [] }; }
+        }
+        
+        return { scripts, objects };
+    }
+"""
+
+# Common cookie banner selectors, tried in order before analysis starts. A wrong click here
+# spoils the baseline capture, so text matches are exact and everyday words ("OK", "Close",
+# "Continue") only count inside a consent container.
+COOKIE_DISMISS_SELECTORS = (
+    '#onetrust-accept-btn-handler',
+    'button:text-is("Accept All")',
+    'button:text-is("Accept all")',
+    'button:text-is("Accept")',
+    'button:text-is("I Agree")',
+    'button:text-is("Allow All")',
+    'button[id*="accept"]',
+    'button[class*="accept"]',
+    'button[id*="consent"]',
+    'button[class*="consent"]',
+    'a:text-is("Accept")',
+) + consent_scoped((
+    'button:text-is("Continue")',
+    'button:text-is("OK")',
+    'button:text-is("Close")',
+    'a:text-is("Close")',
+)) + (
+    '.cookie-banner button',
+    '.gdpr-banner button',
+    '.modal button:text-is("Accept")',
+)
+
+def with_iso_timestamps(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Copy captured entries with their epoch-seconds timestamp rendered as ISO 8601.
+    Listeners store time.time() so only the handful of entries reported pay for formatting.
+    """
+    return [{**entry, "timestamp": datetime.fromtimestamp(entry["timestamp"]).isoformat()} for entry in entries]
+
 def parse_multipart_form_data(form_data: str) -> Dict[str, Any]:
     """Parse multipart form data to extract JSON tracking payload"""
     try:
         # Find the boundary
-        boundary_match = re.search(r'------WebKitFormBoundary([A-Za-z0-9]+)', form_data)
+        boundary_match = MULTIPART_BOUNDARY_RE.search(form_data)
         if not boundary_match:
             return {"error": "No boundary found in multipart data"}
         
@@ -49,8 +125,8 @@ def parse_multipart_form_data(form_data: str) -> Dict[str, Any]:
                     json_data = part[json_start:json_end].strip()
                     if json_data:
                         try:
-                            return json.loads(json_data)
-                        except json.JSONDecodeError:
+                            return orjson.loads(json_data)
+                        except orjson.JSONDecodeError:
                             return {"raw_json_data": json_data, "error": "Failed to parse JSON"}
         
         return {"error": "No data field found in multipart form"}
@@ -61,7 +137,7 @@ def extract_initiator_from_url(url: str) -> str:
     """Extract which Tealium tag initiated the request from URL or referrer"""
     try:
         # Look for utag patterns in the URL
-        utag_match = re.search(r'utag[\._](\d+)', url)
+        utag_match = UTAG_INITIATOR_RE.search(url)
         if utag_match:
             return f"utag.{utag_match.group(1)}.js"
         return "unknown_initiator"
@@ -92,10 +168,10 @@ async def analyze_macro_selectors_against_config(macro_url: str, macro_selectors
             "progress": 0
         }
         
-        # Launch browser
-        playwright = await async_playwright().start()
-        browser = await playwright.chromium.launch(headless=True)
+        # Each analysis gets its own context on the shared browser
+        browser = await get_shared_browser(ANALYSIS_BROWSER_ARGS)
         context = await browser.new_context()
+        await block_heavy_resources(context)
         page = await context.new_page()
         # Inject the same init scripts as the manual analyzer for consistent event capture
         await page.add_init_script(TEALIUM_PAYLOAD_MONITOR_SCRIPT)
@@ -103,21 +179,20 @@ async def analyze_macro_selectors_against_config(macro_url: str, macro_selectors
         
         yield {
             "status": "browser_launched",
-            "message": "Browser launched successfully",
+            "message": "Browser ready",
             "progress": 10
         }
         
         # Set up monitoring
         network_requests = []
         console_logs = []
-        javascript_errors = []
         
         # Monitor network requests
         def handle_request(request):
             network_requests.append({
                 "url": request.url,
                 "method": request.method,
-                "timestamp": datetime.now().isoformat()
+                "timestamp": time.time()  # formatted only if the entry makes it into the results
             })
         
         page.on("request", handle_request)
@@ -125,7 +200,9 @@ async def analyze_macro_selectors_against_config(macro_url: str, macro_selectors
         # Capture Tealium i.gif REQUEST payloads
         tealium_i_gif_payloads = []
         
-        async def _capture_tealium_request(request):
+        # post_data and headers are plain properties on the request, so this runs inline in the
+        # event callback instead of scheduling a task for every request the page makes.
+        def _capture_tealium_request(request):
             try:
                 url = request.url
                 if "datacloud.tealiumiq.com" in url and "/i.gif" in url:
@@ -145,7 +222,7 @@ async def analyze_macro_selectors_against_config(macro_url: str, macro_selectors
                                 tracking_data = parse_qs(unquote(post_data))
                             else:
                                 # Try to parse as JSON
-                                tracking_data = json.loads(post_data)
+                                tracking_data = orjson.loads(post_data)
                         except Exception as e:
                             # Store raw data if parsing fails
                             tracking_data = {"raw_data": post_data[:5000], "parse_error": str(e)}
@@ -153,7 +230,7 @@ async def analyze_macro_selectors_against_config(macro_url: str, macro_selectors
                     payload_entry = {
                         "url": url,
                         "method": request.method,
-                        "timestamp": datetime.now().isoformat(),
+                        "timestamp": time.time(),  # formatted only if the entry makes it into the results
                         "headers": dict(headers),
                         "tracking_data": tracking_data,
                         "initiator": extract_initiator_from_url(url)
@@ -163,33 +240,18 @@ async def analyze_macro_selectors_against_config(macro_url: str, macro_selectors
                 # Never fail analysis due to request parsing
                 pass
         
-        def handle_request(request):
-            try:
-                asyncio.create_task(_capture_tealium_request(request))
-            except Exception:
-                pass
-        
-        page.on("request", handle_request)
+        page.on("request", _capture_tealium_request)
         
         # Monitor console logs
         def handle_console(msg):
             console_logs.append({
                 "type": msg.type,
                 "text": msg.text,
-                "timestamp": datetime.now().isoformat()
+                "timestamp": time.time()  # formatted only if the entry makes it into the results
             })
         
         page.on("console", handle_console)
         
-        # Monitor JavaScript errors
-        def handle_page_error(error):
-            javascript_errors.append({
-                "message": str(error),
-                "timestamp": datetime.now().isoformat()
-            })
-        
-        page.on("pageerror", handle_page_error)
-        
         # Navigate to the page
         yield {
             "status": "navigating",
@@ -198,10 +260,16 @@ async def analyze_macro_selectors_against_config(macro_url: str, macro_selectors
         }
         
         await page.goto(macro_url, wait_until='domcontentloaded', timeout=30000)
-        await page.wait_for_timeout(POST_LOAD_WAIT_MS)
+        # Continue as soon as utag is up rather than always sleeping the full post-load window
+        try:
+            await page.wait_for_function("window.utag !== undefined", timeout=POST_LOAD_WAIT_MS)
+        except PlaywrightTimeoutError:
+            pass
         
         # Dismiss cookie banners and overlays automatically
-        await dismiss_cookie_overlays_advanced(page)
+        dismissed_selector = await dismiss_cookie_overlays(page, COOKIE_DISMISS_SELECTORS)
+        if dismissed_selector:
+            print(f"Dismissed overlay with selector: {dismissed_selector}")
         
         yield {
             "status": "page_loaded",
@@ -225,8 +293,7 @@ async def analyze_macro_selectors_against_config(macro_url: str, macro_selectors
             pass
         
         # Get baseline state
-        initial_tags = await detect_tags_and_vendors(page)
-        initial_objects = await detect_vendor_objects(page)
+        initial_tags, initial_objects = await detect_tags_and_objects(page)
         
         yield {
             "status": "baseline_captured",
@@ -278,22 +345,11 @@ async def analyze_macro_selectors_against_config(macro_url: str, macro_selectors
                         target = page.get_by_role(role, name=name).filter(has=scope).first
                         await target.scroll_into_view_if_needed()
                         await target.wait_for(state='visible', timeout=4000)
-                        pre_click_tags = await detect_tags_and_vendors(page)
-                        pre_click_objects = await detect_vendor_objects(page)
-                        await clear_tracking_data(page)
+                        pre_click_tags, pre_click_objects = await detect_tags_and_objects(page, clear_tracking=True)
                         clicked_handle = target
-                        click_timestamp = datetime.now()
+                        click_timestamp = time.time()
                         await target.click()
-                        # Fast polling for events instead of fixed wait only
-                        waited = 0
-                        while waited < POST_CLICK_WAIT_MS:
-                            events_len = await page.evaluate("() => (window.tealiumSpecificEvents||[]).length")
-                            if isinstance(events_len, int) and events_len > 0:
-                                break
-                            await page.wait_for_timeout(100)
-                            waited += 100
-                        if waited >= POST_CLICK_WAIT_MS:
-                            await page.wait_for_timeout(100)  # small grace
+                        await wait_for_tealium_events(page)
                         clicked = True
                         strategy_used = 'role_name'
                     except Exception:
@@ -306,21 +362,11 @@ async def analyze_macro_selectors_against_config(macro_url: str, macro_selectors
                         target = page.locator(selector).first
                         await target.wait_for(state='visible', timeout=3000)
                         await target.scroll_into_view_if_needed()
-                        pre_click_tags = await detect_tags_and_vendors(page)
-                        pre_click_objects = await detect_vendor_objects(page)
-                        await clear_tracking_data(page)
+                        pre_click_tags, pre_click_objects = await detect_tags_and_objects(page, clear_tracking=True)
                         clicked_handle = target
-                        click_timestamp = datetime.now()
+                        click_timestamp = time.time()
                         await target.click()
-                        waited = 0
-                        while waited < POST_CLICK_WAIT_MS:
-                            events_len = await page.evaluate("() => (window.tealiumSpecificEvents||[]).length")
-                            if isinstance(events_len, int) and events_len > 0:
-                                break
-                            await page.wait_for_timeout(100)
-                            waited += 100
-                        if waited >= POST_CLICK_WAIT_MS:
-                            await page.wait_for_timeout(100)
+                        await wait_for_tealium_events(page)
                         clicked = True
                         strategy_used = 'recorded_selector'
                     except Exception:
@@ -333,21 +379,11 @@ async def analyze_macro_selectors_against_config(macro_url: str, macro_selectors
                         target = scoped.first
                         await target.wait_for(state='visible', timeout=3000)
                         await target.scroll_into_view_if_needed()
-                        pre_click_tags = await detect_tags_and_vendors(page)
-                        pre_click_objects = await detect_vendor_objects(page)
-                        await clear_tracking_data(page)
+                        pre_click_tags, pre_click_objects = await detect_tags_and_objects(page, clear_tracking=True)
                         clicked_handle = target
-                        click_timestamp = datetime.now()
+                        click_timestamp = time.time()
                         await target.click()
-                        waited = 0
-                        while waited < POST_CLICK_WAIT_MS:
-                            events_len = await page.evaluate("() => (window.tealiumSpecificEvents||[]).length")
-                            if isinstance(events_len, int) and events_len > 0:
-                                break
-                            await page.wait_for_timeout(100)
-                            waited += 100
-                        if waited >= POST_CLICK_WAIT_MS:
-                            await page.wait_for_timeout(100)
+                        await wait_for_tealium_events(page)
                         clicked = True
                         strategy_used = 'scoped_css'
                     except Exception:
@@ -373,21 +409,11 @@ async def analyze_macro_selectors_against_config(macro_url: str, macro_selectors
                                 target = candidate.first
                                 await target.wait_for(state='visible', timeout=1000)
                                 await target.scroll_into_view_if_needed()
-                                pre_click_tags = await detect_tags_and_vendors(page)
-                                pre_click_objects = await detect_vendor_objects(page)
-                                await clear_tracking_data(page)
+                                pre_click_tags, pre_click_objects = await detect_tags_and_objects(page, clear_tracking=True)
                                 clicked_handle = target
-                                click_timestamp = datetime.now()
+                                click_timestamp = time.time()
                                 await target.click()
-                                waited = 0
-                                while waited < POST_CLICK_WAIT_MS:
-                                    events_len = await page.evaluate("() => (window.tealiumSpecificEvents||[]).length")
-                                    if isinstance(events_len, int) and events_len > 0:
-                                        break
-                                    await page.wait_for_timeout(100)
-                                    waited += 100
-                                if waited >= POST_CLICK_WAIT_MS:
-                                    await page.wait_for_timeout(100)
+                                await wait_for_tealium_events(page)
                                 clicked = True
                                 strategy_used = 'text_based'
                                 break
@@ -406,21 +432,11 @@ async def analyze_macro_selectors_against_config(macro_url: str, macro_selectors
                             candidate = candidate.filter(has_text=name)
                         target = candidate.first
                         await target.wait_for(state='visible', timeout=3000)
-                        pre_click_tags = await detect_tags_and_vendors(page)
-                        pre_click_objects = await detect_vendor_objects(page)
-                        await clear_tracking_data(page)
+                        pre_click_tags, pre_click_objects = await detect_tags_and_objects(page, clear_tracking=True)
                         clicked_handle = target
-                        click_timestamp = datetime.now()
+                        click_timestamp = time.time()
                         await target.click()
-                        waited = 0
-                        while waited < POST_CLICK_WAIT_MS:
-                            events_len = await page.evaluate("() => (window.tealiumSpecificEvents||[]).length")
-                            if isinstance(events_len, int) and events_len > 0:
-                                break
-                            await page.wait_for_timeout(100)
-                            waited += 100
-                        if waited >= POST_CLICK_WAIT_MS:
-                            await page.wait_for_timeout(100)
+                        await wait_for_tealium_events(page)
                         clicked = True
                         strategy_used = 'href_heuristic'
                     except Exception:
@@ -431,21 +447,11 @@ async def analyze_macro_selectors_against_config(macro_url: str, macro_selectors
                         yield {"status": "progress", "message": "    Trying XPath locator..."}
                         target = page.locator(f'xpath={locator_bundle["xpath"]}').first
                         await target.wait_for(state='visible', timeout=3000)
-                        pre_click_tags = await detect_tags_and_vendors(page)
-                        pre_click_objects = await detect_vendor_objects(page)
-                        await clear_tracking_data(page)
+                        pre_click_tags, pre_click_objects = await detect_tags_and_objects(page, clear_tracking=True)
                         clicked_handle = target
-                        click_timestamp = datetime.now()
+                        click_timestamp = time.time()
                         await target.click()
-                        waited = 0
-                        while waited < POST_CLICK_WAIT_MS:
-                            events_len = await page.evaluate("() => (window.tealiumSpecificEvents||[]).length")
-                            if isinstance(events_len, int) and events_len > 0:
-                                break
-                            await page.wait_for_timeout(100)
-                            waited += 100
-                        if waited >= POST_CLICK_WAIT_MS:
-                            await page.wait_for_timeout(100)
+                        await wait_for_tealium_events(page)
                         clicked = True
                         strategy_used = 'xpath'
                     except Exception:
@@ -460,52 +466,25 @@ async def analyze_macro_selectors_against_config(macro_url: str, macro_selectors
                     except:
                         pass
                     
-                    post_click_tags = await detect_tags_and_vendors(page)
-                    post_click_objects = await detect_vendor_objects(page)
+                    post_click_tags, post_click_objects = await detect_tags_and_objects(page)
                     
-                    new_tags = [tag for tag in post_click_tags if tag not in pre_click_tags]
-                    new_objects = [obj for obj in post_click_objects if obj not in pre_click_objects]
+                    # Hash the baseline once instead of scanning it for every post-click entry
+                    pre_tag_keys = {frozenset(tag.items()) for tag in pre_click_tags}
+                    pre_object_keys = {frozenset(obj.items()) for obj in pre_click_objects}
+                    new_tags = [tag for tag in post_click_tags if frozenset(tag.items()) not in pre_tag_keys]
+                    new_objects = [obj for obj in post_click_objects if frozenset(obj.items()) not in pre_object_keys]
                     
-                    tealium_requests = [req for req in network_requests 
-                                      if any(vendor in req['url'].lower() for vendor in ['tealium', 'collect', 'utag'])]
+                    tealium_requests = with_iso_timestamps([req for req in network_requests 
+                                      if any(vendor in req['url'].lower() for vendor in ['tealium', 'collect', 'utag'])])
                     vendors_in_network = find_vendors_in_requests(network_requests)
                     
-                    tealium_logs = [log for log in console_logs 
-                                  if any(keyword in log['text'].lower() for keyword in ['utag', 'tealium', 'track', 'event'])]
-                    tealium_events = await get_data_from_page(page, "tealiumSpecificEvents")
+                    tealium_logs = with_iso_timestamps([log for log in console_logs 
+                                  if any(keyword in log['text'].lower() for keyword in ['utag', 'tealium', 'track', 'event'])])
+                    tracking_data = await get_multiple_data_from_page(page, ["tealiumSpecificEvents", "generalTrackingEvents"])
+                    tealium_events = tracking_data["tealiumSpecificEvents"]
                     # New: pull only the i.gif payloads captured during this selector
                     new_tealium_i_gif_payloads = tealium_i_gif_payloads[pre_tealium_payload_count:]
                     
-                    # Correlate i.gif requests with the click that triggered them
-                    correlated_payloads = []
-                    if click_timestamp:
-                        for payload in new_tealium_i_gif_payloads:
-                            try:
-                                payload_time = datetime.fromisoformat(payload['timestamp'])
-                                delay_ms = (payload_time - click_timestamp).total_seconds() * 1000
-                                
-                                # Add correlation info if within reasonable time window (0-2000ms)
-                                if 0 <= delay_ms <= 2000:
-                                    payload['click_correlation'] = {
-                                        'selector': selector,
-                                        'strategy_used': strategy_used,
-                                        'delay_ms': round(delay_ms, 2),
-                                        'clicked_element': {
-                                            'text': clicked_text,
-                                            'href': clicked_href
-                                        }
-                                    }
-                                correlated_payloads.append(payload)
-                            except Exception:
-                                correlated_payloads.append(payload)
-                    else:
-                        correlated_payloads = new_tealium_i_gif_payloads
-                    yield {
-                        "status": "progress",
-                        "message": f"    Post-click: captured {len(tealium_events) if isinstance(tealium_events, list) else 0} Tealium events; {len(new_tealium_i_gif_payloads)} i.gif payload(s); {len(tealium_requests)} network hits to Tealium/vendors"
-                    }
-                    general_events = await get_data_from_page(page, "generalTrackingEvents")
-                    
                     # Capture brief info about the clicked element
                     clicked_href = None
                     clicked_text = None
@@ -516,6 +495,31 @@ async def analyze_macro_selectors_against_config(macro_url: str, macro_selectors
                     except Exception:
                         pass
 
+                    # Correlate i.gif requests with the click that triggered them. Both sides are
+                    # epoch seconds, so the delay is a subtraction rather than an ISO round-trip.
+                    correlated_payloads = with_iso_timestamps(new_tealium_i_gif_payloads)
+                    if click_timestamp:
+                        for raw_payload, payload in zip(new_tealium_i_gif_payloads, correlated_payloads):
+                            delay_ms = (raw_payload['timestamp'] - click_timestamp) * 1000
+                            
+                            # Add correlation info if within reasonable time window (0-2000ms)
+                            if 0 <= delay_ms <= 2000:
+                                payload['click_correlation'] = {
+                                    'selector': selector,
+                                    'strategy_used': strategy_used,
+                                    'delay_ms': round(delay_ms, 2),
+                                    'clicked_element': {
+                                        'text': clicked_text,
+                                        'href': clicked_href
+                                    }
+                                }
+                    
+                    yield {
+                        "status": "progress",
+                        "message": f"    Post-click: captured {len(tealium_events) if isinstance(tealium_events, list) else 0} Tealium events; {len(new_tealium_i_gif_payloads)} i.gif payload(s); {len(tealium_requests)} network hits to Tealium/vendors"
+                    }
+                    general_events = tracking_data["generalTrackingEvents"]
+                    
                     selector_result = {
                         "selector": selector,
                         "description": description,
@@ -615,135 +619,57 @@ async def analyze_macro_selectors_against_config(macro_url: str, macro_selectors
         }
         
     finally:
-        # Clean up browser resources
-        try:
-            if page:
-                await page.close()
-            if context:
-                await context.close()
-            if browser:
-                await browser.close()
-        except Exception as cleanup_error:
-            print(f"Error during cleanup: {cleanup_error}")
+        # Clean up browser resources independently so a failed page close can't leak the context
+        if page:
+            try: await page.close()
+            except Exception as cleanup_error: print(f"Error closing page: {cleanup_error}")
+        if context:
+            try: await context.close()
+            except Exception as cleanup_error: print(f"Error closing context: {cleanup_error}")
 
 
-async def detect_tags_and_vendors(page: Page) -> List[Dict[str, str]]:
-    """Detect marketing tags and vendors on the page"""
+async def wait_for_tealium_events(page: Page, timeout_ms: int = POST_CLICK_WAIT_MS):
+    """
+    Wait until the payload monitor has captured a Tealium event, or the post-click window
+    (plus a small grace period) has passed. One wait_for_function call replaces the old
+    evaluate-and-sleep loop that cost a round-trip every 100ms.
+    """
     try:
-        # Get all script tags
-        scripts = await page.evaluate("""
-            () => {
-                const scripts = Array.from(document.querySelectorAll('script[src]'));
-                return scripts.map(script => ({
-                    src: script.src,
-                    type: script.type || 'text/javascript'
-                }));
-            }
-        """)
-        
-        detected_tags = []
-        for script in scripts:
-            src = script.get('src', '')
-            for vendor in TAG_VENDORS:
-                if vendor['pattern'] in src:
-                    detected_tags.append({
-                        'vendor': vendor['name'],
-                        'category': vendor['category'],
-                        'url': src,
-                        'type': 'script'
-                    })
-                    break
-        
-        return detected_tags
-        
-    except Exception as e:
-        print(f"Error detecting tags: {e}")
-        return []
+        await page.wait_for_function(
+            "() => (window.tealiumSpecificEvents || []).length > 0",
+            timeout=timeout_ms + 100
+        )
+    except PlaywrightTimeoutError:
+        pass
 
 
-async def detect_vendor_objects(page: Page) -> List[Dict[str, str]]:
-    """Detect vendor-specific JavaScript objects on the page"""
+async def detect_tags_and_objects(page: Page, clear_tracking: bool = False) -> tuple:
+    """
+    Detect marketing tags (script srcs) and vendor-specific global objects on the page
+    in a single evaluate round-trip. Returns (detected_tags, vendor_objects).
+    With clear_tracking=True the monitor event logs are also reset in that same call,
+    which is how the pre-click snapshot is taken.
+    """
     try:
-        # Check for global vendor objects
-        vendor_objects = await page.evaluate("""
-            () => {
-                const objects = [];
-                const vendors = """ + json.dumps(GLOBAL_VENDOR_OBJECTS) + """;
-                
-                vendors.forEach(vendor => {
-                    try {
-                        if (window[vendor.object] !== undefined) {
-                            objects.push({
-                                name: vendor.name,
-                                category: vendor.category,
-                                object: vendor.object,
-                                type: typeof window[vendor.object]
-                            });
-                        }
-                    } catch (e) {
-                        // Object might be protected, skip it
-                    }
-                });
-                
-                return objects;
-            }
-        """)
-        
-        return vendor_objects
-        
+        state = await page.evaluate(DETECT_TAGS_AND_OBJECTS_SCRIPT, clear_tracking)
     except Exception as e:
-        print(f"Error detecting vendor objects: {e}")
-        return []
-
+        print(f"Error detecting tags and vendor objects: {e}")
+        return [], []
+    
+    detected_tags = []
+    for script in state.get('scripts', []):
+        src = script.get('src', '')
+        vendor = match_tag_vendor(src) if src else None
+        if vendor:
+            detected_tags.append({
+                'vendor': vendor['name'],
+                'category': vendor['category'],
+                'url': src,
+                'type': 'script'
+            })
+    
+    return detected_tags, state.get('objects', [])
 
-# Wrapper with the name expected by app.py
-async def dismiss_cookie_overlays_advanced(page: Page):
-    """Enhanced cookie dismissal for macro analyzer"""
-    try:
-        await page.wait_for_timeout(1000)  # Wait for overlays to appear
-        
-        # Common cookie banner selectors
-        dismiss_selectors = [
-            'button:has-text("Accept All")',
-            'button:has-text("Accept")', 
-            'button:has-text("I Agree")',
-            'button:has-text("Allow All")',
-            'button:has-text("Continue")',
-            'button:has-text("OK")',
-            'button:has-text("Close")',
-            'button[id*="accept"]',
-            'button[class*="accept"]',
-            'button[id*="consent"]',
-            'button[class*="consent"]',
-            'a:has-text("Accept")',
-            'a:has-text("Close")',
-            '.cookie-banner button',
-            '.gdpr-banner button',
-            '[role="dialog"] button',
-            '.modal button:has-text("Accept")',
-            '.overlay button:has-text("Close")'
-        ]
-        
-        for selector in dismiss_selectors:
-            try:
-                element = await page.locator(selector).first
-                if await element.is_visible():
-                    await element.click()
-                    await page.wait_for_timeout(500)
-                    print(f"Dismissed overlay with selector: {selector}")
-                    break
-            except Exception:
-                continue
-                
-        # Try Escape key as fallback
-        try:
-            await page.keyboard.press('Escape')
-            await page.wait_for_timeout(300)
-        except Exception:
-            pass
-            
-    except Exception as e:
-        print(f"Cookie dismissal failed: {e}")
 
 async def analyze_macro_tealium_events(macro_url: str, macro_selectors: List[Dict], macro_name: str = "Unknown Macro") -> AsyncGenerator[Dict[str, Any], None]:
     async for update in analyze_macro_selectors_against_config(macro_url, macro_selectors, macro_name):
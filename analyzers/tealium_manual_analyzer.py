@@ -1,18 +1,17 @@
 import asyncio
-import json
+import orjson
 import sys
 import re
 import time
 from datetime import datetime
 from typing import Dict, List, Any, Optional, AsyncGenerator # Added AsyncGenerator
-from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError, Error as PlaywrightError, Page, Browser, BrowserContext
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError, Error as PlaywrightError, Page, Browser, BrowserContext
 import traceback
-import nest_asyncio
+from functools import lru_cache
 
 # Import the selector configuration
 from core.selectors_config import PAGE_TYPE_SELECTORS
-
-nest_asyncio.apply()
+from core.browser_manager import get_shared_browser, close_shared_browser
 
 # --- Vendor Definitions ---
 TAG_VENDORS = [
@@ -91,9 +90,37 @@ GLOBAL_VENDOR_OBJECTS = [
     {"object": "__adroll", "name": "AdRoll", "category": "advertising"}
 ]
 
+# Lower-cased once here instead of for every (URL, vendor) pair in the matching loops
+TAG_VENDOR_PATTERNS = [(vendor["pattern"].lower(), vendor) for vendor in TAG_VENDORS]
+
+# Lookup by global object path; the first definition for a path wins, matching list order.
+GLOBAL_VENDOR_OBJECTS_BY_PATH: Dict[str, Dict[str, str]] = {}
+for _vendor_def in GLOBAL_VENDOR_OBJECTS:
+    GLOBAL_VENDOR_OBJECTS_BY_PATH.setdefault(_vendor_def["object"], _vendor_def)
+del _vendor_def
+
 # --- Configuration ---
 POST_LOAD_WAIT_MS = 1500 # Reduced from 4000
 POST_CLICK_WAIT_MS = 1000 # Reduced from 3000
+TEALIUM_READY_TIMEOUT_MS = 10000 # Upper bound for utag to appear after DOMContentLoaded
+
+# utag is what the analysis actually needs; if it hasn't appeared within
+# TEALIUM_READY_TIMEOUT_MS the page falls back to waiting for 'load'
+TEALIUM_READY_CONDITION = "window.utag !== undefined"
+
+# Chromium flags for short-lived analysis browsers: avoid the small /dev/shm in containers,
+# skip GPU/extension/background-network startup work we never use.
+ANALYSIS_BROWSER_ARGS = [
+    '--disable-dev-shm-usage',
+    '--disable-gpu',
+    '--disable-extensions',
+    '--disable-background-networking',
+    '--no-first-run',
+]
+
+# Resource types the analysis never looks at. Stylesheets stay enabled because the
+# click tests rely on real CSS visibility (collapsed panels, carousels, overlays).
+BLOCKED_RESOURCE_TYPES = frozenset({"image", "font", "media"})
 
 PRIVACY_PROMPT_ACCEPT_SELECTOR = 'button#truste-consent-button'
 MINICART_OVERLAY_SELECTOR = '#prh-minicart-overlay' # Example, adjust if needed
@@ -135,53 +162,78 @@ POST_LOAD_TAG_DETECTION_SCRIPT = """
 }"""
 
 # --- Python Helper Functions ---
-async def get_data_from_page(page: Page, var_name: str) -> Dict[str, Any]:
-    """Safely retrieves data from a window variable on the page."""
+GET_MULTIPLE_DATA_SCRIPT = """
+(varNames) => {
+    const safeStringify = (obj) => {
+        const cache = new Set();
+        return JSON.stringify(obj, (key, value) => {
+            if (typeof value === 'object' && value !== null) {
+                if (cache.has(value)) return '[Circular Reference]';
+                cache.add(value);
+            }
+            if (typeof value === 'function') return '[Function]';
+            if (typeof value === 'symbol') return '[Symbol]';
+            if (typeof value === 'bigint') return `[BigInt: ${value.toString()}]`;
+            if (value instanceof Element || value instanceof Node) return '[DOM Element]';
+            return value;
+        });
+    };
+    const out = {};
+    for (const name of varNames) {
+        try {
+            out[name] = safeStringify(window[name] || null);
+        } catch (e) {
+            try {
+                out[name] = JSON.stringify({ error: `Failed to access or stringify window.${name}: ${e.message}` });
+            } catch (jsonError) {
+                out[name] = '{"error": "Failed to stringify error message"}';
+            }
+        }
+    }
+    return out;
+}"""
+
+async def get_multiple_data_from_page(page: Page, var_names: List[str]) -> Dict[str, Any]:
+    """
+    Retrieves several window variables in a single evaluate round-trip.
+    Returns a dict keyed by variable name; each value is the parsed data, an "info" dict when
+    the variable is missing or empty, or an "error" dict when it couldn't be read.
+    """
+    try:
+        raw_values = await page.evaluate(GET_MULTIPLE_DATA_SCRIPT, list(var_names))
+    except PlaywrightError as pe:
+        print(f"      Playwright Error retrieving {', '.join(var_names)}: {pe}")
+        return {name: {"error": f"PlaywrightError: Failed to retrieve or parse {name}: {pe}"} for name in var_names}
+    except Exception as e:
+        print(f"      Unexpected Error retrieving {', '.join(var_names)}: {e}")
+        return {name: {"error": f"Unexpected Error: Failed to retrieve or parse {name}: {e}"} for name in var_names}
+
+    results = {}
+    for name in var_names:
+        data_json = (raw_values or {}).get(name)
+        try:
+            results[name] = orjson.loads(data_json) if data_json else {"info": f"{name} not found or empty"}
+        except orjson.JSONDecodeError as je:
+            print(f"      JSON Decode Error retrieving {name}: {je}")
+            results[name] = {"error": f"JSONDecodeError: Failed to parse {name}: {je}", "raw_data_snippet": data_json[:500]}
+    return results
+
+
+async def _abort_blocked_resources(route):
+    """Route handler that drops heavy resources the analysis doesn't need."""
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+async def block_heavy_resources(context: BrowserContext):
+    """Skips images, fonts and media for every page in the context.
+    Request events still fire for aborted requests, so beacon logging is unaffected."""
     try:
-        data_json = await page.evaluate(f"""
-            () => {{
-                try {{
-                    const MAX_DEPTH = 5; // Limit recursion depth
-                    const safeStringify = (obj, depth = 0) => {{
-                        if (depth > MAX_DEPTH) return '"[Max Depth Reached]"';
-                        if (obj === undefined) return 'null';
-                        const cache = new Set();
-                        return JSON.stringify(obj, (key, value) => {{
-                             if (typeof value === 'object' && value !== null) {{
-                                 if (cache.has(value)) return '[Circular Reference]';
-                                 cache.add(value);
-                             }}
-                             if (typeof value === 'function') return '[Function]';
-                             if (typeof value === 'symbol') return '[Symbol]';
-                             if (typeof value === 'bigint') return `[BigInt: ${{value.toString()}}]`;
-                             // Check for DOM elements (simple check, might need refinement)
-                             if (value instanceof Element || value instanceof Node) return '[DOM Element]';
-                             return value;
-                        }});
-                    }};
-                    return safeStringify(window.{var_name} || null, 0); // Return null if undefined
-                }} catch (e) {{
-                    // Attempt to return error as valid JSON string
-                    try {{
-                       return JSON.stringify({{ error: `Failed to access or stringify window.{var_name}: ${{e.message}}` }});
-                    }} catch (jsonError) {{
-                        return '{{"error": "Failed to stringify error message"}}';
-                    }}
-                }}
-            }}
-        """)
-        # Parse the JSON string returned from evaluate
-        return json.loads(data_json) if data_json else {"info": f"{var_name} not found or empty"}
-    except PlaywrightError as pe: # More specific error catching
-        print(f"      Playwright Error retrieving {var_name}: {pe}")
-        return {"error": f"PlaywrightError: Failed to retrieve or parse {var_name}: {pe}"}
-    except json.JSONDecodeError as je:
-        print(f"      JSON Decode Error retrieving {var_name}: {je}")
-        print(f"      Raw data received: {data_json[:500]}...") # Log snippet of raw data
-        return {"error": f"JSONDecodeError: Failed to parse {var_name}: {je}", "raw_data_snippet": data_json[:500]}
+        await context.route("**/*", _abort_blocked_resources)
     except Exception as e:
-        print(f"      Unexpected Error retrieving {var_name}: {e}")
-        return {"error": f"Unexpected Error: Failed to retrieve or parse {var_name}: {e}"}
+        print(f"      Warning: Could not install resource blocking: {e}")
 
 
 async def clear_tracking_data(page: Page):
@@ -223,20 +275,16 @@ def analyze_vendors_on_page(tag_detection_results: Dict[str, Any]) -> Dict[str,
     # Analyze script tags
     for script_src in tag_detection_results.get("scriptTags", []):
         if not script_src or not isinstance(script_src, str) or script_src.startswith("data:"): continue
-        for vendor in TAG_VENDORS:
-            if vendor["pattern"].lower() in script_src.lower():
-                cat = vendor["category"]
-                identified.setdefault(cat, []).append(vendor["name"])
-                break # Found a match for this script, move to next script
+        vendor = match_tag_vendor(script_src)
+        if vendor:
+            identified.setdefault(vendor["category"], []).append(vendor["name"])
 
     # Analyze global objects
     for obj in tag_detection_results.get("globalObjects", []):
          if not isinstance(obj, dict) or "path" not in obj: continue # Basic validation
-         for vendor_def in GLOBAL_VENDOR_OBJECTS:
-            if obj.get("path") == vendor_def["object"]:
-                cat = vendor_def["category"]
-                identified.setdefault(cat, []).append(vendor_def["name"])
-                break # Found a match for this object
+         vendor_def = GLOBAL_VENDOR_OBJECTS_BY_PATH.get(obj.get("path"))
+         if vendor_def:
+             identified.setdefault(vendor_def["category"], []).append(vendor_def["name"])
 
     # Add TMS based on detection flags
     if tag_detection_results.get("tealiumInfo", {}).get("detected"):
@@ -244,12 +292,23 @@ def analyze_vendors_on_page(tag_detection_results: Dict[str, Any]) -> Dict[str,
     if tag_detection_results.get("gtmInfo", {}).get("detected"):
         identified.setdefault("tag_manager", []).append("Google Tag Manager")
 
-    # Deduplicate and sort names within each category
-    final_identified = {}
+    # Deduplicate and sort names within each category (in place, no second dict)
     for cat, names in identified.items():
-        final_identified[cat] = sorted(list(set(names)))
-    return final_identified
+        identified[cat] = sorted(set(names))
+    return identified
+
 
+@lru_cache(maxsize=4096)
+def match_tag_vendor(url: str) -> Optional[Dict[str, str]]:
+    """
+    Return the first TAG_VENDORS entry whose pattern occurs in the URL, or None.
+    The same tag URLs recur across requests, snapshots and analyses, so results are memoized.
+    """
+    url_lower = url.lower()
+    for pattern, vendor in TAG_VENDOR_PATTERNS:
+        if pattern in url_lower:
+            return vendor
+    return None
 
 def find_vendors_in_requests(network_requests: List[Dict[str, Any]]) -> Dict[str, List[str]]:
     """Identifies vendors based on URL patterns in network requests."""
@@ -259,10 +318,9 @@ def find_vendors_in_requests(network_requests: List[Dict[str, Any]]) -> Dict[str
         if not isinstance(req, dict): continue # Ensure req is a dict
         url = req.get("url", "")
         if not url or not isinstance(url, str): continue # Ensure url is a non-empty string
-        for vendor in TAG_VENDORS:
-            if vendor["pattern"].lower() in url.lower():
-                vendors.setdefault(vendor["name"], []).append(url)
-                break # Found a match for this URL, move to next request
+        vendor = match_tag_vendor(url)
+        if vendor:
+            vendors.setdefault(vendor["name"], []).append(url)
     return vendors
 
 # --- Main Analysis Function (MODIFIED TO BE ASYNC GENERATOR) ---
@@ -280,442 +338,454 @@ async def analyze_page_tags_and_events(url: str) -> AsyncGenerator[Dict[str, Any
     page: Optional[Page] = None
     nav_success = False # Track navigation status
 
-    async with async_playwright() as p:
-        try:
-            yield {"status": "progress", "message": "    Launching browser..."}
-            browser = await p.chromium.launch(headless=True)
-            yield {"status": "progress", "message": "    >>> Browser launched successfully."}
-            context = await browser.new_context(
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.0.0 Safari/537.36",
-                viewport={"width": 1920, "height": 1080},
-                java_script_enabled=True,
-                ignore_https_errors=True
-            )
-            page = await context.new_page()
-            page.set_default_timeout(45000) # Set default timeout for actions like goto, click
-
-            await page.add_init_script(TEALIUM_PAYLOAD_MONITOR_SCRIPT)
-            await page.add_init_script(GENERAL_EVENT_TRACKER_SCRIPT)
-
-            yield {"status": "progress", "message": "    Navigating and loading page..."}
-            load_start_time = time.time()
-            network_requests_load = []
-            def log_request(request):
-                if request.url and not request.url.startswith('data:'):
-                     network_requests_load.append({"url": request.url, "method": request.method})
-            page.on("request", log_request)
+    try:
+        yield {"status": "progress", "message": "    Acquiring browser..."}
+        browser = await get_shared_browser(ANALYSIS_BROWSER_ARGS)
+        yield {"status": "progress", "message": "    >>> Browser ready."}
+        context = await browser.new_context(
+            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.0.0 Safari/537.36",
+            viewport={"width": 1920, "height": 1080},
+            java_script_enabled=True,
+            ignore_https_errors=True
+        )
+        await block_heavy_resources(context)
+        page = await context.new_page()
+        page.set_default_timeout(45000) # Set default timeout for actions like goto, click
+
+        await page.add_init_script(TEALIUM_PAYLOAD_MONITOR_SCRIPT)
+        await page.add_init_script(GENERAL_EVENT_TRACKER_SCRIPT)
+
+        yield {"status": "progress", "message": "    Navigating and loading page..."}
+        load_start_time = time.time()
+        network_requests_load = []
+        def log_request(request):
+            if request.url and not request.url.startswith('data:'):
+                 network_requests_load.append({"url": request.url, "method": request.method})
+        page.on("request", log_request)
 
+        try:
+            # networkidle never settles on pages with long-polling/beacon traffic; wait for the DOM
+            # and then only for utag, which is the one thing the analysis depends on.
+            await page.goto(url, wait_until='domcontentloaded', timeout=60000)
+            nav_success = True
             try:
-                await page.goto(url, wait_until='networkidle', timeout=60000)
-                nav_success = True
-            except PlaywrightTimeoutError as nav_error:
-                yield {"status": "warning", "message": f"      Warning: Navigation with 'networkidle' timed out after 60s. Page might still be usable. ({nav_error})"}
-                nav_success = True # Treat as potentially usable
-            except PlaywrightError as nav_error:
-                 yield {"status": "warning", "message": f"      Error during navigation: {nav_error}. Trying 'load' state."}
-                 try:
-                      await page.goto(url, wait_until='load', timeout=40000)
-                      nav_success = True
-                 except Exception as fallback_nav_error:
-                       error_msg = f"      ❌ Fallback navigation ('load' state) also failed: {fallback_nav_error}"
-                       yield {"status": "error", "message": error_msg}
-                       results["steps"].append({"step": "Page Navigation", "status": "Failed", "error": str(fallback_nav_error)})
-                       # Let finally block clean up, nav_success remains False
-
-            # Detach listener safely
-            try:
-                 page.remove_listener("request", log_request)
-            except Exception as detach_err:
-                 yield {"status": "warning", "message": f"      Warning: Could not detach request listener: {detach_err}"}
+                await page.wait_for_function(TEALIUM_READY_CONDITION, timeout=TEALIUM_READY_TIMEOUT_MS)
+            except PlaywrightTimeoutError:
+                yield {"status": "warning", "message": "      Warning: utag not detected in time, waiting for 'load' state instead."}
+                try:
+                    await page.wait_for_load_state('load', timeout=30000)
+                except PlaywrightTimeoutError as load_error:
+                    yield {"status": "warning", "message": f"      Warning: 'load' state timed out. Page might still be usable. ({load_error})"}
+        except PlaywrightTimeoutError as nav_error:
+            yield {"status": "warning", "message": f"      Warning: Navigation with 'domcontentloaded' timed out after 60s. Page might still be usable. ({nav_error})"}
+            nav_success = True # Treat as potentially usable
+        except PlaywrightError as nav_error:
+             yield {"status": "warning", "message": f"      Error during navigation: {nav_error}. Trying 'load' state."}
+             try:
+                  await page.goto(url, wait_until='load', timeout=40000)
+                  nav_success = True
+             except Exception as fallback_nav_error:
+                   error_msg = f"      ❌ Fallback navigation ('load' state) also failed: {fallback_nav_error}"
+                   yield {"status": "error", "message": error_msg}
+                   results["steps"].append({"step": "Page Navigation", "status": "Failed", "error": str(fallback_nav_error)})
+                   # Let finally block clean up, nav_success remains False
+
+        # Detach listener safely
+        try:
+             page.remove_listener("request", log_request)
+        except Exception as detach_err:
+             yield {"status": "warning", "message": f"      Warning: Could not detach request listener: {detach_err}"}
 
 
-            load_duration = time.time() - load_start_time
-            if nav_success:
-                yield {"status": "progress", "message": f"    Page load attempt finished in {load_duration:.2f} seconds."}
-                results["steps"].append({"step": "Page Load", "duration_sec": load_duration, "status": "Completed (or Timeout)"}) # More accurate status
+        load_duration = time.time() - load_start_time
+        if nav_success:
+            yield {"status": "progress", "message": f"    Page load attempt finished in {load_duration:.2f} seconds."}
+            results["steps"].append({"step": "Page Load", "duration_sec": load_duration, "status": "Completed (or Timeout)"}) # More accurate status
 
-                yield {"status": "progress", "message": "    Attempting to dismiss overlays..."}
-                await dismiss_overlays(page)
+            yield {"status": "progress", "message": "    Attempting to dismiss overlays..."}
+            await dismiss_overlays(page)
 
-                yield {"status": "progress", "message": f"    Waiting {POST_LOAD_WAIT_MS / 1000}s for async scripts..."}
-                await page.wait_for_timeout(POST_LOAD_WAIT_MS)
+            yield {"status": "progress", "message": f"    Waiting {POST_LOAD_WAIT_MS / 1000}s for async scripts..."}
+            await page.wait_for_timeout(POST_LOAD_WAIT_MS)
 
-                yield {"status": "progress", "message": "    Collecting initial page data..."}
-                page_load_results = {}
-                collection_failed = False
-                try:
-                    page_load_results["utag_data"] = await get_data_from_page(page, "utag_data")
-                    page_load_results["tealium_events"] = await get_data_from_page(page, "tealiumSpecificEvents")
-                    page_load_results["general_events"] = await get_data_from_page(page, "generalTrackingEvents")
-                    page_load_results["tag_detection"] = await page.evaluate(POST_LOAD_TAG_DETECTION_SCRIPT)
-                    # Check if tag_detection returned an error before analyzing
-                    if isinstance(page_load_results["tag_detection"], dict) and 'error' in page_load_results["tag_detection"]:
-                         yield {"status": "warning", "message": f"      Warning: Error during tag detection script execution: {page_load_results['tag_detection']['error']}"}
-                         page_load_results["vendors_on_page"] = {"error": "Tag detection script failed"}
-                    else:
-                         page_load_results["vendors_on_page"] = analyze_vendors_on_page(page_load_results["tag_detection"])
-
-                    page_load_results["load_network_summary"] = {
-                        "total_requests": len(network_requests_load),
-                        "vendors_detected": find_vendors_in_requests(network_requests_load)
-                    }
-                    results["pageLoadAnalysis"] = page_load_results
-                    results["steps"].append({"step": "Initial Data Collection", "status": "Success"})
-                    yield {"status": "progress", "message": "    Initial data collected."}
-                except Exception as data_e:
-                    collection_failed = True
-                    error_msg = f"      ❌ Error collecting initial data: {data_e}"
-                    yield {"status": "error", "message": error_msg}
-                    results["steps"].append({"step": "Initial Data Collection", "status": "Failed", "error": str(data_e)})
-
-                if not collection_failed:
-                    # --- Determine Page Type and Select Elements ---
-                    utag_data = page_load_results.get("utag_data", {})
-                    page_type = utag_data.get("page_type") if isinstance(utag_data, dict) else None
-                    yield {"status": "progress", "message": f"    Detected page_type: {page_type}"}
-
-                    elements_to_test_for_this_page = PAGE_TYPE_SELECTORS.get(page_type, PAGE_TYPE_SELECTORS.get("DEFAULT", []))
-
-                    if not page_type:
-                        yield {"status": "warning", "message": "      Warning: page_type not found. Using DEFAULT selectors."}
-                        results["steps"].append({"step": "Page Type Detection", "status": "Warning", "message": "page_type not found"})
-                    elif page_type not in PAGE_TYPE_SELECTORS:
-                        yield {"status": "warning", "message": f"      Warning: No specific selectors for '{page_type}'. Using DEFAULT."}
-                        results["steps"].append({"step": "Page Type Detection", "status": "Warning", "message": f"No selectors for '{page_type}', using DEFAULT"})
-                    else:
-                        results["steps"].append({"step": "Page Type Detection", "status": "Success", "detected_type": page_type})
-
-
-                    yield {"status": "progress", "message": "    Analyzing click events..."}
-                    click_analysis_results = []
-                    if not elements_to_test_for_this_page:
-                        yield {"status": "progress", "message": f"      No elements configured for click testing on page type: '{page_type or 'Unknown/Default'}'"}
-                    else:
-                        yield {"status": "progress", "message": f"      Found {len(elements_to_test_for_this_page)} elements to test for '{page_type or 'Unknown/Default'}'"}
-                        # --- Click Loop ---
-                        for i, element_config in enumerate(elements_to_test_for_this_page):
-                            description = element_config["description"]
-                            config_type = element_config.get("type", "click") # Default to "click" if type is missing
-                            click_result = {"elementDescription": description, "type": config_type} # Store type in results
-
-                            yield {"status": "progress", "message": f"\n      ▶️ Testing Interaction {i+1}/{len(elements_to_test_for_this_page)}: '{description}' ({config_type})"}
-
-                            if config_type == "sequence":
-                                click_result["sequenceSteps"] = []
-                                sequence_success = True
-                                sequence_error = None
-
-                                yield {"status": "progress", "message": "        Clearing tracking data before sequence..."}
-                                await clear_tracking_data(page) # Clear before starting the sequence
-
-                                for step_index, step in enumerate(element_config.get("steps", [])):
-                                    step_action = step.get("action")
-                                    step_selector = step.get("selector")
-                                    step_desc = step.get("description", f"Step {step_index + 1}")
-                                    step_check_visibility = step.get("check_visibility_after_previous", False)
-                                    step_result = {
-                                        "action": step_action,
-                                        "description": step_desc,
-                                        "selector": step_selector,
-                                        "status": "Pending",
-                                        "checked_visibility": False # Add field to track if visibility check was done
-                                    }
-                                    click_result["sequenceSteps"].append(step_result)
-
-                                    yield {"status": "progress", "message": f"        Executing Step {step_index + 1}/{len(element_config['steps'])}: {step_action.upper()} - '{step_desc}'"}
-
-                                    try:
-                                        element = page.locator(step_selector).first if step_selector else None
-                                        if not element and step_action in ["click", "waitFor"]: # Require element for these actions
-                                             raise ValueError(f"Selector missing for required action '{step_action}'")
-
-                                        # --- Visibility Check (if flagged) ---
-                                        if step_check_visibility:
-                                            step_result["checked_visibility"] = True
-                                            trigger_desc = click_result["sequenceSteps"][step_index - 1]["description"] if step_index > 0 else "Start of Sequence"
-                                            yield {"status": "progress", "message": f"          Triggered by: '{trigger_desc}'"}
-                                            yield {"status": "progress", "message": f"          Checking interactability for target: '{step_desc}' ({step_selector})"}
-                                            try:
-                                                # Use is_visible with a reasonable timeout for the check itself
-                                                await element.wait_for(state='visible', timeout=step.get("visibility_check_timeout", 5000))
-                                                # Optionally, add is_enabled() check if needed for buttons
-                                                # is_enabled = await element.is_enabled(timeout=1000)
-                                                # if not is_enabled:
-                                                #     raise Exception("Target element is visible but not enabled.")
-
-                                                yield {"status": "progress", "message": f"          ✅ Target '{step_desc}' is visible."}
-                                                step_result["visibility_status"] = "Visible"
-                                            except PlaywrightTimeoutError as vis_error:
-                                                yield {"status": "error", "message": f"          ❌ Target '{step_desc}' did NOT become visible/interactable within timeout."}
-                                                step_result["visibility_status"] = "Timeout"
-                                                raise Exception(f"Target element for '{step_desc}' failed visibility check after trigger. Error: {vis_error}") # Fail the step
-                                            except Exception as vis_error:
-                                                yield {"status": "error", "message": f"          ❌ Error checking visibility for '{step_desc}': {vis_error}"}
-                                                step_result["visibility_status"] = "Error"
-                                                raise # Re-raise to fail the step
-
-                                        # --- Perform Main Step Action ---
-                                        await dismiss_overlays(page) # Dismiss overlays before each action
-
-                                        if step_action == "click":
-                                            if not element: continue # Should have been caught above, but safety check
-                                            yield {"status": "progress", "message": f"          Waiting for element ('{step_selector}') to be visible for click..."}
-                                            await element.wait_for(state='visible', timeout=step.get("timeout", 15000))
-                                            yield {"status": "progress", "message": "          Element is visible."}
-                                            try:
-                                                await element.scroll_into_view_if_needed(timeout=7000)
-                                            except Exception as scroll_e:
-                                                yield {"status": "warning", "message": f"          Warning: Could not scroll element into view ({scroll_e}). Continuing attempt."}
-                                            await page.wait_for_timeout(300)
+            yield {"status": "progress", "message": "    Collecting initial page data..."}
+            page_load_results = {}
+            collection_failed = False
+            try:
+                initial_data = await get_multiple_data_from_page(page, ["utag_data", "tealiumSpecificEvents", "generalTrackingEvents"])
+                page_load_results["utag_data"] = initial_data["utag_data"]
+                page_load_results["tealium_events"] = initial_data["tealiumSpecificEvents"]
+                page_load_results["general_events"] = initial_data["generalTrackingEvents"]
+                page_load_results["tag_detection"] = await page.evaluate(POST_LOAD_TAG_DETECTION_SCRIPT)
+                # Check if tag_detection returned an error before analyzing
+                if isinstance(page_load_results["tag_detection"], dict) and 'error' in page_load_results["tag_detection"]:
+                     yield {"status": "warning", "message": f"      Warning: Error during tag detection script execution: {page_load_results['tag_detection']['error']}"}
+                     page_load_results["vendors_on_page"] = {"error": "Tag detection script failed"}
+                else:
+                     page_load_results["vendors_on_page"] = analyze_vendors_on_page(page_load_results["tag_detection"])
+
+                page_load_results["load_network_summary"] = {
+                    "total_requests": len(network_requests_load),
+                    "vendors_detected": find_vendors_in_requests(network_requests_load)
+                }
+                results["pageLoadAnalysis"] = page_load_results
+                results["steps"].append({"step": "Initial Data Collection", "status": "Success"})
+                yield {"status": "progress", "message": "    Initial data collected."}
+            except Exception as data_e:
+                collection_failed = True
+                error_msg = f"      ❌ Error collecting initial data: {data_e}"
+                yield {"status": "error", "message": error_msg}
+                results["steps"].append({"step": "Initial Data Collection", "status": "Failed", "error": str(data_e)})
+
+            if not collection_failed:
+                # --- Determine Page Type and Select Elements ---
+                utag_data = page_load_results.get("utag_data", {})
+                page_type = utag_data.get("page_type") if isinstance(utag_data, dict) else None
+                yield {"status": "progress", "message": f"    Detected page_type: {page_type}"}
+
+                elements_to_test_for_this_page = PAGE_TYPE_SELECTORS.get(page_type, PAGE_TYPE_SELECTORS.get("DEFAULT", []))
+
+                if not page_type:
+                    yield {"status": "warning", "message": "      Warning: page_type not found. Using DEFAULT selectors."}
+                    results["steps"].append({"step": "Page Type Detection", "status": "Warning", "message": "page_type not found"})
+                elif page_type not in PAGE_TYPE_SELECTORS:
+                    yield {"status": "warning", "message": f"      Warning: No specific selectors for '{page_type}'. Using DEFAULT."}
+                    results["steps"].append({"step": "Page Type Detection", "status": "Warning", "message": f"No selectors for '{page_type}', using DEFAULT"})
+                else:
+                    results["steps"].append({"step": "Page Type Detection", "status": "Success", "detected_type": page_type})
+
+
+                yield {"status": "progress", "message": "    Analyzing click events..."}
+                click_analysis_results = []
+                if not elements_to_test_for_this_page:
+                    yield {"status": "progress", "message": f"      No elements configured for click testing on page type: '{page_type or 'Unknown/Default'}'"}
+                else:
+                    yield {"status": "progress", "message": f"      Found {len(elements_to_test_for_this_page)} elements to test for '{page_type or 'Unknown/Default'}'"}
+                    # --- Click Loop ---
+                    for i, element_config in enumerate(elements_to_test_for_this_page):
+                        description = element_config["description"]
+                        config_type = element_config.get("type", "click") # Default to "click" if type is missing
+                        click_result = {"elementDescription": description, "type": config_type} # Store type in results
+
+                        yield {"status": "progress", "message": f"\n      ▶️ Testing Interaction {i+1}/{len(elements_to_test_for_this_page)}: '{description}' ({config_type})"}
+
+                        if config_type == "sequence":
+                            click_result["sequenceSteps"] = []
+                            sequence_success = True
+                            sequence_error = None
+
+                            yield {"status": "progress", "message": "        Clearing tracking data before sequence..."}
+                            await clear_tracking_data(page) # Clear before starting the sequence
+
+                            for step_index, step in enumerate(element_config.get("steps", [])):
+                                step_action = step.get("action")
+                                step_selector = step.get("selector")
+                                step_desc = step.get("description", f"Step {step_index + 1}")
+                                step_check_visibility = step.get("check_visibility_after_previous", False)
+                                step_result = {
+                                    "action": step_action,
+                                    "description": step_desc,
+                                    "selector": step_selector,
+                                    "status": "Pending",
+                                    "checked_visibility": False # Add field to track if visibility check was done
+                                }
+                                click_result["sequenceSteps"].append(step_result)
+
+                                yield {"status": "progress", "message": f"        Executing Step {step_index + 1}/{len(element_config['steps'])}: {step_action.upper()} - '{step_desc}'"}
 
-                                            step_click_error_msg = None
-                                            try:
-                                                await element.click(timeout=step.get("timeout", 15000))
-                                            except PlaywrightError as pe:
-                                                if "intercept" in str(pe).lower():
-                                                    yield {"status": "warning", "message": "          Click intercepted, trying force=True..."}
-                                                    await dismiss_overlays(page) # Try dismissing again
-                                                    try:
-                                                        await element.click(timeout=step.get("timeout", 10000), force=True)
-                                                    except Exception as force_e:
-                                                        step_click_error_msg = f"Forced click failed: {force_e}"
-                                                else:
-                                                    step_click_error_msg = f"Click failed (PlaywrightError): {pe}"
-                                            except Exception as e:
-                                                step_click_error_msg = f"Click failed (General Exception): {e}"
-
-                                            if step_click_error_msg:
-                                                raise Exception(step_click_error_msg) # Propagate click error to fail the step
+                                try:
+                                    element = page.locator(step_selector).first if step_selector else None
+                                    if not element and step_action in ["click", "waitFor"]: # Require element for these actions
+                                         raise ValueError(f"Selector missing for required action '{step_action}'")
+
+                                    # --- Visibility Check (if flagged) ---
+                                    if step_check_visibility:
+                                        step_result["checked_visibility"] = True
+                                        trigger_desc = click_result["sequenceSteps"][step_index - 1]["description"] if step_index > 0 else "Start of Sequence"
+                                        yield {"status": "progress", "message": f"          Triggered by: '{trigger_desc}'"}
+                                        yield {"status": "progress", "message": f"          Checking interactability for target: '{step_desc}' ({step_selector})"}
+                                        try:
+                                            # Use is_visible with a reasonable timeout for the check itself
+                                            await element.wait_for(state='visible', timeout=step.get("visibility_check_timeout", 5000))
+                                            # Optionally, add is_enabled() check if needed for buttons
+                                            # is_enabled = await element.is_enabled(timeout=1000)
+                                            # if not is_enabled:
+                                            #     raise Exception("Target element is visible but not enabled.")
+
+                                            yield {"status": "progress", "message": f"          ✅ Target '{step_desc}' is visible."}
+                                            step_result["visibility_status"] = "Visible"
+                                        except PlaywrightTimeoutError as vis_error:
+                                            yield {"status": "error", "message": f"          ❌ Target '{step_desc}' did NOT become visible/interactable within timeout."}
+                                            step_result["visibility_status"] = "Timeout"
+                                            raise Exception(f"Target element for '{step_desc}' failed visibility check after trigger. Error: {vis_error}") # Fail the step
+                                        except Exception as vis_error:
+                                            yield {"status": "error", "message": f"          ❌ Error checking visibility for '{step_desc}': {vis_error}"}
+                                            step_result["visibility_status"] = "Error"
+                                            raise # Re-raise to fail the step
+
+                                    # --- Perform Main Step Action ---
+                                    await dismiss_overlays(page) # Dismiss overlays before each action
+
+                                    if step_action == "click":
+                                        if not element: continue # Should have been caught above, but safety check
+                                        yield {"status": "progress", "message": f"          Waiting for element ('{step_selector}') to be visible for click..."}
+                                        await element.wait_for(state='visible', timeout=step.get("timeout", 15000))
+                                        yield {"status": "progress", "message": "          Element is visible."}
+                                        try:
+                                            await element.scroll_into_view_if_needed(timeout=7000)
+                                        except Exception as scroll_e:
+                                            yield {"status": "warning", "message": f"          Warning: Could not scroll element into view ({scroll_e}). Continuing attempt."}
+                                        await page.wait_for_timeout(300)
+
+                                        step_click_error_msg = None
+                                        try:
+                                            await element.click(timeout=step.get("timeout", 15000))
+                                        except PlaywrightError as pe:
+                                            if "intercept" in str(pe).lower():
+                                                yield {"status": "warning", "message": "          Click intercepted, trying force=True..."}
+                                                await dismiss_overlays(page) # Try dismissing again
+                                                try:
+                                                    await element.click(timeout=step.get("timeout", 10000), force=True)
+                                                except Exception as force_e:
+                                                    step_click_error_msg = f"Forced click failed: {force_e}"
                                             else:
-                                                yield {"status": "progress", "message": "          ✅ Click initiated successfully."}
-                                                step_result["status"] = "Success"
-
+                                                step_click_error_msg = f"Click failed (PlaywrightError): {pe}"
+                                        except Exception as e:
+                                            step_click_error_msg = f"Click failed (General Exception): {e}"
 
-                                        elif step_action == "waitFor":
-                                            if not element: continue # Should have been caught above
-                                            state_to_wait = step.get("state", "visible") # Default to visible
-                                            timeout_ms = step.get("timeout", 15000) # Default wait time
-                                            yield {"status": "progress", "message": f"          Waiting for element ('{step_selector}') state: '{state_to_wait}' (timeout: {timeout_ms}ms)..."}
-                                            await element.wait_for(state=state_to_wait, timeout=timeout_ms)
-                                            yield {"status": "progress", "message": f"          ✅ Element reached state '{state_to_wait}'."}
+                                        if step_click_error_msg:
+                                            raise Exception(step_click_error_msg) # Propagate click error to fail the step
+                                        else:
+                                            yield {"status": "progress", "message": "          ✅ Click initiated successfully."}
                                             step_result["status"] = "Success"
 
-                                        elif step_action == "waitTimeout":
-                                            timeout_ms = step.get("timeout", 1000) # Default wait time
-                                            yield {"status": "progress", "message": f"          Waiting for fixed timeout: {timeout_ms}ms..."}
-                                            await page.wait_for_timeout(timeout_ms)
-                                            yield {"status": "progress", "message": f"          ✅ Timeout finished."}
-                                            step_result["status"] = "Success"
 
-                                        # Add more actions (e.g., fill, type) here if needed
+                                    elif step_action == "waitFor":
+                                        if not element: continue # Should have been caught above
+                                        state_to_wait = step.get("state", "visible") # Default to visible
+                                        timeout_ms = step.get("timeout", 15000) # Default wait time
+                                        yield {"status": "progress", "message": f"          Waiting for element ('{step_selector}') state: '{state_to_wait}' (timeout: {timeout_ms}ms)..."}
+                                        await element.wait_for(state=state_to_wait, timeout=timeout_ms)
+                                        yield {"status": "progress", "message": f"          ✅ Element reached state '{state_to_wait}'."}
+                                        step_result["status"] = "Success"
 
-                                        else:
-                                            raise ValueError(f"Unsupported sequence action: {step_action}")
-
-                                        step_result["status"] = "Success" # Mark step as success if action didn't raise error
-                                        await page.wait_for_timeout(200) # Small pause after each successful step
-
-                                    except Exception as step_e:
-                                        error_msg = f"        ❌ Sequence Step Failed: {step_e}"
-                                        yield {"status": "error", "message": error_msg}
-                                        step_result["status"] = "Failure"
-                                        step_result["error"] = str(step_e)
-                                        sequence_success = False
-                                        sequence_error = str(step_e)
-                                        traceback.print_exc() # Log full traceback for step failure
-                                        break # Stop sequence execution on failure
-
-                                # --- After sequence loop ---
-                                if sequence_success:
-                                     click_result["sequenceStatus"] = "Success"
-                                     yield {"status": "progress", "message": f"        ✅ Sequence '{description}' completed successfully."}
-                                     yield {"status": "progress", "message": f"        Waiting {POST_CLICK_WAIT_MS / 1000}s for events after sequence..."}
-                                     await page.wait_for_timeout(POST_CLICK_WAIT_MS)
-                                     yield {"status": "progress", "message": "        Retrieving data after sequence..."}
-                                     click_result["tealium_events"] = await get_data_from_page(page, "tealiumSpecificEvents")
-                                     click_result["general_events"] = await get_data_from_page(page, "generalTrackingEvents")
-                                     if isinstance(click_result["general_events"], dict) and "network" in click_result["general_events"]:
-                                         network_data = click_result["general_events"]["network"]
-                                         if isinstance(network_data, list):
-                                             click_result["vendors_in_network"] = find_vendors_in_requests(network_data)
-                                         else:
-                                             click_result["vendors_in_network"] = {"error": "Network data is not a list"}
-                                     else:
-                                         click_result["vendors_in_network"] = {"error": "General events or network data missing/invalid"}
-                                else:
-                                     click_result["sequenceStatus"] = "Failure"
-                                     click_result["sequenceError"] = sequence_error
-                                     yield {"status": "error", "message": f"        ❌ Sequence '{description}' failed."}
-                                     # Data might still be partially useful, try retrieving anyway
-                                     yield {"status": "progress", "message": "        Retrieving any available data after failed sequence..."}
-                                     try:
-                                         click_result["tealium_events"] = await get_data_from_page(page, "tealiumSpecificEvents")
-                                         click_result["general_events"] = await get_data_from_page(page, "generalTrackingEvents")
-                                         if isinstance(click_result["general_events"], dict) and "network" in click_result["general_events"]:
-                                            network_data = click_result["general_events"]["network"]
-                                            if isinstance(network_data, list):
-                                                click_result["vendors_in_network"] = find_vendors_in_requests(network_data)
-                                            else:
-                                                click_result["vendors_in_network"] = {"error": "Network data is not a list"}
-                                         else:
-                                              click_result["vendors_in_network"] = {"error": "General events or network data missing/invalid"}
-                                     except Exception as post_fail_e:
-                                         yield {"status": "warning", "message": f"        Warning: Error retrieving data after failed sequence: {post_fail_e}"}
-                                         click_result["post_sequence_data_error"] = str(post_fail_e)
+                                    elif step_action == "waitTimeout":
+                                        timeout_ms = step.get("timeout", 1000) # Default wait time
+                                        yield {"status": "progress", "message": f"          Waiting for fixed timeout: {timeout_ms}ms..."}
+                                        await page.wait_for_timeout(timeout_ms)
+                                        yield {"status": "progress", "message": f"          ✅ Timeout finished."}
+                                        step_result["status"] = "Success"
 
+                                    # Add more actions (e.g., fill, type) here if needed
 
-                            elif config_type == "click": # Original click logic
-                                selector = element_config["selector"]
-                                click_result["selector"] = selector # Store selector for click type
-                                try:
-                                    element = page.locator(selector).first
-                                    # Always dismiss overlays first
-                                    yield {"status": "progress", "message": "        Attempting to dismiss overlays before interaction..."}
-                                    await dismiss_overlays(page)
-                                    
-                                    # Optional preAction support (e.g., reveal_prev for slick carousel)
-                                    pre_action = element_config.get("preAction") if isinstance(element_config, dict) else None
-                                    if pre_action is not None:
-                                        pre_name = getattr(pre_action, "__name__", "")
-                                        if pre_name == "reveal_prev" or "slick-prev" in selector:
-                                            try:
-                                                yield {"status": "progress", "message": "        Executing preAction: reveal_prev (clicking next to enable prev)..."}
-                                                next_btn = page.locator("#recommendationCarousel button.slick-next.slick-arrow").first
-                                                # Ensure next is visible/enabled; dismiss any transient overlays
-                                                await next_btn.wait_for(state='visible', timeout=5000)
-                                                await dismiss_overlays(page)
-                                                try:
-                                                    await next_btn.click(timeout=5000)
-                                                except PlaywrightError:
-                                                    # Retry with force if needed
-                                                    await next_btn.click(timeout=5000, force=True)
-                                                # Wait until prev is enabled (aria-disabled=false) or not slick-disabled
-                                                prev_enabled = page.locator("#recommendationCarousel button.slick-prev.slick-arrow:not(.slick-disabled)[aria-disabled='false']").first
-                                                # Try a few steps forward if still disabled
-                                                attempts = 0
-                                                while attempts < 3:
-                                                    try:
-                                                        await prev_enabled.wait_for(state='visible', timeout=1500)
-                                                        break
-                                                    except Exception:
-                                                        attempts += 1
-                                                        await dismiss_overlays(page)
-                                                        try:
-                                                            await next_btn.click(timeout=2000)
-                                                        except Exception:
-                                                            await next_btn.click(timeout=2000, force=True)
-                                                # Final wait for visibility of the target prev element
-                                                await page.locator("#recommendationCarousel button.slick-prev.slick-arrow").first.wait_for(state='visible', timeout=5000)
-                                            except Exception as pre_e:
-                                                yield {"status": "warning", "message": f"        Warning: preAction failed ({pre_e}). Continuing..."}
-                                        else:
-                                            # Placeholder for future preActions
-                                            yield {"status": "progress", "message": f"        Executing preAction: {pre_name or 'custom'}"}
-
-                                    yield {"status": "progress", "message": f"        Waiting for element ('{selector}') to be visible..."}
-                                    await element.wait_for(state='visible', timeout=5000)  # Reduced timeout further
-                                    yield {"status": "progress", "message": "        Element is visible."}
-                                    try:
-                                        await element.scroll_into_view_if_needed(timeout=7000)
-                                    except Exception as scroll_e:
-                                        yield {"status": "warning", "message": f"        Warning: Could not scroll element into view ({scroll_e}). Continuing click attempt."}
-
-                                    await page.wait_for_timeout(300)
-
-                                    yield {"status": "progress", "message": "        Clearing tracking data..."}
-                                    await clear_tracking_data(page)
-
-                                    yield {"status": "progress", "message": "        Attempting click..."}
-                                    click_error_msg = None
-                                    try:
-                                        await element.click(timeout=15000)
-                                    except PlaywrightError as pe:
-                                        if "intercept" in str(pe).lower():
-                                            yield {"status": "warning", "message": "        Click intercepted, trying force=True..."}
-                                            await dismiss_overlays(page)
-                                            try:
-                                                await element.click(timeout=10000, force=True)
-                                            except Exception as force_e:
-                                                click_error_msg = f"Forced click failed: {force_e}"
-                                        else:
-                                            click_error_msg = f"Click failed (PlaywrightError): {pe}"
-                                    except Exception as e:
-                                        click_error_msg = f"Click failed (General Exception): {e}"
-
-                                    if click_error_msg:
-                                        yield {"status": "warning", "message": f"        ❌ Click attempt resulted in error: {click_error_msg}"}
-                                        click_result["clickStatus"] = "Failure"
-                                        click_result["clickError"] = click_error_msg
                                     else:
-                                        yield {"status": "progress", "message": "        ✅ Click initiated successfully."}
-                                        click_result["clickStatus"] = "Success"
-                                        yield {"status": "progress", "message": f"        Waiting {POST_CLICK_WAIT_MS / 1000}s for events..."}
-                                        await page.wait_for_timeout(POST_CLICK_WAIT_MS)
-
-                                    yield {"status": "progress", "message": "        Retrieving data after click attempt..."}
-                                    click_result["tealium_events"] = await get_data_from_page(page, "tealiumSpecificEvents")
-                                    click_result["general_events"] = await get_data_from_page(page, "generalTrackingEvents")
-                                    if isinstance(click_result["general_events"], dict) and "network" in click_result["general_events"]:
+                                        raise ValueError(f"Unsupported sequence action: {step_action}")
+
+                                    step_result["status"] = "Success" # Mark step as success if action didn't raise error
+                                    await page.wait_for_timeout(200) # Small pause after each successful step
+
+                                except Exception as step_e:
+                                    error_msg = f"        ❌ Sequence Step Failed: {step_e}"
+                                    yield {"status": "error", "message": error_msg}
+                                    step_result["status"] = "Failure"
+                                    step_result["error"] = str(step_e)
+                                    sequence_success = False
+                                    sequence_error = str(step_e)
+                                    traceback.print_exc() # Log full traceback for step failure
+                                    break # Stop sequence execution on failure
+
+                            # --- After sequence loop ---
+                            if sequence_success:
+                                 click_result["sequenceStatus"] = "Success"
+                                 yield {"status": "progress", "message": f"        ✅ Sequence '{description}' completed successfully."}
+                                 yield {"status": "progress", "message": f"        Waiting {POST_CLICK_WAIT_MS / 1000}s for events after sequence..."}
+                                 await page.wait_for_timeout(POST_CLICK_WAIT_MS)
+                                 yield {"status": "progress", "message": "        Retrieving data after sequence..."}
+                                 tracking_data = await get_multiple_data_from_page(page, ["tealiumSpecificEvents", "generalTrackingEvents"])
+                                 click_result["tealium_events"] = tracking_data["tealiumSpecificEvents"]
+                                 click_result["general_events"] = tracking_data["generalTrackingEvents"]
+                                 if isinstance(click_result["general_events"], dict) and "network" in click_result["general_events"]:
+                                     network_data = click_result["general_events"]["network"]
+                                     if isinstance(network_data, list):
+                                         click_result["vendors_in_network"] = find_vendors_in_requests(network_data)
+                                     else:
+                                         click_result["vendors_in_network"] = {"error": "Network data is not a list"}
+                                 else:
+                                     click_result["vendors_in_network"] = {"error": "General events or network data missing/invalid"}
+                            else:
+                                 click_result["sequenceStatus"] = "Failure"
+                                 click_result["sequenceError"] = sequence_error
+                                 yield {"status": "error", "message": f"        ❌ Sequence '{description}' failed."}
+                                 # Data might still be partially useful, try retrieving anyway
+                                 yield {"status": "progress", "message": "        Retrieving any available data after failed sequence..."}
+                                 try:
+                                     tracking_data = await get_multiple_data_from_page(page, ["tealiumSpecificEvents", "generalTrackingEvents"])
+                                     click_result["tealium_events"] = tracking_data["tealiumSpecificEvents"]
+                                     click_result["general_events"] = tracking_data["generalTrackingEvents"]
+                                     if isinstance(click_result["general_events"], dict) and "network" in click_result["general_events"]:
                                         network_data = click_result["general_events"]["network"]
                                         if isinstance(network_data, list):
                                             click_result["vendors_in_network"] = find_vendors_in_requests(network_data)
                                         else:
                                             click_result["vendors_in_network"] = {"error": "Network data is not a list"}
+                                     else:
+                                          click_result["vendors_in_network"] = {"error": "General events or network data missing/invalid"}
+                                 except Exception as post_fail_e:
+                                     yield {"status": "warning", "message": f"        Warning: Error retrieving data after failed sequence: {post_fail_e}"}
+                                     click_result["post_sequence_data_error"] = str(post_fail_e)
+
+
+                        elif config_type == "click": # Original click logic
+                            selector = element_config["selector"]
+                            click_result["selector"] = selector # Store selector for click type
+                            try:
+                                element = page.locator(selector).first
+                                # Always dismiss overlays first
+                                yield {"status": "progress", "message": "        Attempting to dismiss overlays before interaction..."}
+                                await dismiss_overlays(page)
+                                
+                                # Optional preAction support (e.g., reveal_prev for slick carousel)
+                                pre_action = element_config.get("preAction") if isinstance(element_config, dict) else None
+                                if pre_action is not None:
+                                    pre_name = getattr(pre_action, "__name__", "")
+                                    if pre_name == "reveal_prev" or "slick-prev" in selector:
+                                        try:
+                                            yield {"status": "progress", "message": "        Executing preAction: reveal_prev (clicking next to enable prev)..."}
+                                            next_btn = page.locator("#recommendationCarousel button.slick-next.slick-arrow").first
+                                            # Ensure next is visible/enabled; dismiss any transient overlays
+                                            await next_btn.wait_for(state='visible', timeout=5000)
+                                            await dismiss_overlays(page)
+                                            try:
+                                                await next_btn.click(timeout=5000)
+                                            except PlaywrightError:
+                                                # Retry with force if needed
+                                                await next_btn.click(timeout=5000, force=True)
+                                            # Wait until prev is enabled (aria-disabled=false) or not slick-disabled
+                                            prev_enabled = page.locator("#recommendationCarousel button.slick-prev.slick-arrow:not(.slick-disabled)[aria-disabled='false']").first
+                                            # Try a few steps forward if still disabled
+                                            attempts = 0
+                                            while attempts < 3:
+                                                try:
+                                                    await prev_enabled.wait_for(state='visible', timeout=1500)
+                                                    break
+                                                except Exception:
+                                                    attempts += 1
+                                                    await dismiss_overlays(page)
+                                                    try:
+                                                        await next_btn.click(timeout=2000)
+                                                    except Exception:
+                                                        await next_btn.click(timeout=2000, force=True)
+                                            # Final wait for visibility of the target prev element
+                                            await page.locator("#recommendationCarousel button.slick-prev.slick-arrow").first.wait_for(state='visible', timeout=5000)
+                                        except Exception as pre_e:
+                                            yield {"status": "warning", "message": f"        Warning: preAction failed ({pre_e}). Continuing..."}
                                     else:
-                                        click_result["vendors_in_network"] = {"error": "General events or network data missing/invalid"}
+                                        # Placeholder for future preActions
+                                        yield {"status": "progress", "message": f"        Executing preAction: {pre_name or 'custom'}"}
 
-                                except PlaywrightTimeoutError as e:
-                                    error_msg = f"        ❌ Timeout error finding/interacting with '{description}': {e}"
-                                    yield {"status": "error", "message": error_msg}
-                                    click_result["clickStatus"] = "Error (Timeout)"
-                                    click_result["clickError"] = str(e)
+                                yield {"status": "progress", "message": f"        Waiting for element ('{selector}') to be visible..."}
+                                await element.wait_for(state='visible', timeout=5000)  # Reduced timeout further
+                                yield {"status": "progress", "message": "        Element is visible."}
+                                try:
+                                    await element.scroll_into_view_if_needed(timeout=7000)
+                                except Exception as scroll_e:
+                                    yield {"status": "warning", "message": f"        Warning: Could not scroll element into view ({scroll_e}). Continuing click attempt."}
+
+                                await page.wait_for_timeout(300)
+
+                                yield {"status": "progress", "message": "        Clearing tracking data..."}
+                                await clear_tracking_data(page)
+
+                                yield {"status": "progress", "message": "        Attempting click..."}
+                                click_error_msg = None
+                                try:
+                                    await element.click(timeout=15000)
+                                except PlaywrightError as pe:
+                                    if "intercept" in str(pe).lower():
+                                        yield {"status": "warning", "message": "        Click intercepted, trying force=True..."}
+                                        await dismiss_overlays(page)
+                                        try:
+                                            await element.click(timeout=10000, force=True)
+                                        except Exception as force_e:
+                                            click_error_msg = f"Forced click failed: {force_e}"
+                                    else:
+                                        click_error_msg = f"Click failed (PlaywrightError): {pe}"
                                 except Exception as e:
-                                    error_msg = f"        ❌ Unexpected error testing '{description}': {e}"
-                                    yield {"status": "error", "message": error_msg}
-                                    click_result["clickStatus"] = "Error (General)"
-                                    click_result["clickError"] = str(e)
-                                    traceback.print_exc()
-                            else:
-                                 yield {"status": "warning", "message": f"        Skipping unsupported interaction type: '{config_type}'"}
-                                 click_result["status"] = "Skipped"
-                                 click_result["reason"] = f"Unsupported type: {config_type}"
+                                    click_error_msg = f"Click failed (General Exception): {e}"
 
-                            click_analysis_results.append(click_result) # Append result regardless of type/status
+                                if click_error_msg:
+                                    yield {"status": "warning", "message": f"        ❌ Click attempt resulted in error: {click_error_msg}"}
+                                    click_result["clickStatus"] = "Failure"
+                                    click_result["clickError"] = click_error_msg
+                                else:
+                                    yield {"status": "progress", "message": "        ✅ Click initiated successfully."}
+                                    click_result["clickStatus"] = "Success"
+                                    yield {"status": "progress", "message": f"        Waiting {POST_CLICK_WAIT_MS / 1000}s for events..."}
+                                    await page.wait_for_timeout(POST_CLICK_WAIT_MS)
+
+                                yield {"status": "progress", "message": "        Retrieving data after click attempt..."}
+                                tracking_data = await get_multiple_data_from_page(page, ["tealiumSpecificEvents", "generalTrackingEvents"])
+                                click_result["tealium_events"] = tracking_data["tealiumSpecificEvents"]
+                                click_result["general_events"] = tracking_data["generalTrackingEvents"]
+                                if isinstance(click_result["general_events"], dict) and "network" in click_result["general_events"]:
+                                    network_data = click_result["general_events"]["network"]
+                                    if isinstance(network_data, list):
+                                        click_result["vendors_in_network"] = find_vendors_in_requests(network_data)
+                                    else:
+                                        click_result["vendors_in_network"] = {"error": "Network data is not a list"}
+                                else:
+                                    click_result["vendors_in_network"] = {"error": "General events or network data missing/invalid"}
+
+                            except PlaywrightTimeoutError as e:
+                                error_msg = f"        ❌ Timeout error finding/interacting with '{description}': {e}"
+                                yield {"status": "error", "message": error_msg}
+                                click_result["clickStatus"] = "Error (Timeout)"
+                                click_result["clickError"] = str(e)
+                            except Exception as e:
+                                error_msg = f"        ❌ Unexpected error testing '{description}': {e}"
+                                yield {"status": "error", "message": error_msg}
+                                click_result["clickStatus"] = "Error (General)"
+                                click_result["clickError"] = str(e)
+                                traceback.print_exc()
+                        else:
+                             yield {"status": "warning", "message": f"        Skipping unsupported interaction type: '{config_type}'"}
+                             click_result["status"] = "Skipped"
+                             click_result["reason"] = f"Unsupported type: {config_type}"
+
+                        click_analysis_results.append(click_result) # Append result regardless of type/status
+
+                    results["clickAnalysis"] = click_analysis_results
+                    results["steps"].append({"step": "Interaction Analysis", "status": "Completed", "interactionsTested": len(elements_to_test_for_this_page)}) # Renamed step
+        else:
+             yield {"status": "error", "message": "Skipping remaining analysis due to navigation failure."}
+             results["error"] = results.get("error", "Navigation failed")
 
-                        results["clickAnalysis"] = click_analysis_results
-                        results["steps"].append({"step": "Interaction Analysis", "status": "Completed", "interactionsTested": len(elements_to_test_for_this_page)}) # Renamed step
-            else:
-                 yield {"status": "error", "message": "Skipping remaining analysis due to navigation failure."}
-                 results["error"] = results.get("error", "Navigation failed")
+        # --- Final step reporting ---
+        if results.get("error") and results.get("steps", [])[-1].get("status") == "Failed":
+             yield {"status": "error", "message": f"❌ Analysis failed. Error: {results['error']}"}
+        else:
+             yield {"status": "progress", "message": f"\n✅ Analysis finished in {time.time() - analysis_start_time:.2f} seconds."}
+             results["steps"].append({"step": "Analysis Completion", "status": "Success"})
 
-            # --- Final step reporting ---
-            if results.get("error") and results.get("steps", [])[-1].get("status") == "Failed":
-                 yield {"status": "error", "message": f"❌ Analysis failed. Error: {results['error']}"}
-            else:
-                 yield {"status": "progress", "message": f"\n✅ Analysis finished in {time.time() - analysis_start_time:.2f} seconds."}
-                 results["steps"].append({"step": "Analysis Completion", "status": "Success"})
-
-
-        except Exception as e:
-            error_msg = f"\n❌ A critical error occurred during analysis setup or execution: {e}"
-            yield {"status": "error", "message": error_msg}
-            results["error"] = str(e)
-            results["steps"].append({"step": "Critical Error", "status": "Failed", "message": str(e)})
-            traceback.print_exc()
-
-        finally:
-            yield {"status": "progress", "message": "    Performing cleanup..."}
-            # --- Cleanup ---
-            if page:
-                try: await page.close()
-                except Exception as e: print(f"      Error closing page: {e}")
-            if context:
-                try: await context.close()
-                except Exception as e: print(f"      Error closing context: {e}")
-            if browser:
-                try: await browser.close()
-                except Exception as e: print(f"      Error closing browser: {e}")
-            yield {"status": "progress", "message": "    Cleanup finished."}
+
+    except Exception as e:
+        error_msg = f"\n❌ A critical error occurred during analysis setup or execution: {e}"
+        yield {"status": "error", "message": error_msg}
+        results["error"] = str(e)
+        results["steps"].append({"step": "Critical Error", "status": "Failed", "message": str(e)})
+        traceback.print_exc()
+
+    finally:
+        yield {"status": "progress", "message": "    Performing cleanup..."}
+        # --- Cleanup ---
+        if page:
+            try: await page.close()
+            except Exception as e: print(f"      Error closing page: {e}")
+        if context:
+            try: await context.close()
+            except Exception as e: print(f"      Error closing context: {e}")
+        # The browser itself is shared across analyses and closed at shutdown
+        yield {"status": "progress", "message": "    Cleanup finished."}
 
     # Yield the final results object at the very end with a 'complete' status
     yield {"status": "complete", "results": results}
@@ -932,8 +1002,8 @@ async def run_main_analysis_terminal():
              # Save results to JSON file without timestamp to overwrite previous analysis
              filename = f"data/tealium_manual_analysis.json"
              try:
-                 with open(filename, 'w', encoding='utf-8') as f:
-                     json.dump(final_results, f, indent=2, default=str) # Use default=str for safety
+                 with open(filename, 'wb') as f:
+                     f.write(orjson.dumps(final_results, default=str, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)) # Use default=str for safety
                  print(f"\nFull analysis results saved to: {filename}")
              except Exception as e:
                  print(f"\nError saving full results to JSON: {e}")
@@ -946,6 +1016,8 @@ async def run_main_analysis_terminal():
     except Exception as e:
         print(f"\nAn unexpected error occurred in main terminal execution: {e}")
         traceback.print_exc()
+    finally:
+        await close_shared_browser()
 
 
 if __name__ == "__main__":
@@ -956,7 +1028,7 @@ if __name__ == "__main__":
     except RuntimeError as e:
          print(f"Asyncio runtime error: {e}")
          if "cannot be called from a running event loop" in str(e):
-               print("Hint: If running in an environment like Jupyter, ensure `nest_asyncio.apply()` is called or use `await run_main_analysis_terminal()` if in an async context.")
+               print("Hint: If running in an environment like Jupyter, use `await run_main_analysis_terminal()` from the existing event loop instead.")
     except PlaywrightError as e:
          print(f"Playwright setup or launch error: {e}")
          print("\n--- Troubleshooting ---")
@@ -973,7 +1045,7 @@ if __name__ == "__main__":
              print("➡️ Please ensure `selectors_config.py` exists in the same directory as `gemini_analyzer.py`.")
          else:
              print(f"Import error: {e}")
-             print("➡️ Check if all required libraries (Playwright, nest_asyncio) are installed.")
+             print("➡️ Check if all required libraries (Playwright) are installed.")
          sys.exit(1)
     except Exception as e:
         print(f"A critical error occurred before the main analysis loop: {e}")
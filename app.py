@@ -1,43 +1,57 @@
 import sys
 import asyncio
-import json
 import logging
 import os
 import re
 import time
 import traceback
+import uuid
 from datetime import datetime
 from pathlib import Path
 from urllib.parse import unquote
 import uvicorn
+import orjson
 import glob
 import shutil
 
 
-# Configure basic logging
+# Configure basic logging; LOG_LEVEL=DEBUG opts in to the per-action debug output
 logging.basicConfig(
-    level=logging.INFO,
+    level=getattr(logging, os.environ.get('LOG_LEVEL', 'INFO').upper(), logging.INFO),
     format='%(levelname)s: %(message)s',
     encoding='utf-8'  # Add UTF-8 encoding to handle emoji characters
 )
+logger = logging.getLogger(__name__)
 
 # Set the Proactor event loop on Windows for subprocess support.
 if sys.platform.startswith('win'):
     asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 from fastapi import FastAPI, Request, Form, HTTPException
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from playwright.async_api import async_playwright
 
 from analyzers import tealium_manual_analyzer
+from analyzers.macro_tealium_analyzer import analyze_macro_tealium_events as run_macro_tealium_analysis
+from core.browser_manager import close_shared_browser
 
 # Default URL
 DEFAULT_URL = "https://www.penguinrandomhouse.com/books/734292/the-very-hungry-caterpillars-peekaboo-easter-by-eric-carle-illustrated-by-eric-carle/9780593750179/"
 
+# Nothing writes timestamped analysis files anymore, so once the legacy ones are
+# gone there is no need to glob the data directory again on every analysis.
+_old_data_cleaned = False
+
 def cleanup_old_data():
     """
     Clean up old screenshots and temporary data files before starting new analysis.
+    Runs once per process; later calls return immediately.
     """
+    global _old_data_cleaned
+    if _old_data_cleaned:
+        return
+    _old_data_cleaned = True
     try:
         # Clean up old log files if they exist
         # This section has been cleaned up after removing browser-use
@@ -51,19 +65,62 @@ def cleanup_old_data():
                 for file_path in old_pattern_files:
                     try:
                         os.remove(file_path)
-                        logging.info(f"Removed old analysis file: {os.path.basename(file_path)}")
+                        logging.info("Removed old analysis file: %s", os.path.basename(file_path))
                     except Exception as e:
-                        logging.warning(f"Could not remove old analysis file {file_path}: {e}")
+                        logging.warning("Could not remove old analysis file %s: %s", file_path, e)
                 
                 if old_pattern_files:
-                    logging.info(f"Cleaned up {len(old_pattern_files)} old analysis file(s)")
+                    logging.info("Cleaned up %s old analysis file(s)", len(old_pattern_files))
         except Exception as e:
-            logging.warning(f"Error cleaning up old analysis files: {e}")
+            logging.warning("Error cleaning up old analysis files: %s", e)
                     
     except Exception as e:
-        logging.error(f"Error during cleanup: {e}")
+        logging.error("Error during cleanup: %s", e)
         # Don't fail the analysis if cleanup fails
 
+def sse_event(payload) -> str:
+    """
+    Format a payload as a server-sent event. Analysis updates can be large, and
+    orjson serializes them several times faster than the stdlib json module.
+    """
+    return f"data: {orjson.dumps(payload, default=str, option=orjson.OPT_NON_STR_KEYS).decode()}\n\n"
+
+# Fixed SSE messages, serialized once at import instead of on every send; the heartbeat
+# goes out every second per idle stream
+SSE_HEARTBEAT = sse_event({'type': 'heartbeat'})
+SSE_SESSION_NOT_FOUND = sse_event({'error': 'Session not found'})
+SSE_PLAYBACK_NOT_FOUND = sse_event({'type': 'error', 'message': 'Playback session not found'})
+SSE_MACRO_NOT_FOUND = sse_event({'error': 'Macro not found'})
+SSE_NO_CLICK_ACTIONS = sse_event({'error': 'No click actions found in macro'})
+
+def write_results_file(filename, results):
+    """
+    Write analysis results to disk. This is blocking file I/O, so the streaming
+    endpoints call it through asyncio.to_thread to keep the event loop free.
+    """
+    with open(filename, 'wb') as f:
+        f.write(orjson.dumps(results, default=str, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+
+# Each analysis drives its own Chromium context; cap how many run at once so a burst
+# of requests queues up instead of oversubscribing the machine. Analyses spend most of
+# their time waiting on the network, so hosts with spare memory can raise the cap with
+# MAX_CONCURRENT_ANALYSES; the default is one per CPU.
+MAX_CONCURRENT_ANALYSES = int(os.environ.get('MAX_CONCURRENT_ANALYSES') or 0) or os.cpu_count() or 4
+analysis_slots = asyncio.Semaphore(MAX_CONCURRENT_ANALYSES)
+
+async def run_bounded_analysis(updates):
+    """
+    Relay updates from an analyzer generator while holding one of the shared analysis slots.
+    """
+    try:
+        if analysis_slots.locked():
+            yield {"status": "progress", "message": "    Waiting for a free analysis slot..."}
+        async with analysis_slots:
+            async for update in updates:
+                yield update
+    finally:
+        await updates.aclose()
+
 # Create FastAPI instance
 app = FastAPI()
 
@@ -72,6 +129,19 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 # Screenshot mounting removed - no longer using browser-use
 
 
+@app.on_event("shutdown")
+async def shutdown_browsers():
+    """Stop the playback workers and close every session's context, then the shared browsers
+    and their Playwright driver."""
+    await recorder_manager.shutdown_playback_workers()
+    await recorder_manager.cleanup_all_sessions()
+    await close_shared_browser()
+
+@app.on_event("shutdown")
+async def flush_macro_index():
+    """Write any macro index changes still waiting on the batched flush."""
+    recorder_manager.storage.flush_index()
+
 # Configure templates
 templates = Jinja2Templates(directory="templates")
 
@@ -96,10 +166,10 @@ async def stream(request: Request, url: str = DEFAULT_URL):
         final_results = None # Variable to store the final results
         try:
             # Clean up old data before starting new analysis
-            cleanup_old_data()
+            await asyncio.to_thread(cleanup_old_data)
             print(f"Streaming analysis for: {url}")
-            async for update in tealium_manual_analyzer.analyze_page_tags_and_events(url):
-                yield f"data: {json.dumps(update)}\n\n"
+            async for update in run_bounded_analysis(tealium_manual_analyzer.analyze_page_tags_and_events(url)):
+                yield sse_event(update)
                 # Store the results if the update indicates completion
                 if update.get("status") == "complete" and "results" in update:
                     final_results = update["results"]
@@ -111,8 +181,7 @@ async def stream(request: Request, url: str = DEFAULT_URL):
                 # Create filename without timestamp to overwrite previous analysis
                 filename = f"data/tealium_manual_analysis.json"
                 try:
-                    with open(filename, 'w', encoding='utf-8') as f:
-                        json.dump(final_results, f, indent=2, default=str)
+                    await asyncio.to_thread(write_results_file, filename, final_results)
                     print(f"Analysis results saved locally to: {filename}")
                 except Exception as save_e:
                     print(f"Error saving analysis results locally: {save_e}")
@@ -129,7 +198,7 @@ async def stream(request: Request, url: str = DEFAULT_URL):
                 "message": f"An error occurred on the server during analysis: {str(e)}"
             }
             try:
-                yield f"data: {json.dumps(error_payload)}\n\n"
+                yield sse_event(error_payload)
             except Exception as yield_e:
                 print(f"Error yielding final error message: {yield_e}")
 
@@ -144,19 +213,28 @@ async def show_record_page(request: Request):
 
 
 # Import macro recording functionality
-from core.macro_recorder import recorder_manager
+from core.macro_recorder import recorder_manager, Macro
+
+# Set once a browser launch has succeeded; later checks reuse the result
+# instead of starting a Playwright driver and Chromium on every recording start.
+_browser_verified = False
 
 # API endpoints for macro recording
 @app.get("/api/record/check-browser")
 async def check_browser_availability():
     """Check if Playwright browser is available"""
+    global _browser_verified
+    if _browser_verified:
+        return {
+            "success": True,
+            "message": "Browser is available and working"
+        }
     try:
-        from playwright.async_api import async_playwright
-        
-        playwright = await async_playwright().start()
-        browser = await playwright.chromium.launch(headless=True)
-        await browser.close()
+        async with async_playwright() as playwright:
+            browser = await playwright.chromium.launch(headless=True)
+            await browser.close()
         
+        _browser_verified = True
         return {
             "success": True,
             "message": "Browser is available and working"
@@ -203,7 +281,6 @@ async def start_recording_session(request: Request):
             }
             
     except Exception as e:
-        import traceback
         return {"success": False, "error": str(e), "traceback": traceback.format_exc()}
 
 @app.get("/api/record/stream/{session_id}")
@@ -212,17 +289,21 @@ async def stream_recorded_actions(session_id: str):
     async def event_generator():
         session = recorder_manager.get_session(session_id)
         if not session:
-            yield f"data: {json.dumps({'error': 'Session not found'})}\n\n"
+            yield SSE_SESSION_NOT_FOUND
             return
         
-        # Create a queue to collect actions
-        action_queue = asyncio.Queue()
-        
-        async def action_listener(action):
-            await action_queue.put(action)
+        def action_event(action):
+            return sse_event({
+                "type": action.action_type,
+                "selector": action.selector,
+                "text": action.text,
+                "coordinates": action.coordinates,
+                "timestamp": action.timestamp,
+                "description": action.description
+            })
         
-        # Add listener to session
-        session.add_action_listener(action_listener)
+        # The session pushes recorded actions into this queue
+        action_queue = session.add_action_listener()
         
         try:
             # Keep connection alive and stream actions
@@ -230,22 +311,18 @@ async def stream_recorded_actions(session_id: str):
                 try:
                     # Wait for an action with timeout
                     action = await asyncio.wait_for(action_queue.get(), timeout=1.0)
-                    action_data = {
-                        "type": action.action_type,
-                        "selector": action.selector,
-                        "text": action.text,
-                        "coordinates": action.coordinates,
-                        "timestamp": action.timestamp,
-                        "description": action.description
-                    }
-                    yield f"data: {json.dumps(action_data)}\n\n"
+                    # Drain anything else queued meanwhile so a burst goes out as one chunk
+                    chunk = [action_event(action)]
+                    while not action_queue.empty():
+                        chunk.append(action_event(action_queue.get_nowait()))
+                    yield "".join(chunk)
                 except asyncio.TimeoutError:
                     # Send heartbeat to keep connection alive
-                    yield f"data: {json.dumps({'type': 'heartbeat'})}\n\n"
+                    yield SSE_HEARTBEAT
                     
         finally:
             # Remove listener when connection closes
-            session.remove_action_listener(action_listener)
+            session.remove_action_listener(action_queue)
     
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
@@ -297,18 +374,30 @@ async def force_stop_recording(session_id: str):
 
 # Interactive Browser Viewport API Endpoints
 @app.get("/api/browser/{session_id}/screenshot")
-async def get_browser_screenshot(session_id: str):
-    """Get current browser screenshot for interactive viewport"""
+async def get_browser_screenshot(session_id: str, since: int = 0):
+    """
+    Get current browser screenshot for interactive viewport.
+    Pass the last seen `seq` as `since`; if the frame hasn't changed the image is omitted.
+    """
     try:
         session = recorder_manager.get_session(session_id)
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
         
-        screenshot = await session.get_screenshot()
+        screenshot = await session.get_screenshot_b64()
         if screenshot:
+            # Idle pages repaint identical frames; don't resend them
+            if since and since == session.screenshot_seq:
+                return {
+                    "success": True,
+                    "unchanged": True,
+                    "seq": session.screenshot_seq,
+                    "timestamp": time.time()
+                }
             return {
                 "success": True,
                 "screenshot": f"data:image/jpeg;base64,{screenshot}",
+                "seq": session.screenshot_seq,
                 "timestamp": time.time()
             }
         else:
@@ -318,9 +407,28 @@ async def get_browser_screenshot(session_id: str):
             }
             
     except Exception as e:
-        logger.error(f"Screenshot API error: {e}")
+        logger.error("Screenshot API error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/browser/{session_id}/frame")
+async def get_browser_frame(session_id: str, since: int = 0):
+    """
+    Get the current viewport frame as raw JPEG bytes (no base64/JSON wrapping).
+    Returns 204 if the frame hasn't changed since `since`; the frame seq is in X-Frame-Seq.
+    """
+    session = recorder_manager.get_session(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    screenshot = await session.get_screenshot()
+    if not screenshot:
+        raise HTTPException(status_code=503, detail="Screenshot capture failed")
+    
+    headers = {"X-Frame-Seq": str(session.screenshot_seq), "Cache-Control": "no-store"}
+    if since and since == session.screenshot_seq:
+        return Response(status_code=204, headers=headers)
+    return Response(content=screenshot, media_type="image/jpeg", headers=headers)
+
 @app.post("/api/browser/{session_id}/click")
 async def handle_browser_click(session_id: str, request: Request):
     """Handle click interaction from interactive viewport"""
@@ -335,8 +443,8 @@ async def handle_browser_click(session_id: str, request: Request):
         
         result = await session.handle_viewport_click(x, y)
         
-        # Get updated Tealium state
-        tealium_state = await session.capture_tealium_state()
+        # Tealium state captured right after the click (absent if the click failed)
+        tealium_state = result.get("tealium_state") or {}
         
         return {
             "success": result.get("success", False),
@@ -346,7 +454,7 @@ async def handle_browser_click(session_id: str, request: Request):
         }
         
     except Exception as e:
-        logger.error(f"Click API error: {e}")
+        logger.error("Click API error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/browser/{session_id}/type")
@@ -364,7 +472,7 @@ async def handle_browser_type(session_id: str, request: Request):
         return result
         
     except Exception as e:
-        logger.error(f"Type API error: {e}")
+        logger.error("Type API error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/browser/{session_id}/key")
@@ -382,7 +490,7 @@ async def handle_browser_key(session_id: str, request: Request):
         return result
         
     except Exception as e:
-        logger.error(f"Key API error: {e}")
+        logger.error("Key API error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/browser/{session_id}/scroll")
@@ -400,12 +508,16 @@ async def handle_browser_scroll(session_id: str, request: Request):
         return result
         
     except Exception as e:
-        logger.error(f"Scroll API error: {e}")
+        logger.error("Scroll API error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/browser/{session_id}/tealium-events")
-async def get_tealium_events(session_id: str):
-    """Get captured Tealium events from interactive session"""
+async def get_tealium_events(session_id: str, events_since: int = 0, beacons_since: int = 0):
+    """
+    Get captured Tealium events from interactive session.
+    The viewport polls this every second, so it passes how many events and beacons it
+    already has and only the newer entries are sent back.
+    """
     try:
         session = recorder_manager.get_session(session_id)
         if not session:
@@ -415,13 +527,15 @@ async def get_tealium_events(session_id: str):
         
         return {
             "success": True,
-            "events": session.tealium_events,
-            "network_beacons": session.network_beacons,
+            "events": session.tealium_events[max(events_since, 0):],
+            "network_beacons": session.network_beacons[max(beacons_since, 0):],
+            "events_total": len(session.tealium_events),
+            "beacons_total": len(session.network_beacons),
             "current_state": tealium_state
         }
         
     except Exception as e:
-        logger.error(f"Tealium events API error: {e}")
+        logger.error("Tealium events API error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/browser/{session_id}/viewport-size")
@@ -440,7 +554,7 @@ async def get_viewport_size(session_id: str):
         return {"success": True, "viewport": viewport}
         
     except Exception as e:
-        logger.error(f"Viewport size API error: {e}")
+        logger.error("Viewport size API error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/browser/{session_id}/viewport-size")
@@ -460,17 +574,18 @@ async def set_viewport_size(session_id: str, request: Request):
         return {"success": True, "viewport": {"width": width, "height": height}}
         
     except Exception as e:
-        logger.error(f"Viewport size API error: {e}")
+        logger.error("Viewport size API error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/macros/list")
 async def list_saved_macros():
     """Get a list of all saved macros"""
     try:
-        macros = recorder_manager.storage.list_macros()
+        # Reads macro files on a cold cache; keep that off the event loop
+        macros = await asyncio.to_thread(recorder_manager.storage.list_macros)
         return {
             "success": True,
-            "macros": [macro.to_dict() for macro in macros]
+            "macros": [macro.to_summary() for macro in macros]
         }
     except Exception as e:
         return {"success": False, "error": str(e), "macros": []}
@@ -536,10 +651,6 @@ async def import_macro(request: Request):
         if not macro_data:
             return {"success": False, "error": "No macro data provided"}
         
-        # Import the macro
-        from core.macro_recorder import Macro
-        import uuid
-        
         # Generate new ID for imported macro
         macro_data["id"] = str(uuid.uuid4())
         macro_data["created_at"] = datetime.now().isoformat()
@@ -586,14 +697,15 @@ async def stream_macro_playback(playback_id: str):
     async def event_generator():
         playback = recorder_manager.get_playback(playback_id)
         if not playback:
-            yield f"data: {json.dumps({'type': 'error', 'message': 'Playback session not found'})}\n\n"
+            yield SSE_PLAYBACK_NOT_FOUND
             return
         
         # Create a queue to collect playback events
         event_queue = asyncio.Queue()
         
-        async def playback_listener(data):
-            await event_queue.put(data)
+        async def playback_listener(events):
+            for event in events:
+                event_queue.put_nowait(event)
         
         # Add listener to playback session
         playback.add_playback_listener(playback_listener)
@@ -604,7 +716,13 @@ async def stream_macro_playback(playback_id: str):
                 try:
                     # Wait for an event with timeout
                     event = await asyncio.wait_for(event_queue.get(), timeout=1.0)
-                    yield f"data: {json.dumps(event)}\n\n"
+                    # Drain anything else queued meanwhile so a burst goes out as one chunk,
+                    # stopping at the event that ends the playback
+                    chunk = [sse_event(event)]
+                    while event.get('type') not in ['complete', 'error'] and not event_queue.empty():
+                        event = event_queue.get_nowait()
+                        chunk.append(sse_event(event))
+                    yield "".join(chunk)
                     
                     # Check if playback completed
                     if event.get('type') in ['complete', 'error']:
@@ -612,7 +730,7 @@ async def stream_macro_playback(playback_id: str):
                         
                 except asyncio.TimeoutError:
                     # Send heartbeat to keep connection alive
-                    yield f"data: {json.dumps({'type': 'heartbeat'})}\n\n"
+                    yield SSE_HEARTBEAT
                     
         finally:
             # Remove listener when connection closes
@@ -638,8 +756,11 @@ async def stop_macro_playback(playback_id: str):
 async def play_macro_with_analysis(macro_id: str):
     """Start macro playback with integrated tag analysis"""
     try:
-        # Start the playback session
-        success, playback_id, message = await recorder_manager.start_playback_session(macro_id)
+        # Start the playback session; analysis integration is set up once its page is loaded
+        # and monitors the playback page for tag events during macro execution
+        success, playback_id, message = await recorder_manager.start_playback_session(
+            macro_id, on_ready=setup_playback_analysis_integration
+        )
         
         if not success:
             return {"success": False, "error": message}
@@ -649,10 +770,6 @@ async def play_macro_with_analysis(macro_id: str):
         if not playback:
             return {"success": False, "error": "Failed to get playback session"}
         
-        # Set up analysis integration
-        # This will monitor the playback page for tag events during macro execution
-        await setup_playback_analysis_integration(playback)
-        
         return {
             "success": True,
             "playback_id": playback_id,
@@ -763,11 +880,11 @@ async def setup_playback_analysis_integration(playback_session):
         def handle_analysis_console(msg):
             if "MACRO_ANALYSIS_EVENT:" in msg.text:
                 try:
-                    event_data = json.loads(msg.text.replace("MACRO_ANALYSIS_EVENT:", ""))
+                    event_data = orjson.loads(msg.text.replace("MACRO_ANALYSIS_EVENT:", ""))
                     analysis_events.append(event_data)
-                    logging.info(f"Captured analysis event during macro playback: {event_data['type']}")
+                    logging.info("Captured analysis event during macro playback: %s", event_data['type'])
                 except Exception as e:
-                    logging.error(f"Error parsing analysis event: {e}")
+                    logging.error("Error parsing analysis event: %s", e)
         
         playback_session.page.on("console", handle_analysis_console)
         
@@ -777,7 +894,7 @@ async def setup_playback_analysis_integration(playback_session):
         logging.info("Analysis integration set up for macro playback")
         
     except Exception as e:
-        logging.error(f"Failed to set up playback analysis integration: {e}")
+        logging.error("Failed to set up playback analysis integration: %s", e)
 
 @app.get("/api/macros/playback/{playback_id}/analysis")
 async def get_playback_analysis_results(playback_id: str):
@@ -877,7 +994,7 @@ async def stream_macro_tealium_analysis(macro_id: str):
         try:
             macro = recorder_manager.storage.load_macro(macro_id)
             if not macro:
-                yield f"data: {json.dumps({'error': 'Macro not found'})}\n\n"
+                yield SSE_MACRO_NOT_FOUND
                 return
             
             # Extract click selectors from macro actions  
@@ -892,18 +1009,15 @@ async def stream_macro_tealium_analysis(macro_id: str):
                     })
             
             if not macro_selectors:
-                yield f"data: {json.dumps({'error': 'No click actions found in macro'})}\n\n"
+                yield SSE_NO_CLICK_ACTIONS
                 return
 
             # Server-side debug logging so progress is visible in terminal
-            logging.info(f"[MacroAnalysis] Starting stream for macro '{macro.name}' ({macro.id}) on URL: {macro.url}")
-            logging.info(f"[MacroAnalysis] Click actions to test: {len(macro_selectors)}")
-            
-            # Import the macro analyzer
-            from analyzers.macro_tealium_analyzer import analyze_macro_tealium_events
+            logging.info("[MacroAnalysis] Starting stream for macro '%s' (%s) on URL: %s", macro.name, macro.id, macro.url)
+            logging.info("[MacroAnalysis] Click actions to test: %s", len(macro_selectors))
             
             # Stream the analysis
-            async for update in analyze_macro_tealium_events(macro.url, macro_selectors, macro.name):
+            async for update in run_bounded_analysis(run_macro_tealium_analysis(macro.url, macro_selectors, macro.name)):
                 try:
                     status = update.get('status')
                     message = update.get('message') or ''
@@ -923,17 +1037,17 @@ async def stream_macro_tealium_analysis(macro_id: str):
                         )
                     elif status == 'testing_selector':
                         sel_desc = update.get('selector_description') or ''
-                        logging.info(f"[MacroAnalysis] Testing selector: {sel_desc}")
+                        logging.info("[MacroAnalysis] Testing selector: %s", sel_desc)
                     elif status == 'error':
-                        logging.error(f"[MacroAnalysis] Error: {message}")
+                        logging.error("[MacroAnalysis] Error: %s", message)
                     elif status == 'complete':
                         logging.info("[MacroAnalysis] Analysis complete")
                     elif status:
-                        logging.info(f"[MacroAnalysis] {status}: {message}")
+                        logging.info("[MacroAnalysis] %s: %s", status, message)
                 except Exception:
                     # Never break streaming on logging failure
                     pass
-                yield f"data: {json.dumps(update)}\n\n"
+                yield sse_event(update)
                 
         except Exception as e:
             error_payload = {
@@ -941,16 +1055,15 @@ async def stream_macro_tealium_analysis(macro_id: str):
                 "message": f"Analysis failed: {str(e)}",
                 "error": str(e)
             }
-            yield f"data: {json.dumps(error_payload)}\n\n"
+            yield sse_event(error_payload)
         finally:
             try:
                 if final_results and not final_results.get('error'):
                     out_path = Path('data') / 'macro_tealium_analysis.json'
-                    with open(out_path, 'w', encoding='utf-8') as f:
-                        json.dump(final_results, f, indent=2, default=str)
-                    logging.info(f"Saved macro analysis results to {out_path}")
+                    await asyncio.to_thread(write_results_file, out_path, final_results)
+                    logging.info("Saved macro analysis results to %s", out_path)
             except Exception as save_e:
-                logging.warning(f"Failed to save macro analysis results: {save_e}")
+                logging.warning("Failed to save macro analysis results: %s", save_e)
     
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
@@ -3,6 +3,7 @@ Core business logic modules for WebSpark.
 
 This package contains the core functionality for:
 - Macro recording and playback (macro_recorder)
+- Shared Playwright driver, browser and page helpers (browser_manager)
 - Selector configuration and management (selectors_config)
 """
 
@@ -17,6 +18,14 @@ from .macro_recorder import (
     recorder_manager
 )
 
+from .browser_manager import (
+    get_playwright,
+    get_shared_browser,
+    close_shared_browser,
+    dismiss_cookie_overlays,
+    consent_scoped
+)
+
 from .selectors_config import (
     PAGE_TYPE_SELECTORS,
     USE_AGENT_SELECTORS,
@@ -32,6 +41,12 @@ __all__ = [
     'MacroRecorderManager',
     'PlaybackSession',
     'recorder_manager',
+    # Shared browser
+    'get_playwright',
+    'get_shared_browser',
+    'close_shared_browser',
+    'dismiss_cookie_overlays',
+    'consent_scoped',
     # Selector configuration
     'PAGE_TYPE_SELECTORS',
     'USE_AGENT_SELECTORS', 
@@ -0,0 +1,136 @@
+"""
+browser_manager.py
+
+Process-wide Playwright driver and shared headless Chromium.
+Starting the driver and launching Chromium dominate the cost of a short analysis or
+recording, so they are done once per process (one browser per distinct set of launch
+args) and each caller works in its own BrowserContext.
+"""
+
+import asyncio
+import logging
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from playwright.async_api import async_playwright, Playwright, Browser, Page
+
+logger = logging.getLogger(__name__)
+
+_playwright: Optional[Playwright] = None
+_shared_browsers: Dict[Tuple[str, ...], Browser] = {}
+_lock: Optional[asyncio.Lock] = None
+
+
+def _get_lock() -> asyncio.Lock:
+    """Create the lock lazily so it belongs to the running event loop."""
+    global _lock
+    if _lock is None:
+        _lock = asyncio.Lock()
+    return _lock
+
+
+async def _ensure_playwright() -> Playwright:
+    """Start the Playwright driver if needed. Caller must hold the lock."""
+    global _playwright
+    if _playwright is None:
+        _playwright = await async_playwright().start()
+    return _playwright
+
+
+async def get_playwright() -> Playwright:
+    """Return the process-wide Playwright driver, starting it on first use."""
+    async with _get_lock():
+        return await _ensure_playwright()
+
+
+async def get_shared_browser(args: Optional[List[str]] = None) -> Browser:
+    """
+    Return the shared headless Chromium for these launch args, launching it on first use or
+    if it has crashed. Callers must create their own context and close only that context when done.
+    """
+    key = tuple(args or ())
+    async with _get_lock():
+        browser = _shared_browsers.get(key)
+        if browser is None or not browser.is_connected():
+            playwright = await _ensure_playwright()
+            browser = await playwright.chromium.launch(headless=True, args=list(key))
+            _shared_browsers[key] = browser
+            logger.info("Launched shared headless browser (%d running)", len(_shared_browsers))
+        return browser
+
+
+async def close_shared_browser():
+    """Close the shared browsers and stop the Playwright driver (application shutdown)."""
+    global _playwright
+    async with _get_lock():
+        for browser in _shared_browsers.values():
+            try:
+                await browser.close()
+            except Exception as e:
+                logger.warning("Error closing shared browser: %s", e)
+        _shared_browsers.clear()
+        if _playwright is not None:
+            try:
+                await _playwright.stop()
+            except Exception as e:
+                logger.warning("Error stopping Playwright driver: %s", e)
+            _playwright = None
+
+
+# Containers that only hold consent/cookie UI. Generic buttons ("OK", "Close", a close
+# icon) are only safe to click inside one of these; elsewhere they hit ordinary page UI.
+CONSENT_CONTAINERS = (
+    '[id^="onetrust"]',
+    '[id*="cookie"]', '[class*="cookie"]',
+    '[id*="consent"]', '[class*="consent"]',
+    '[class*="gdpr"]',
+)
+
+
+def consent_scoped(selectors: Sequence[str]) -> tuple:
+    """Restrict each selector to matches inside a consent container, container order first."""
+    return tuple(f'{container} {selector}' for container in CONSENT_CONTAINERS for selector in selectors)
+
+
+@lru_cache(maxsize=None)
+def _selector_union(selectors: Sequence[str]) -> str:
+    """Join a (constant, hashable) selector tuple into one comma-separated selector list."""
+    return ", ".join(selectors)
+
+
+async def dismiss_cookie_overlays(page: Page, selectors: Sequence[str], appear_wait_ms: int = 1000) -> Optional[str]:
+    """
+    Click the first visible cookie/overlay button matching one of the selectors, then press Escape
+    for any remaining modal. Selectors are tried in order and only one overlay is dismissed to avoid
+    conflicts. Returns the selector that was clicked, or None.
+    """
+    dismissed = None
+    try:
+        # Wait a bit for any overlays to appear
+        await page.wait_for_timeout(appear_wait_ms)
+
+        # One query over the union of all selectors; most pages have no banner, and then the
+        # per-selector probes (one round-trip each) are skipped entirely
+        union = page.locator(_selector_union(tuple(selectors))).filter(visible=True)
+        has_overlay = await union.count() > 0
+
+        for selector in (selectors if has_overlay else ()):
+            try:
+                element = page.locator(selector).first
+                if await element.is_visible():
+                    logger.debug("Dismissing overlay with selector: %s", selector)
+                    await element.click()
+                    await page.wait_for_timeout(500)  # Wait for overlay to disappear
+                    dismissed = selector
+                    break
+            except Exception:
+                continue  # Try next selector
+
+        try:
+            await page.keyboard.press('Escape')
+            await page.wait_for_timeout(300)
+        except Exception:
+            pass
+    except Exception as e:
+        logger.warning("Cookie overlay dismissal failed: %s", e)
+    return dismissed
@@ -7,24 +7,121 @@ This module manages recording sessions and provides data structures for macro st
 """
 
 import asyncio
-import json
+import orjson
 import uuid
 import time
 import os
+import sys
 import base64
+import hashlib
+import itertools
+import tempfile
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Any, Optional, AsyncGenerator
-from dataclasses import dataclass, asdict
-from playwright.async_api import async_playwright, Page, Browser, BrowserContext
+from typing import Dict, List, Any, Optional, AsyncGenerator, Awaitable, Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from playwright.async_api import Page, Browser, BrowserContext, TimeoutError as PlaywrightTimeoutError
+from core.browser_manager import get_playwright, get_shared_browser, dismiss_cookie_overlays, consent_scoped
 import logging
 import traceback
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-@dataclass
+# Visible playback windows are a local debugging aid; on servers the headful launch
+# just fails and costs a second launch, so it is opt-in via BROWSER_HEADLESS=false.
+PLAYBACK_HEADLESS = os.environ.get('BROWSER_HEADLESS', 'true').lower() != 'false'
+
+# On-demand viewport screenshots (used when the CDP screencast isn't available) are reused
+# for a short window right after input or navigation and a longer one while the page is idle
+SCREENSHOT_CACHE_TTL_ACTIVE = 0.2
+SCREENSHOT_CACHE_TTL_IDLE = 2.0
+
+# Launch args for the shared headless browser used by recording and playback sessions
+SESSION_BROWSER_ARGS = [
+    '--no-sandbox',
+    '--disable-web-security',
+    '--disable-dev-shm-usage',
+    '--disable-extensions',
+    '--disable-gpu',
+    '--no-first-run'
+]
+
+# Upper bound on the post-navigation settle wait during playback
+PLAYBACK_SETTLE_TIMEOUT_MS = 2500
+
+# Playbacks run by a fixed pool of this many workers; further requests wait their turn
+MAX_CONCURRENT_PLAYBACKS = int(os.environ.get('MAX_CONCURRENT_PLAYBACKS') or 0) or 4
+
+# Playback events are delivered to listeners in batches of up to this many, gathered over
+# this many seconds
+PLAYBACK_EVENT_BATCH_MAX = 32
+PLAYBACK_EVENT_BATCH_WINDOW = 0.01
+
+# Resolves once the browser has painted the next frame (two rAFs: one to reach the next
+# frame, one to know it was rendered), or after 100ms where rAF is throttled or paused,
+# as in headful background windows
+WAIT_FOR_PAINT_SCRIPT = (
+    "() => new Promise(resolve => {"
+    " requestAnimationFrame(() => requestAnimationFrame(resolve));"
+    " setTimeout(resolve, 100); })"
+)
+
+# Threads used by list_macros to read macro files that aren't cached yet
+MACRO_LOAD_WORKERS = 8
+
+# Index changes made within this many seconds are written to index.json together
+INDEX_FLUSH_DELAY = 0.5
+
+# Actions buffered per streaming consumer before the oldest are dropped
+ACTION_LISTENER_QUEUE_SIZE = 1024
+
+# How many stopped sessions remember their stop result, so a repeated stop/save call
+# (double click, client retry) gets the original answer instead of "Session not found"
+STOPPED_SESSION_RESULTS_LIMIT = 64
+
+# Common cookie banner and overlay selectors, tried in order when a recording starts.
+# These really get clicked, so text matches are exact (:text-is; a :has-text("OK") substring
+# match also hits "Book" or "Facebook") and words common in page UI only count inside a
+# consent container.
+COOKIE_DISMISS_SELECTORS = (
+    # Well-known consent platforms
+    '#onetrust-accept-btn-handler', '#truste-consent-button',
+    '#CybotCookiebotDialogBodyLevelButtonLevelOptinAllowAll',
+
+    # Generic cookie/GDPR dismissal
+    'button[id*="accept"]', 'button[class*="accept"]',
+    'button[id*="consent"]', 'button[class*="consent"]',
+    'button[id*="cookie"]', 'button[class*="cookie"]',
+    'button[id*="agree"]', 'button[class*="agree"]',
+
+    # Exact-text selectors that only ever mean consent
+    'button:text-is("Accept")', 'button:text-is("Accept All")',
+    'button:text-is("Accept all")', 'button:text-is("I Agree")',
+    'button:text-is("Agree")', 'button:text-is("Got it")',
+    'a:text-is("Accept")', 'a:text-is("I Agree")',
+
+    # Modal close buttons
+    '.modal [aria-label="Close"]',
+    '[role="dialog"] button[aria-label="Close"]',
+) + consent_scoped((
+    # Everyday button words, only inside a consent container
+    'button:text-is("OK")', 'button:text-is("Close")',
+    'button:text-is("Dismiss")', 'button:text-is("Continue")',
+    'button:text-is("Allow")', 'button:text-is("Allow All")',
+    'button[aria-label="Close"]', 'button[class*="close"]',
+    'button[class*="dismiss"]',
+)) + (
+    # Specific common implementations
+    '.cookie-banner button', '.gdpr-banner button',
+    '.privacy-notice button', '.consent-banner button'
+)
+
+# Long recordings hold thousands of actions; slotted instances drop the per-action __dict__.
+# dataclass(slots=True) needs Python 3.10, older interpreters keep regular instances.
+_DATACLASS_SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(**_DATACLASS_SLOTS)
 class MacroAction:
     """Represents a single recorded action in a macro"""
     id: int
@@ -37,7 +134,25 @@ class MacroAction:
     locator_bundle: Optional[Dict[str, Any]] = None
     
     def to_dict(self) -> Dict[str, Any]:
-        return asdict(self)
+        # Built by hand: asdict() deep-copies and introspects every field on each call
+        return {
+            'id': self.id,
+            'timestamp': self.timestamp,
+            'action_type': self.action_type,
+            'selector': self.selector,
+            'text': self.text,
+            'coordinates': self.coordinates,
+            'description': self.description,
+            'locator_bundle': self.locator_bundle,
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'MacroAction':
+        """
+        Rebuild a stored action. The generated __init__ is the fastest way to fill a slotted
+        instance, and it raises TypeError for data missing a required field.
+        """
+        return cls(**data)
 
 @dataclass 
 class Macro:
@@ -56,470 +171,648 @@ class Macro:
             self.tags = []
     
     def to_dict(self) -> Dict[str, Any]:
-        data = asdict(self)
-        data['actions'] = [action.to_dict() for action in self.actions]
-        return data
+        return {
+            'id': self.id,
+            'name': self.name,
+            'url': self.url,
+            'actions': [action.to_dict() for action in self.actions],
+            'created_at': self.created_at,
+            'duration': self.duration,
+            'description': self.description,
+            'tags': self.tags,
+        }
+    
+    def to_summary(self) -> Dict[str, Any]:
+        """Metadata-only view for listings; omits the (potentially large) action list"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'url': self.url,
+            'created_at': self.created_at,
+            'duration': self.duration,
+            'description': self.description,
+            'tags': self.tags,
+            'action_count': len(self.actions)
+        }
     
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'Macro':
-        actions = [MacroAction(**action) for action in data.get('actions', [])]
-        data['actions'] = actions
-        return cls(**data)
+        actions = [MacroAction.from_dict(action) for action in data.get('actions', [])]
+        return cls(**{**data, 'actions': actions})
 
-class RecordingSession:
-    """Manages an active recording session"""
+# Recorder script installed in every recorded page. Built once at import; each session only
+# substitutes its id. The guard keeps it from installing twice when the init script and the
+# initial evaluate both run in the same document.
+RECORDER_SCRIPT = """
+    (() => {
+        // Init scripts also run in iframes; only the top document is recorded
+        if (window.top !== window || window.macroRecorder) return;
+        // Classes too generic to identify an element (compared lowercased)
+        const GENERIC_CLASSES = new Set(['active', 'selected', 'hover', 'focus', 'disabled', 'btn', 'button', 'link']);
     
-    def __init__(self, session_id: str, url: str, macro_name: str = ""):
-        self.session_id = session_id
-        self.url = url
-        self.macro_name = macro_name
-        self.actions = []
-        self.start_time = time.time()
-        self.is_active = True
-        self.page: Optional[Page] = None
-        self.browser: Optional[Browser] = None
-        self.context: Optional[BrowserContext] = None
-        self.action_listeners = []  # For streaming recorded actions
+        // Enhanced macro recorder with improved selector generation
+        window.macroRecorder = {
+            sessionId: '__SESSION_ID__',
         
-        # Interactive viewport properties
-        self.viewport_size = {"width": 1200, "height": 800}
-        self.screenshot_cache = None
-        self.screenshot_cache_time = 0
-        self.tealium_events = []
-        self.network_beacons = []
+            // Per-element memo of the selector and locator bundle; repeat clicks/inputs on the same
+            // control skip the ancestor walk and uniqueness queries. WeakMaps let detached nodes be GC'd.
+            _selectorCache: new WeakMap(),
+            _bundleCache: new WeakMap(),
         
-    async def initialize_browser(self) -> bool:
-        """Initialize the browser for this recording session"""
-        try:
-            # Import playwright here to ensure it's available
-            from playwright.async_api import async_playwright
-            
-            playwright = await async_playwright().start()
-            
-            # Launch browser in headless mode for production compatibility
-            self.browser = await playwright.chromium.launch(
-                headless=True,  # Always headless for production
-                args=[
-                    '--no-sandbox', 
-                    '--disable-web-security',
-                    '--disable-dev-shm-usage',
-                    '--disable-extensions',
-                    '--disable-gpu',
-                    '--no-first-run'
-                ]
-            )
-            
-            self.context = await self.browser.new_context(
-                viewport=self.viewport_size,
-                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-            )
-            
-            self.page = await self.context.new_page()
-            
-            # Navigate to the target URL first
-            logger.info(f"Navigating to {self.url}")
-            await self.page.goto(self.url, wait_until='domcontentloaded', timeout=30000)
-            await self.page.wait_for_timeout(2000)  # Let page settle
-            
-            # Dismiss cookie banners and overlays automatically
-            await self.dismiss_cookie_overlays()
-            
-            # Then set up event listeners for recording interactions
-            await self.setup_recording_listeners()
-            
-            logger.info(f"Browser initialized successfully for session {self.session_id}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Failed to initialize browser for session {self.session_id}: {e}")
-            logger.error(f"Error details: {traceback.format_exc()}")
-            await self.cleanup()
-            return False
-    
-    async def setup_recording_listeners(self):
-        """Set up event listeners to record user interactions"""
-        if not self.page:
-            return
-            
-        # Inject enhanced JavaScript to capture interactions with better selector generation
-        js_code = """
-            // Enhanced macro recorder with improved selector generation
-            window.macroRecorder = {
-                sessionId: '""" + self.session_id + """',
-                
-                generateSelector: function(element) {
-                    // Enhanced selector generation with Tealium-optimized strategies
-                    if (!element) return '';
-                    
-                    // Strategy 1: Use ID if available and unique
-                    if (element.id) {
-                        const idSelector = '#' + element.id;
-                        if (document.querySelectorAll(idSelector).length === 1) {
-                            return idSelector;
-                        }
+            generateSelector: function(element) {
+                if (!element) return '';
+                let selector = this._selectorCache.get(element);
+                if (selector === undefined) {
+                    selector = this.buildSelector(element);
+                    this._selectorCache.set(element, selector);
+                }
+                return selector;
+            },
+        
+            computeLocatorBundle: function(element) {
+                if (!element) return null;
+                let bundle = this._bundleCache.get(element);
+                if (bundle === undefined) {
+                    bundle = this.buildLocatorBundle(element);
+                    this._bundleCache.set(element, bundle);
+                }
+                return bundle;
+            },
+        
+            buildSelector: function(element) {
+                // Enhanced selector generation with Tealium-optimized strategies
+                if (!element) return '';
+            
+                // Strategy 1: Use ID if available and unique
+                if (element.id) {
+                    const idSelector = '#' + element.id;
+                    if (document.querySelectorAll(idSelector).length === 1) {
+                        return idSelector;
                     }
-                    
-                    // Strategy 2: Use data attributes if available
-                    const dataAttrs = ['data-testid', 'data-cy', 'data-test', 'data-automation'];
-                    for (const attr of dataAttrs) {
-                        if (element.hasAttribute(attr)) {
-                            const value = element.getAttribute(attr);
-                            const selector = `[${attr}="${value}"]`;
-                            if (document.querySelectorAll(selector).length === 1) {
-                                return selector;
-                            }
+                }
+            
+                // Strategy 2: Use data attributes if available
+                const dataAttrs = ['data-testid', 'data-cy', 'data-test', 'data-automation'];
+                for (const attr of dataAttrs) {
+                    if (element.hasAttribute(attr)) {
+                        const value = element.getAttribute(attr);
+                        const selector = `[${attr}="${value}"]`;
+                        if (document.querySelectorAll(selector).length === 1) {
+                            return selector;
                         }
                     }
-                    
-                    // Strategy 2.5: Enhanced Tealium-optimized selectors for commerce tracking
-                    const text = element.textContent ? element.textContent.trim().toLowerCase() : '';
-                    const href = element.getAttribute('href') || '';
-                    
-                    // CRITICAL: Add to Cart button detection (highest priority for Tealium)
-                    if (text.includes('add to cart') || element.className.includes('buy')) {
-                        // Priority 1: Form with cart action
-                        let parent = element.parentElement;
-                        while (parent && parent.tagName !== 'BODY') {
-                            if (parent.tagName === 'FORM' && parent.action && parent.action.includes('cart')) {
-                                return `form[action*="cart"] button:has-text("${element.textContent.trim()}")`;
-                            }
-                            // Priority 2: Look for collapse/expandable sections (common on PRH)
-                            if (parent.id && parent.id.startsWith('collapse')) {
-                                return `div[id^="collapse"].in form button:has-text("${element.textContent.trim()}")`;
-                            }
-                            parent = parent.parentElement;
+                }
+            
+                // Strategy 2.5: Enhanced Tealium-optimized selectors for commerce tracking
+                const text = element.textContent ? element.textContent.trim().toLowerCase() : '';
+                const href = element.getAttribute('href') || '';
+            
+                // CRITICAL: Add to Cart button detection (highest priority for Tealium)
+                if (text.includes('add to cart') || element.className.includes('buy')) {
+                    // Priority 1: Form with cart action
+                    let parent = element.parentElement;
+                    while (parent && parent.tagName !== 'BODY') {
+                        if (parent.tagName === 'FORM' && parent.action && parent.action.includes('cart')) {
+                            return `form[action*="cart"] button:has-text("${element.textContent.trim()}")`;
                         }
-                        // Priority 3: Class-based fallback
-                        if (element.className) {
-                            const mainClass = element.className.split(' ')[0];
-                            return `button.${mainClass}:has-text("${element.textContent.trim()}")`;
+                        // Priority 2: Look for collapse/expandable sections (common on PRH)
+                        if (parent.id && parent.id.startsWith('collapse')) {
+                            return `div[id^="collapse"].in form button:has-text("${element.textContent.trim()}")`;
                         }
+                        parent = parent.parentElement;
                     }
-                    
-                    // CRITICAL: Retailer link detection (high priority for Tealium commerce tracking)
-                    if (element.tagName === 'A' && (text.includes('amazon') || text.includes('barnes') || href.includes('amazon.com') || href.includes('barnesandnoble.com'))) {
-                        // Priority 1: Affiliate buttons container
-                        let parent = element.parentElement;
-                        while (parent && parent.tagName !== 'BODY') {
-                            if (parent.className && parent.className.includes('affiliate')) {
-                                return `.affiliate-buttons a:has-text("${element.textContent.trim()}")`;
-                            }
-                            if (parent.className && parent.className.includes('buy')) {
-                                return `.buy_clmn a:has-text("${element.textContent.trim()}")`;
-                            }
-                            if (parent.className && parent.className.includes('isbn-related')) {
-                                return `.isbn-related a:has-text("${element.textContent.trim()}")`;
-                            }
-                            parent = parent.parentElement;
-                        }
-                        // Priority 2: Direct href-based selector
-                        if (href.includes('amazon.com')) {
-                            return `a[href*="amazon.com"]:has-text("${element.textContent.trim()}")`;
-                        }
-                        if (href.includes('barnesandnoble.com')) {
-                            return `a[href*="barnesandnoble.com"]:has-text("${element.textContent.trim()}")`;
-                        }
+                    // Priority 3: Class-based fallback
+                    if (element.className) {
+                        const mainClass = element.className.split(' ')[0];
+                        return `button.${mainClass}:has-text("${element.textContent.trim()}")`;
                     }
-                    
-                    // HIGH PRIORITY: Preview/Sample buttons (important for engagement tracking)
-                    if (text.includes('look inside') || text.includes('preview') || text.includes('sample') || text.includes('read sample')) {
-                        if (element.className.includes('look-inside')) {
-                            return `.product-look-inside.insight`;
+                }
+            
+                // CRITICAL: Retailer link detection (high priority for Tealium commerce tracking)
+                if (element.tagName === 'A' && (text.includes('amazon') || text.includes('barnes') || href.includes('amazon.com') || href.includes('barnesandnoble.com'))) {
+                    // Priority 1: Affiliate buttons container
+                    let parent = element.parentElement;
+                    while (parent && parent.tagName !== 'BODY') {
+                        if (parent.className && parent.className.includes('affiliate')) {
+                            return `.affiliate-buttons a:has-text("${element.textContent.trim()}")`;
                         }
-                        if (element.className.includes('read-sample') || element.className.includes('excerpt')) {
-                            return `.product-read-sample.excerpt-button`;
+                        if (parent.className && parent.className.includes('buy')) {
+                            return `.buy_clmn a:has-text("${element.textContent.trim()}")`;
                         }
-                        if (element.className) {
-                            const mainClass = element.className.split(' ')[0];
-                            return `button.${mainClass}:has-text("${element.textContent.trim()}")`;
+                        if (parent.className && parent.className.includes('isbn-related')) {
+                            return `.isbn-related a:has-text("${element.textContent.trim()}")`;
                         }
+                        parent = parent.parentElement;
                     }
-                    
-                    // MEDIUM PRIORITY: Newsletter and engagement elements
-                    if (element.tagName === 'INPUT' && (element.type === 'email' || element.id.includes('newsletter'))) {
-                        if (element.id.includes('newsletter')) {
-                            return `input[id*="newsletter"][type="email"]`;
-                        }
+                    // Priority 2: Direct href-based selector
+                    if (href.includes('amazon.com')) {
+                        return `a[href*="amazon.com"]:has-text("${element.textContent.trim()}")`;
                     }
-                    
-                    // Strategy 3: Generate CSS path with intelligent class selection
-                    const path = [];
-                    let current = element;
-                    
-                    while (current && current.nodeType === Node.ELEMENT_NODE && current !== document.body) {
-                        let selector = current.nodeName.toLowerCase();
-                        
-                        // Add meaningful classes (avoid generic ones)
-                        if (current.className) {
-                            const classes = current.className.split(/\s+/).filter(cls => {
-                                // Filter out common generic classes
-                                return cls && !cls.match(/^(active|selected|hover|focus|disabled|btn|button|link)$/i);
-                            });
-                            
-                            if (classes.length > 0) {
-                                selector += '.' + classes.slice(0, 2).join('.');
-                            }
-                        }
-                        
-                        // Add position if element has siblings with same tag
-                        const parent = current.parentElement;
-                        if (parent) {
-                            const siblings = Array.from(parent.children).filter(child => 
-                                child.nodeName === current.nodeName
-                            );
-                            
-                            if (siblings.length > 1) {
-                                const index = siblings.indexOf(current) + 1;
-                                selector += `:nth-child(${index})`;
-                            }
-                        }
-                        
-                        path.unshift(selector);
-                        current = current.parentElement;
-                        
-                        // Test if current path is unique
-                        if (path.length >= 2) {
-                            const testSelector = path.join(' > ');
-                            try {
-                                if (document.querySelectorAll(testSelector).length === 1) {
-                                    return testSelector;
-                                }
-                            } catch (e) {
-                                // Invalid selector, continue building
-                            }
-                        }
-                        
-                        // Prevent overly long selectors
-                        if (path.length > 5) break;
+                    if (href.includes('barnesandnoble.com')) {
+                        return `a[href*="barnesandnoble.com"]:has-text("${element.textContent.trim()}")`;
+                    }
+                }
+            
+                // HIGH PRIORITY: Preview/Sample buttons (important for engagement tracking)
+                if (text.includes('look inside') || text.includes('preview') || text.includes('sample') || text.includes('read sample')) {
+                    if (element.className.includes('look-inside')) {
+                        return `.product-look-inside.insight`;
+                    }
+                    if (element.className.includes('read-sample') || element.className.includes('excerpt')) {
+                        return `.product-read-sample.excerpt-button`;
+                    }
+                    if (element.className) {
+                        const mainClass = element.className.split(' ')[0];
+                        return `button.${mainClass}:has-text("${element.textContent.trim()}")`;
+                    }
+                }
+            
+                // MEDIUM PRIORITY: Newsletter and engagement elements
+                if (element.tagName === 'INPUT' && (element.type === 'email' || element.id.includes('newsletter'))) {
+                    if (element.id.includes('newsletter')) {
+                        return `input[id*="newsletter"][type="email"]`;
                     }
+                }
+            
+                // Strategy 3: Generate CSS path with intelligent class selection
+                const path = [];
+                let current = element;
+            
+                while (current && current.nodeType === Node.ELEMENT_NODE && current !== document.body) {
+                    let selector = current.nodeName.toLowerCase();
+                
+                    // Add meaningful classes (avoid generic ones)
+                    if (current.classList.length > 0) {
+                        // Filter out common generic classes
+                        const classes = Array.from(current.classList).filter(cls => !GENERIC_CLASSES.has(cls.toLowerCase()));
                     
-                    // Strategy 4: Use text content as fallback for links and buttons
-                    if (element.tagName === 'A' || element.tagName === 'BUTTON' || 
-                        element.getAttribute('role') === 'button') {
-                        const text = element.textContent.trim();
-                        if (text.length > 0 && text.length < 50) {
-                            const textSelector = `${element.tagName.toLowerCase()}:has-text("${text}")`;
-                            return textSelector;
+                        if (classes.length > 0) {
+                            selector += '.' + classes.slice(0, 2).join('.');
                         }
                     }
+                
+                    // Add position if element has siblings with same tag
+                    const parent = current.parentElement;
+                    if (parent) {
+                        const siblings = Array.from(parent.children).filter(child => 
+                            child.nodeName === current.nodeName
+                        );
                     
-                    return path.join(' > ') || element.tagName.toLowerCase();
-                },
-
-                computeLocatorBundle: function(element) {
-                    if (!element) return null;
-                    const tag = element.tagName.toLowerCase();
-                    const text = (element.textContent || '').trim();
-                    const ariaLabel = element.getAttribute && element.getAttribute('aria-label');
-                    const role = (function() {
-                        if (tag === 'a') return 'link';
-                        if (tag === 'button') return 'button';
-                        if (tag === 'input' && (element.type === 'submit' || element.type === 'button')) return 'button';
-                        const explicit = element.getAttribute && element.getAttribute('role');
-                        return explicit || null;
-                    })();
-                    const name = ariaLabel || (text && text.length <= 100 ? text : (text ? text.substring(0, 100) : null));
-                    const href = element.getAttribute && element.getAttribute('href');
-                    const id = element.id || null;
-                    const classes = element.className ? ('' + element.className).split(/\s+/).filter(Boolean) : [];
-                    const makeXPath = function(el){
-                        if (el.id) return '//*[@id="' + el.id + '"]';
-                        const parts = [];
-                        for (; el && el.nodeType === 1; el = el.parentNode) {
-                            let ix = 1;
-                            for (let sib = el.previousSibling; sib; sib = sib.previousSibling) {
-                                if (sib.nodeType === 1 && sib.nodeName === el.nodeName) ix++;
-                            }
-                            parts.unshift(el.nodeName.toLowerCase() + '[' + ix + ']');
+                        if (siblings.length > 1) {
+                            const index = siblings.indexOf(current) + 1;
+                            selector += `:nth-child(${index})`;
                         }
-                        return '//' + parts.join('/');
-                    };
-                    const xpath = makeXPath(element);
-                    // Capture up to 5 ancestors with id/classes for scoping
-                    const ancestors = [];
-                    let cur = element.parentElement;
-                    while (cur && ancestors.length < 5) {
-                        ancestors.push({
-                            tag: cur.tagName.toLowerCase(),
-                            id: cur.id || null,
-                            classes: cur.className ? ('' + cur.className).split(/\s+/).filter(Boolean) : []
-                        });
-                        cur = cur.parentElement;
                     }
-                    return { role, name, href, tag, id, classes, text: name, xpath, ancestors };
-                },
                 
-                recordAction: function(action) {
-                    // Enhanced action recording with validation
-                    if (!action.selector) return;
-                    
-                    // Add action to console for Playwright to capture
-                    console.log('MACRO_ACTION:' + JSON.stringify(action));
-                    
-                    // Also try to post message (for future iframe support)
+                    path.unshift(selector);
+                    current = current.parentElement;
+                
+                    // Prevent overly long selectors
+                    if (path.length > 5) break;
+                }
+            
+                // Find the shortest unique path (at least two levels). Adding ancestors can only
+                // narrow the matches, so bisect over the path length instead of scanning the whole
+                // DOM once per level.
+                const matchCount = (depth) => {
                     try {
-                        window.postMessage({
-                            type: 'MACRO_ACTION',
-                            sessionId: this.sessionId,
-                            action: action
-                        }, '*');
+                        return document.querySelectorAll(path.slice(-depth).join(' > ')).length;
                     } catch (e) {
-                        // Ignore postMessage errors
+                        return 0;  // Invalid selector
                     }
-                },
-                
-                addVisualFeedback: function(element, type = 'click') {
-                    if (!element) return;
-                    
-                    // Create visual feedback overlay
+                };
+                if (path.length >= 2 && matchCount(path.length) <= 1) {
+                    let lo = 2, hi = path.length;
+                    while (lo < hi) {
+                        const mid = (lo + hi) >> 1;
+                        if (matchCount(mid) <= 1) hi = mid; else lo = mid + 1;
+                    }
+                    if (matchCount(lo) === 1) {
+                        return path.slice(-lo).join(' > ');
+                    }
+                }
+            
+                // Strategy 4: Use text content as fallback for links and buttons
+                if (element.tagName === 'A' || element.tagName === 'BUTTON' || 
+                    element.getAttribute('role') === 'button') {
+                    const text = element.textContent.trim();
+                    if (text.length > 0 && text.length < 50) {
+                        const textSelector = `${element.tagName.toLowerCase()}:has-text("${text}")`;
+                        return textSelector;
+                    }
+                }
+            
+                return path.join(' > ') || element.tagName.toLowerCase();
+            },
+
+            buildLocatorBundle: function(element) {
+                if (!element) return null;
+                const tag = element.tagName.toLowerCase();
+                const text = (element.textContent || '').trim();
+                const ariaLabel = element.getAttribute && element.getAttribute('aria-label');
+                const role = (function() {
+                    if (tag === 'a') return 'link';
+                    if (tag === 'button') return 'button';
+                    if (tag === 'input' && (element.type === 'submit' || element.type === 'button')) return 'button';
+                    const explicit = element.getAttribute && element.getAttribute('role');
+                    return explicit || null;
+                })();
+                const name = ariaLabel || (text && text.length <= 100 ? text : (text ? text.substring(0, 100) : null));
+                const href = element.getAttribute && element.getAttribute('href');
+                const id = element.id || null;
+                const classes = Array.from(element.classList || []);
+                const makeXPath = function(el){
+                    if (el.id) return '//*[@id="' + el.id + '"]';
+                    const parts = [];
+                    for (; el && el.nodeType === 1; el = el.parentNode) {
+                        let ix = 1;
+                        for (let sib = el.previousSibling; sib; sib = sib.previousSibling) {
+                            if (sib.nodeType === 1 && sib.nodeName === el.nodeName) ix++;
+                        }
+                        parts.unshift(el.nodeName.toLowerCase() + '[' + ix + ']');
+                    }
+                    return '//' + parts.join('/');
+                };
+                const xpath = makeXPath(element);
+                // Capture up to 5 ancestors with id/classes for scoping
+                const ancestors = [];
+                let cur = element.parentElement;
+                while (cur && ancestors.length < 5) {
+                    ancestors.push({
+                        tag: cur.tagName.toLowerCase(),
+                        id: cur.id || null,
+                        classes: Array.from(cur.classList)
+                    });
+                    cur = cur.parentElement;
+                }
+                return { role, name, href, tag, id, classes, text: name, xpath, ancestors };
+            },
+        
+            _pending: [],
+            _flushTimer: null,
+        
+            recordAction: function(action) {
+                // Enhanced action recording with validation
+                if (!action.selector) return;
+            
+                // Queue for Playwright to capture; bursts go out as one console message
+                this._pending.push(action);
+                if (!this._flushTimer) {
+                    this._flushTimer = setTimeout(() => this.flush(), 50);
+                }
+            
+                // Also try to post message (for future iframe support)
+                try {
+                    window.postMessage({
+                        type: 'MACRO_ACTION',
+                        sessionId: this.sessionId,
+                        action: action
+                    }, '*');
+                } catch (e) {
+                    // Ignore postMessage errors
+                }
+            },
+        
+            flush: function() {
+                clearTimeout(this._flushTimer);
+                this._flushTimer = null;
+                if (this._pending.length === 0) return;
+                console.log('MACRO_BATCH:' + JSON.stringify(this._pending));
+                this._pending = [];
+            },
+        
+            _feedbackOverlay: null,
+            _feedbackTimer: null,
+        
+            // A single overlay is reused for every action; creating and removing a node per
+            // click forced a style recalc and layout each time
+            getFeedbackOverlay: function() {
+                if (!this._feedbackOverlay || !this._feedbackOverlay.isConnected) {
                     const overlay = document.createElement('div');
                     overlay.style.cssText = `
                         position: absolute;
+                        left: 0;
+                        top: 0;
+                        display: none;
                         pointer-events: none;
                         z-index: 10000;
                         border: 3px solid #4f79ff;
                         border-radius: 4px;
                         background: rgba(79, 121, 255, 0.1);
                         box-shadow: 0 0 10px rgba(79, 121, 255, 0.5);
-                        transition: all 0.3s ease;
+                        transition: opacity 0.3s ease;
                     `;
-                    
+                    document.body.appendChild(overlay);
+                    this._feedbackOverlay = overlay;
+                }
+                return this._feedbackOverlay;
+            },
+        
+            addVisualFeedback: function(element, type = 'click') {
+                if (!element) return;
+            
+                // Read layout and write styles in the same frame
+                requestAnimationFrame(() => {
+                    const overlay = this.getFeedbackOverlay();
                     const rect = element.getBoundingClientRect();
-                    overlay.style.left = (rect.left + window.scrollX - 2) + 'px';
-                    overlay.style.top = (rect.top + window.scrollY - 2) + 'px';
+                    overlay.style.transform = `translate(${rect.left + window.scrollX - 2}px, ${rect.top + window.scrollY - 2}px)`;
                     overlay.style.width = (rect.width + 4) + 'px';
                     overlay.style.height = (rect.height + 4) + 'px';
-                    
-                    document.body.appendChild(overlay);
-                    
-                    // Add animation and remove
-                    setTimeout(() => {
-                        overlay.style.opacity = '0';
-                        overlay.style.transform = 'scale(1.1)';
-                    }, 100);
-                    
-                    setTimeout(() => {
-                        if (overlay.parentNode) {
-                            overlay.parentNode.removeChild(overlay);
+                    overlay.style.opacity = '1';
+                    overlay.style.display = 'block';
+                });
+            
+                // Fade out and hide on one shared timer
+                clearTimeout(this._feedbackTimer);
+                this._feedbackTimer = setTimeout(() => {
+                    const overlay = this._feedbackOverlay;
+                    if (!overlay) return;
+                    overlay.style.opacity = '0';
+                    this._feedbackTimer = setTimeout(() => {
+                        overlay.style.display = 'none';
+                    }, 300);
+                }, 1200);
+            
+                // Also add a small notification
+                this.showActionNotification(type, element);
+            },
+        
+            showActionNotification: function(type, element) {
+                const notification = document.createElement('div');
+                const text = element.textContent ? element.textContent.trim().substring(0, 30) : element.tagName;
+            
+                notification.innerHTML = `
+                    <div style="
+                        position: fixed;
+                        top: 20px;
+                        right: 20px;
+                        background: #4f79ff;
+                        color: white;
+                        padding: 8px 16px;
+                        border-radius: 6px;
+                        font-size: 14px;
+                        font-family: -apple-system, BlinkMacSystemFont, sans-serif;
+                        box-shadow: 0 4px 12px rgba(0,0,0,0.3);
+                        z-index: 10001;
+                        animation: slideInFade 0.3s ease;
+                    ">
+                        🎯 Recorded: ${type} on "${text}"
+                    </div>
+                `;
+            
+                if (!document.getElementById('macro-notification-style')) {
+                    const style = document.createElement('style');
+                    style.id = 'macro-notification-style';
+                    style.textContent = `
+                        @keyframes slideInFade {
+                            from { transform: translateX(100%); opacity: 0; }
+                            to { transform: translateX(0); opacity: 1; }
                         }
-                    }, 1500);
-                    
-                    // Also add a small notification
-                    this.showActionNotification(type, element);
-                },
-                
-                showActionNotification: function(type, element) {
-                    const notification = document.createElement('div');
-                    const text = element.textContent ? element.textContent.trim().substring(0, 30) : element.tagName;
-                    
-                    notification.innerHTML = `
-                        <div style="
-                            position: fixed;
-                            top: 20px;
-                            right: 20px;
-                            background: #4f79ff;
-                            color: white;
-                            padding: 8px 16px;
-                            border-radius: 6px;
-                            font-size: 14px;
-                            font-family: -apple-system, BlinkMacSystemFont, sans-serif;
-                            box-shadow: 0 4px 12px rgba(0,0,0,0.3);
-                            z-index: 10001;
-                            animation: slideInFade 0.3s ease;
-                        ">
-                            🎯 Recorded: ${type} on "${text}"
-                        </div>
                     `;
-                    
-                    if (!document.getElementById('macro-notification-style')) {
-                        const style = document.createElement('style');
-                        style.id = 'macro-notification-style';
-                        style.textContent = `
-                            @keyframes slideInFade {
-                                from { transform: translateX(100%); opacity: 0; }
-                                to { transform: translateX(0); opacity: 1; }
-                            }
-                        `;
-                        document.head.appendChild(style);
-                    }
-                    
-                    document.body.appendChild(notification);
-                    
-                    setTimeout(() => {
-                        if (notification.parentNode) {
-                            notification.parentNode.removeChild(notification);
-                        }
-                    }, 2000);
+                    document.head.appendChild(style);
                 }
-            };
             
-            // Enhanced click listener with better event handling
-            document.addEventListener('click', function(event) {
-                try {
-                    const selector = window.macroRecorder.generateSelector(event.target);
-                    const text = event.target.textContent ? event.target.textContent.trim().substring(0, 100) : '';
-                    const bundle = window.macroRecorder.computeLocatorBundle(event.target);
-                    
-                    const action = {
-                        type: 'click',
-                        selector: selector,
-                        text: text,
-                        locator_bundle: bundle,
-                        coordinates: {
-                            x: event.clientX,
-                            y: event.clientY,
-                            pageX: event.pageX,
-                            pageY: event.pageY
-                        },
-                        timestamp: Date.now(),
-                        tagName: event.target.tagName,
-                        href: event.target.href || '',
-                        className: event.target.className || ''
-                    };
-                    
-                    window.macroRecorder.recordAction(action);
-                    window.macroRecorder.addVisualFeedback(event.target, 'click');
-                } catch (error) {
-                    console.error('Error recording click:', error);
-                }
-            }, true);
+                document.body.appendChild(notification);
             
-            // Scroll recording disabled - focusing on click events only for Tealium analysis
-            
-            // Enhanced input listener for typing
-            let inputTimeout = {};
-            document.addEventListener('input', function(event) {
-                if (event.target.tagName === 'INPUT' || event.target.tagName === 'TEXTAREA') {
+                setTimeout(() => {
+                    if (notification.parentNode) {
+                        notification.parentNode.removeChild(notification);
+                    }
+                }, 2000);
+            }
+        };
+    
+        // Enhanced click listener with better event handling
+        document.addEventListener('click', function(event) {
+            try {
+                const selector = window.macroRecorder.generateSelector(event.target);
+                const text = event.target.textContent ? event.target.textContent.trim().substring(0, 100) : '';
+                const bundle = window.macroRecorder.computeLocatorBundle(event.target);
+            
+                const action = {
+                    type: 'click',
+                    selector: selector,
+                    text: text,
+                    locator_bundle: bundle,
+                    coordinates: {
+                        x: event.clientX,
+                        y: event.clientY,
+                        pageX: event.pageX,
+                        pageY: event.pageY
+                    },
+                    timestamp: Date.now(),
+                    tagName: event.target.tagName,
+                    href: event.target.href || '',
+                    className: event.target.className || ''
+                };
+            
+                window.macroRecorder.recordAction(action);
+                window.macroRecorder.addVisualFeedback(event.target, 'click');
+            } catch (error) {
+                console.error('Error recording click:', error);
+            }
+        }, true);
+    
+        // Scroll recording disabled - focusing on click events only for Tealium analysis
+    
+        // Enhanced input listener for typing
+        // One pending timer per element; the selector is only computed once typing settles
+        const inputTimers = new WeakMap();
+        document.addEventListener('input', function(event) {
+            const target = event.target;
+            if (target.tagName === 'INPUT' || target.tagName === 'TEXTAREA') {
+                // Debounce input events to avoid recording every keystroke
+                clearTimeout(inputTimers.get(target));
+                inputTimers.set(target, setTimeout(() => {
+                    inputTimers.delete(target);
                     try {
-                        const selector = window.macroRecorder.generateSelector(event.target);
-                        const inputId = selector + event.target.type;
-                        
-                        // Debounce input events to avoid recording every keystroke
-                        clearTimeout(inputTimeout[inputId]);
-                        inputTimeout[inputId] = setTimeout(() => {
-                            window.macroRecorder.recordAction({
-                                type: 'type',
-                                selector: selector,
-                                text: event.target.value,
-                                timestamp: Date.now(),
-                                inputType: event.target.type,
-                                placeholder: event.target.placeholder || ''
-                            });
-                            
-                            window.macroRecorder.addVisualFeedback(event.target, 'type');
-                        }, 500);
+                        window.macroRecorder.recordAction({
+                            type: 'type',
+                            selector: window.macroRecorder.generateSelector(target),
+                            text: target.value,
+                            timestamp: Date.now(),
+                            inputType: target.type,
+                            placeholder: target.placeholder || ''
+                        });
+                    
+                        window.macroRecorder.addVisualFeedback(target, 'type');
                     } catch (error) {
                         console.error('Error recording input:', error);
                     }
+                }, 500));
+            }
+        });
+    
+        // A click that navigates away must not lose the batch still waiting on its timer
+        window.addEventListener('pagehide', function() {
+            window.macroRecorder.flush();
+        });
+    
+        // Note: Hover events disabled to reduce noise - only recording clicks, scrolls, and typing
+    
+        console.log('✅ Macro recorder initialized successfully');
+    })();
+"""
+
+# Hooks utag.view/utag.link in recorded pages and queues each call on window.tealiumCapture,
+# so a viewport click drains only the events fired since the previous capture in one call
+TEALIUM_CAPTURE_SCRIPT = """
+    (() => {
+        // Init scripts also run in iframes; only the top document is recorded
+        if (window.top !== window || window.tealiumCapture) return;
+        window.tealiumCapture = {
+            dataLayer: {},
+            pending: [],
+            _wake: null,
+            // Optionally wait for events to fire, then hand back (and forget) the queued ones.
+            // Waits for the next paint (at most 100ms), then, if nothing is queued yet, until the first event
+            // arrives or settleMs runs out.
+            drain: async function(settleMs) {
+                if (settleMs > 0) {
+                    await new Promise(resolve => {
+                        requestAnimationFrame(() => requestAnimationFrame(resolve));
+                        setTimeout(resolve, 100);  // rAF never fires in paused background tabs
+                    });
+                    if (this.pending.length === 0) {
+                        await new Promise(resolve => {
+                            this._wake = resolve;
+                            setTimeout(resolve, settleMs);
+                        });
+                        this._wake = null;
+                    }
                 }
-            });
+                const events = this.pending;
+                this.pending = [];
+                return { events: events, dataLayer: this.dataLayer, utag_data: window.utag_data || {} };
+            }
+        };
+    
+        const logEvent = (type, data) => {
+            let dataCopy = {};
+            try {
+                dataCopy = JSON.parse(JSON.stringify(data || {}));
+            } catch (e) {
+                dataCopy = { serialization_error: e.message };
+            }
+            window.tealiumCapture.dataLayer = dataCopy;
+            window.tealiumCapture.pending.push({ type: type, timestamp: Date.now(), data: dataCopy });
+            if (window.tealiumCapture._wake) window.tealiumCapture._wake();
+        };
+    
+        const hook = (utagInstance, name) => {
+            const original = utagInstance[name];
+            if (typeof original !== 'function' || original.__mr_hooked) return !!(original && original.__mr_hooked);
+            utagInstance[name] = function(data) {
+                logEvent('utag.' + name, data);
+                return original.apply(this, arguments);
+            };
+            utagInstance[name].__mr_hooked = true;
+            return true;
+        };
+    
+        // utag loads asynchronously; keep trying to hook it for a while after page load
+        const tryHook = () => window.utag && hook(window.utag, 'view') && hook(window.utag, 'link');
+        if (!tryHook()) {
+            const interval = setInterval(() => { if (tryHook()) clearInterval(interval); }, 500);
+            setTimeout(() => clearInterval(interval), 15000);
+        }
+    })();
+"""
+
+class RecordingSession:
+    """Manages an active recording session"""
+    
+    def __init__(self, session_id: str, url: str, macro_name: str = ""):
+        self.session_id = session_id
+        self.url = url
+        self.macro_name = macro_name
+        self.actions = []
+        self._last_action_id = 0  # ids are 1-based and assigned in recording order
+        self.start_time = time.time()
+        self._start_ns = time.monotonic_ns()  # monotonic anchor paired with start_time
+        # Actions stamped before this (epoch ms) are setup noise, e.g. the cookie-banner click
+        # that happens while the recorder is already listening; set once initialization is done
+        self.record_after_ms = float('inf')
+        self.is_active = True
+        self.page: Optional[Page] = None
+        self.browser: Optional[Browser] = None
+        self.context: Optional[BrowserContext] = None
+        self.action_listeners: List[asyncio.Queue] = []  # one queue per streaming consumer
+        
+        # Interactive viewport properties
+        self.viewport_size = {"width": 1200, "height": 800}
+        self._viewport_scale = None  # (real width, real height, scale x, scale y); reset on resize
+        self.screenshot_cache = None
+        self.screenshot_cache_time = 0
+        self.screenshot_dirty = True  # set by input/navigation, cleared by a fresh capture
+        self.screencast_session = None  # CDP session pushing frames into screenshot_cache
+        self.screenshot_hash = None  # digest of the cached frame
+        self.screenshot_seq = 0  # bumped only when the frame content actually changes
+        self.tealium_events = []
+        self._tealium_seen = set()  # canonical JSON of each stored event, for O(1) de-dup
+        self._tealium_handle = None  # JSHandle to window.tealiumCapture in the current document
+        self.network_beacons = []
+    
+    async def __aenter__(self) -> 'RecordingSession':
+        """Initialize the browser unless that already happened; cleanup is guaranteed on exit"""
+        if self.page is None and not await self.initialize_browser():
+            raise RuntimeError(f"Failed to initialize browser for recording session {self.session_id}")
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.cleanup()
+        
+    async def initialize_browser(self) -> bool:
+        """Initialize the browser for this recording session"""
+        try:
+            # Sessions share one warm headless browser and each get their own context
+            self.browser = await get_shared_browser(SESSION_BROWSER_ARGS)
+            
+            self.context = await self.browser.new_context(
+                viewport=self.viewport_size,
+                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+            )
             
-            // Note: Hover events disabled to reduce noise - only recording clicks, scrolls, and typing
+            self.page = await self.context.new_page()
             
-            console.log('✅ Macro recorder initialized successfully');
-        """
-        
+            # Navigate to the target URL first
+            logger.info("Navigating to %s", self.url)
+            await self.page.goto(self.url, wait_until='domcontentloaded', timeout=30000)
+            # Let page settle, but stop waiting as soon as the network goes quiet
+            try:
+                await self.page.wait_for_load_state('networkidle', timeout=3000)
+            except PlaywrightTimeoutError:
+                pass
+            
+            # Dismiss cookie banners and set up recording listeners concurrently; they are
+            # independent, and record_after_ms keeps the dismissal click out of the macro
+            await asyncio.gather(self.dismiss_cookie_overlays(), self.setup_recording_listeners())
+            self.record_after_ms = self.now_ms()
+            
+            # Stream viewport frames instead of taking a screenshot per poll
+            await self.start_screencast()
+            
+            logger.info("Browser initialized successfully for session %s", self.session_id)
+            return True
+            
+        except Exception as e:
+            logger.error("Failed to initialize browser for session %s: %s", self.session_id, e)
+            logger.error("Error details: %s", traceback.format_exc())
+            await self.cleanup()
+            return False
+    
+    async def setup_recording_listeners(self):
+        """Set up event listeners to record user interactions"""
+        if not self.page:
+            return
+            
+        # Installed as an init script so the recorder survives navigations, and evaluated once
+        # for the document that is already loaded
+        js_code = RECORDER_SCRIPT.replace('__SESSION_ID__', self.session_id)
+        await self.context.add_init_script(js_code)
+        await self.context.add_init_script(TEALIUM_CAPTURE_SCRIPT)
         await self.page.evaluate(js_code)
+        await self.page.evaluate(TEALIUM_CAPTURE_SCRIPT)
         
         # Set up Playwright event listeners
         self.page.on("console", self.handle_console_message)
@@ -532,17 +825,65 @@ class RecordingSession:
         self.page.on("close", self.handle_page_close)
     
     # Interactive Viewport Methods
-    async def get_screenshot(self) -> Optional[str]:
-        """Get base64 encoded screenshot for interactive viewport"""
+    async def start_screencast(self):
+        """
+        Have Chromium push JPEG frames over CDP (Page.startScreencast) whenever the page repaints.
+        Frames are decoded once on arrival into screenshot_cache, so the viewport poll no
+        longer pays a page.screenshot round-trip per request.
+        Falls back to on-demand screenshots if CDP isn't available.
+        """
+        try:
+            cdp = await self.context.new_cdp_session(self.page)
+            cdp.on("Page.screencastFrame", self._on_screencast_frame)
+            await cdp.send("Page.startScreencast", {
+                "format": "jpeg",
+                "quality": 70,
+                "maxWidth": self.viewport_size["width"],
+                "maxHeight": self.viewport_size["height"],
+                "everyNthFrame": 2
+            })
+            self.screencast_session = cdp
+        except Exception as e:
+            logger.warning("Screencast unavailable, using on-demand screenshots: %s", e)
+            self.screencast_session = None
+    
+    def _store_screenshot(self, data: bytes):
+        """Cache a JPEG frame, bumping screenshot_seq only if it differs from the cached one"""
+        digest = hashlib.blake2b(data, digest_size=8).digest()
+        if digest != self.screenshot_hash:
+            self.screenshot_hash = digest
+            self.screenshot_seq += 1
+        self.screenshot_cache = data
+        self.screenshot_cache_time = time.time()
+    
+    def _on_screencast_frame(self, params: Dict[str, Any]):
+        """Cache the pushed frame and acknowledge it so Chromium sends the next one"""
+        self._store_screenshot(base64.b64decode(params["data"]))
+        asyncio.create_task(self._ack_screencast_frame(params["sessionId"]))
+    
+    async def _ack_screencast_frame(self, frame_session_id: int):
+        try:
+            await self.screencast_session.send("Page.screencastFrameAck", {"sessionId": frame_session_id})
+        except Exception:
+            pass  # Session closed while the ack was in flight
+    
+    async def get_screenshot(self) -> Optional[bytes]:
+        """Get the raw JPEG screenshot for interactive viewport"""
         if not self.page:
             return None
+        
+        # The screencast keeps the cache current; frames only stop arriving when nothing repaints
+        if self.screencast_session and self.screenshot_cache:
+            return self.screenshot_cache
             
         try:
-            # Check cache (200ms cache to improve performance)
+            # Reuse the cached frame; how long depends on whether anything happened since
             current_time = time.time()
+            ttl = SCREENSHOT_CACHE_TTL_ACTIVE if self.screenshot_dirty else SCREENSHOT_CACHE_TTL_IDLE
             if (self.screenshot_cache and 
-                current_time - self.screenshot_cache_time < 0.2):
+                current_time - self.screenshot_cache_time < ttl):
                 return self.screenshot_cache
+            self.screenshot_dirty = False
             
             # Take new screenshot
             screenshot = await self.page.screenshot(
@@ -551,80 +892,24 @@ class RecordingSession:
                 full_page=False
             )
             
-            # Encode and cache
-            screenshot_b64 = base64.b64encode(screenshot).decode()
-            self.screenshot_cache = screenshot_b64
-            self.screenshot_cache_time = current_time
-            
-            return screenshot_b64
+            self._store_screenshot(screenshot)
+            return screenshot
             
         except Exception as e:
-            logger.error(f"Screenshot capture failed: {e}")
+            logger.error("Screenshot capture failed: %s", e)
             return None
     
+    async def get_screenshot_b64(self) -> Optional[str]:
+        """Get base64 encoded screenshot, for callers that embed it in a data URL"""
+        screenshot = await self.get_screenshot()
+        return base64.b64encode(screenshot).decode() if screenshot else None
+    
     async def dismiss_cookie_overlays(self):
         """Automatically dismiss cookie banners, GDPR notices, and modal overlays"""
         if not self.page:
             return
-            
-        try:
-            # Wait a bit for any overlays to appear
-            await self.page.wait_for_timeout(1000)
-            
-            # Common cookie banner and overlay selectors
-            dismiss_selectors = [
-                # Generic cookie/GDPR dismissal
-                'button[id*="accept"]', 'button[class*="accept"]',
-                'button[id*="consent"]', 'button[class*="consent"]', 
-                'button[id*="cookie"]', 'button[class*="cookie"]',
-                'button[id*="agree"]', 'button[class*="agree"]',
-                'button[id*="close"]', 'button[class*="close"]',
-                'button[id*="dismiss"]', 'button[class*="dismiss"]',
-                'button[id*="ok"]', 'button[class*="ok"]',
-                
-                # Text-based selectors
-                'button:has-text("Accept")', 'button:has-text("Accept All")',
-                'button:has-text("I Agree")', 'button:has-text("Agree")',
-                'button:has-text("OK")', 'button:has-text("Close")',
-                'button:has-text("Dismiss")', 'button:has-text("Got it")',
-                'button:has-text("Continue")', 'button:has-text("Allow")',
-                
-                # Links that act as buttons
-                'a:has-text("Accept")', 'a:has-text("I Agree")', 
-                'a:has-text("Close")', 'a:has-text("Dismiss")',
-                
-                # Modal close buttons
-                '.modal .close', '.modal [aria-label="Close"]',
-                '.overlay .close', '.popup .close',
-                '[role="dialog"] button[aria-label="Close"]',
-                
-                # Specific common implementations
-                '.cookie-banner button', '.gdpr-banner button',
-                '.privacy-notice button', '.consent-banner button'
-            ]
-            
-            for selector in dismiss_selectors:
-                try:
-                    # Check if element exists and is visible
-                    element = await self.page.locator(selector).first
-                    if await element.is_visible():
-                        logger.info(f"Dismissing overlay with selector: {selector}")
-                        await element.click()
-                        await self.page.wait_for_timeout(500)  # Wait for overlay to disappear
-                        break  # Only dismiss one overlay to avoid conflicts
-                except Exception:
-                    continue  # Try next selector
-                    
-            # Also try to dismiss any modal dialogs by pressing Escape
-            try:
-                await self.page.keyboard.press('Escape')
-                await self.page.wait_for_timeout(500)
-            except Exception:
-                pass
-                
-        except Exception as e:
-            logger.warning(f"Cookie overlay dismissal failed: {e}")
-            # Don't fail the whole session for this
+        # Failures are logged inside; don't fail the whole session for this
+        await dismiss_cookie_overlays(self.page, COOKIE_DISMISS_SELECTORS)
     
     async def handle_viewport_click(self, x: int, y: int) -> dict:
         """Handle click from interactive viewport with proper coordinate scaling"""
@@ -632,27 +917,18 @@ class RecordingSession:
             return {"success": False, "error": "No active page"}
         
         try:
-            # Get actual viewport size from browser (it's a property, not a method)
-            viewport = self.page.viewport_size
-            if not viewport:
-                viewport = {"width": 1200, "height": 800}  # fallback
-            
             # Scale coordinates from viewport display to actual browser viewport
-            # The frontend should send us the scale factors, but for now we'll use the viewport size
-            scaled_x = int(x * (viewport["width"] / self.viewport_size["width"]))
-            scaled_y = int(y * (viewport["height"] / self.viewport_size["height"]))
+            real_width, real_height, scale_x, scale_y = self._get_viewport_scale()
             
             # Ensure coordinates are within bounds
-            scaled_x = max(0, min(scaled_x, viewport["width"] - 1))
-            scaled_y = max(0, min(scaled_y, viewport["height"] - 1))
+            scaled_x = max(0, min(int(x * scale_x), real_width - 1))
+            scaled_y = max(0, min(int(y * scale_y), real_height - 1))
             
-            logger.info(f"Viewport click: original({x}, {y}) -> scaled({scaled_x}, {scaled_y})")
+            logger.debug("Viewport click: original(%s, %s) -> scaled(%s, %s)", x, y, scaled_x, scaled_y)
             
             # Click at scaled coordinates
             await self.page.mouse.click(scaled_x, scaled_y)
-            
-            # Small delay to allow any events to trigger
-            await self.page.wait_for_timeout(100)
+            self.screenshot_dirty = True
             
             # Record this as a click action
             await self.record_action({
@@ -660,16 +936,17 @@ class RecordingSession:
                 'selector': f'mouse_click_at({scaled_x},{scaled_y})',
                 'text': '',
                 'coordinates': {'x': scaled_x, 'y': scaled_y, 'pageX': scaled_x, 'pageY': scaled_y},
-                'timestamp': time.time() * 1000
+                'timestamp': self.now_ms()
             })
             
-            # Capture any Tealium events that might have been triggered
-            await self.capture_tealium_state()
+            # Capture any Tealium events that might have been triggered, after a small in-page
+            # delay for them to fire; returned so the caller doesn't need a second round-trip
+            tealium_state = await self.capture_tealium_state(settle_ms=100)
             
-            return {"success": True}
+            return {"success": True, "tealium_state": tealium_state}
             
         except Exception as e:
-            logger.error(f"Viewport click failed: {e}")
+            logger.error("Viewport click failed: %s", e)
             return {"success": False, "error": str(e)}
     
     async def handle_viewport_type(self, text: str) -> dict:
@@ -679,10 +956,11 @@ class RecordingSession:
         
         try:
             await self.page.keyboard.type(text)
+            self.screenshot_dirty = True
             return {"success": True}
             
         except Exception as e:
-            logger.error(f"Viewport type failed: {e}")
+            logger.error("Viewport type failed: %s", e)
             return {"success": False, "error": str(e)}
     
     async def handle_viewport_key(self, key: str) -> dict:
@@ -692,10 +970,11 @@ class RecordingSession:
         
         try:
             await self.page.keyboard.press(key)
+            self.screenshot_dirty = True
             return {"success": True}
             
         except Exception as e:
-            logger.error(f"Viewport key failed: {e}")
+            logger.error("Viewport key failed: %s", e)
             return {"success": False, "error": str(e)}
     
     async def handle_viewport_scroll(self, delta_y: int) -> dict:
@@ -705,90 +984,128 @@ class RecordingSession:
         
         try:
             await self.page.mouse.wheel(0, delta_y)
+            self.screenshot_dirty = True
             return {"success": True}
             
         except Exception as e:
-            logger.error(f"Viewport scroll failed: {e}")
+            logger.error("Viewport scroll failed: %s", e)
             return {"success": False, "error": str(e)}
     
-    async def capture_tealium_state(self) -> dict:
-        """Capture current Tealium events and data layer state"""
+    async def capture_tealium_state(self, settle_ms: int = 0) -> dict:
+        """
+        Capture Tealium events fired since the last capture, plus the current data layer state.
+        settle_ms lets events from a just-performed action arrive first: the in-page drain returns as
+        soon as one is queued (or after settle_ms), instead of a fixed wait_for_timeout.
+        """
         if not self.page:
             return {"events": [], "dataLayer": {}}
         
         try:
-            # Evaluate JavaScript to get Tealium state
-            tealium_state = await self.page.evaluate("""
-                () => {
-                    return {
-                        events: window.tealiumCapture?.events || [],
-                        dataLayer: window.tealiumCapture?.dataLayer || {},
-                        utag_data: window.utag_data || {}
-                    };
-                }
-            """)
+            # Handle to the in-page capture object, kept until the next navigation replaces it
+            if self._tealium_handle is None:
+                self._tealium_handle = await self.page.evaluate_handle("() => window.tealiumCapture")
+            
+            # One round-trip that drains only the events queued since the last capture
+            tealium_state = await self._tealium_handle.evaluate(
+                "(cap, settleMs) => cap ? cap.drain(settleMs) : {events: [], dataLayer: {}}",
+                settle_ms
+            )
             
             # Store new events
             for event in tealium_state.get('events', []):
-                if event not in self.tealium_events:
+                key = orjson.dumps(event, option=orjson.OPT_SORT_KEYS)
+                if key not in self._tealium_seen:
+                    self._tealium_seen.add(key)
                     self.tealium_events.append(event)
             
             return tealium_state
             
         except Exception as e:
-            logger.error(f"Tealium state capture failed: {e}")
+            self._tealium_handle = None  # Most likely the page navigated mid-capture
+            logger.error("Tealium state capture failed: %s", e)
             return {"events": [], "dataLayer": {}}
     
+    def _get_viewport_scale(self) -> tuple:
+        """Return (real width, real height, scale x, scale y), computed once per viewport size"""
+        if self._viewport_scale is None:
+            # Actual viewport size from browser (it's a property, not a method)
+            viewport = (self.page.viewport_size if self.page else None) or {"width": 1200, "height": 800}
+            self._viewport_scale = (
+                viewport["width"],
+                viewport["height"],
+                viewport["width"] / self.viewport_size["width"],
+                viewport["height"] / self.viewport_size["height"],
+            )
+        return self._viewport_scale
+    
     def set_viewport_size(self, width: int, height: int):
         """Update viewport size for interactive display"""
         self.viewport_size = {"width": width, "height": height}
-        logger.info(f"Updated viewport size to {width}x{height} for session {self.session_id}")
+        self._viewport_scale = None
+        logger.info("Updated viewport size to %sx%s for session %s", width, height, self.session_id)
     
     async def record_page_load(self):
         """Record page load event"""
+        self.screenshot_dirty = True
         await self.record_action({
             'type': 'pageload',
             'selector': 'document',
             'text': self.page.url,
-            'timestamp': time.time() * 1000
+            'timestamp': self.now_ms()
         })
     
     def handle_page_close(self):
         """Handle page close event"""
-        logger.info(f"Page closed for session {self.session_id}")
+        logger.info("Page closed for session %s", self.session_id)
         self.is_active = False
     
     def handle_context_close(self):
         """Handle browser context close event"""
-        logger.info(f"Browser context closed for session {self.session_id}")
+        logger.info("Browser context closed for session %s", self.session_id)
         self.is_active = False
     
     async def handle_console_message(self, msg):
         """Handle console messages from the injected recording script"""
         try:
-            if msg.type == "log" and "MACRO_ACTION:" in msg.text:
-                action_data = json.loads(msg.text.replace("MACRO_ACTION:", ""))
-                await self.record_action(action_data)
+            if msg.type != "log":
+                return
+            text = msg.text
+            if text.startswith("MACRO_BATCH:"):
+                for action_data in orjson.loads(text[len("MACRO_BATCH:"):]):
+                    await self.record_action(action_data)
+            elif text.startswith("MACRO_ACTION:"):
+                await self.record_action(orjson.loads(text[len("MACRO_ACTION:"):]))
         except Exception as e:
-            logger.error(f"Error handling console message: {e}")
+            logger.error("Error handling console message: %s", e)
     
     async def handle_navigation(self, frame):
         """Handle page navigation events"""
         if frame == self.page.main_frame:
+            self.screenshot_dirty = True
+            self._tealium_handle = None  # The new document has its own capture object
             await self.record_action({
                 'type': 'navigate',
                 'selector': 'window',
                 'text': frame.url,
-                'timestamp': time.time() * 1000
+                'timestamp': self.now_ms()
             })
     
+    def now_ms(self) -> int:
+        """
+        Current time in epoch ms for server-side actions, derived from the monotonic clock so
+        a wall-clock jump mid-session can't reorder actions or skew playback delays. Stays
+        comparable with the Date.now() timestamps the page sends.
+        """
+        return int(self.start_time * 1000) + (time.monotonic_ns() - self._start_ns) // 1_000_000
+    
     async def record_action(self, action_data: Dict[str, Any]):
         """Record a new action and notify listeners"""
-        if not self.is_active:
+        if not self.is_active or action_data['timestamp'] < self.record_after_ms:
             return
             
+        self._last_action_id += 1
         action = MacroAction(
-            id=len(self.actions) + 1,
+            id=self._last_action_id,
             timestamp=action_data['timestamp'] - (self.start_time * 1000),
             action_type=action_data['type'],
             selector=action_data['selector'],
@@ -799,11 +1116,14 @@ class RecordingSession:
         )
         
         self.actions.append(action)
-        logger.info(f"Recorded action: {action.description}")
+        logger.debug("Recorded action: %s", action.description)
         
-        # Notify all listeners (for streaming)
-        for listener in self.action_listeners:
-            await listener(action)
+        # Fan out to streaming consumers without waiting on any of them; a consumer that
+        # falls too far behind loses its oldest actions rather than stalling the recording
+        for queue in self.action_listeners:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(action)
     
     def generate_action_description(self, action_data: Dict[str, Any]) -> str:
         """Generate a human-readable description for an action"""
@@ -823,27 +1143,34 @@ class RecordingSession:
         else:
             return f"{action_type.title()} action on {selector}"
     
-    def add_action_listener(self, listener):
-        """Add a listener for recorded actions (for streaming)"""
-        self.action_listeners.append(listener)
+    def add_action_listener(self) -> asyncio.Queue:
+        """Register a streaming consumer; recorded actions are delivered to the returned queue"""
+        queue = asyncio.Queue(maxsize=ACTION_LISTENER_QUEUE_SIZE)
+        self.action_listeners.append(queue)
+        return queue
     
-    def remove_action_listener(self, listener):
-        """Remove an action listener"""
-        if listener in self.action_listeners:
-            self.action_listeners.remove(listener)
+    def remove_action_listener(self, queue: asyncio.Queue):
+        """Remove an action listener queue"""
+        if queue in self.action_listeners:
+            self.action_listeners.remove(queue)
     
     async def cleanup(self):
-        """Clean up browser resources"""
-        try:
-            if self.context:
-                await self.context.close()
-            if self.browser:
-                await self.browser.close()
-        except Exception as e:
-            logger.error(f"Error during cleanup: {e}")
+        """Clean up browser resources; the browser itself is shared and stays up. Safe to call twice."""
+        context, self.context = self.context, None
+        if context:
+            try:
+                await context.close()
+            except Exception as e:
+                logger.error("Error closing context during cleanup: %s", e)
     
     def to_macro(self) -> Macro:
-        """Convert the recording session to a saved macro"""
+        """
+        Convert the recording session to a saved macro. The macro shares the session's action
+        list instead of copying it, so the session must already be stopped (record_action
+        ignores everything once is_active is False); a caller that keeps the session after a
+        failed save must discard the macro before reactivating it.
+        """
+        self.is_active = False
         duration = 0
         if self.actions:
             duration = self.actions[-1].timestamp
@@ -852,12 +1179,32 @@ class RecordingSession:
             id=str(uuid.uuid4()),
             name=self.macro_name or f"Macro for {self.url}",
             url=self.url,
-            actions=self.actions.copy(),
+            actions=self.actions,
             created_at=datetime.now().isoformat(),
             duration=duration,
             description=f"Recorded macro with {len(self.actions)} actions"
         )
 
+def _atomic_write(path: Path, data: bytes):
+    """
+    Write data to a temp file next to path and rename it over path, so a crash mid-write
+    leaves either the old file or the new one, never a truncated mix.
+    """
+    with tempfile.NamedTemporaryFile('wb', dir=path.parent, prefix=f".{path.name}.", delete=False) as tmp:
+        try:
+            tmp.write(data)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        except BaseException:
+            tmp.close()
+            os.unlink(tmp.name)
+            raise
+    try:
+        os.replace(tmp.name, path)
+    except BaseException:
+        os.unlink(tmp.name)
+        raise
+
 class MacroStorage:
     """Handles saving and loading macros to/from filesystem"""
     
@@ -865,62 +1212,129 @@ class MacroStorage:
         self.storage_dir = Path(storage_dir)
         self.storage_dir.mkdir(parents=True, exist_ok=True)
         self.macros_index_file = self.storage_dir / "index.json"
+        # macro_id -> (file mtime_ns, Macro); a stat() revalidates entries so external edits are picked up
+        self._macro_cache: Dict[str, tuple] = {}
+        # (index mtime_ns, index dict), revalidated the same way unless it has unflushed changes
+        self._index_cache: Optional[tuple] = None
+        self._index_dirty = False
+        self._index_flush_handle: Optional[asyncio.TimerHandle] = None
+    
+    def _load_index(self) -> Dict[str, List[str]]:
+        """Return the macros index, re-reading index.json only if it changed on disk"""
+        if self._index_dirty:
+            return self._index_cache[1]
+        try:
+            mtime_ns = self.macros_index_file.stat().st_mtime_ns
+        except FileNotFoundError:
+            self._index_cache = None
+            return {'macros': []}
+        
+        if self._index_cache and self._index_cache[0] == mtime_ns:
+            return self._index_cache[1]
+        
+        with open(self.macros_index_file, 'rb') as f:
+            index = orjson.loads(f.read())
+        self._index_cache = (mtime_ns, index)
+        return index
+    
+    def _set_index(self, index: Dict[str, List[str]]):
+        """
+        Replace the cached index and schedule one write for all changes made within
+        INDEX_FLUSH_DELAY; a bulk import then rewrites index.json once instead of per macro.
+        """
+        self._index_cache = (None, index)
+        self._index_dirty = True
+        if self._index_flush_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush_index()  # No event loop (scripts, worker threads): write now
+            return
+        self._index_flush_handle = loop.call_later(INDEX_FLUSH_DELAY, self.flush_index)
+    
+    def flush_index(self):
+        """Write pending index changes to disk now"""
+        if self._index_flush_handle is not None:
+            self._index_flush_handle.cancel()
+            self._index_flush_handle = None
+        if not self._index_dirty:
+            return
+        
+        index = self._index_cache[1]
+        try:
+            _atomic_write(self.macros_index_file, orjson.dumps(index, option=orjson.OPT_INDENT_2))
+            self._index_cache = (self.macros_index_file.stat().st_mtime_ns, index)
+            self._index_dirty = False
+        except Exception as e:
+            # Stays dirty, so the next change or explicit flush retries the write
+            logger.error("Failed to write macro index: %s", e)
     
     def save_macro(self, macro: Macro) -> bool:
         """Save a macro to storage"""
         try:
             # Save the individual macro file
             macro_file = self.storage_dir / f"{macro.id}.json"
-            with open(macro_file, 'w', encoding='utf-8') as f:
-                json.dump(macro.to_dict(), f, indent=2)
+            # orjson serializes the dataclasses (and nested actions) directly, no to_dict() pass.
+            # Written compact: indentation roughly doubled the bytes of a long macro.
+            _atomic_write(macro_file, orjson.dumps(macro))
+            self._macro_cache[macro.id] = (macro_file.stat().st_mtime_ns, macro)
             
             # Update the index
             self._update_index(macro)
             
-            logger.info(f"Saved macro: {macro.name} ({macro.id})")
+            logger.info("Saved macro: %s (%s)", macro.name, macro.id)
             return True
             
         except Exception as e:
-            logger.error(f"Failed to save macro {macro.id}: {e}")
+            self._macro_cache.pop(macro.id, None)
+            logger.error("Failed to save macro %s: %s", macro.id, e)
             return False
     
     def load_macro(self, macro_id: str) -> Optional[Macro]:
         """Load a specific macro by ID"""
         try:
             macro_file = self.storage_dir / f"{macro_id}.json"
-            if not macro_file.exists():
+            try:
+                mtime_ns = macro_file.stat().st_mtime_ns
+            except FileNotFoundError:
+                self._macro_cache.pop(macro_id, None)
                 return None
+            
+            cached = self._macro_cache.get(macro_id)
+            if cached and cached[0] == mtime_ns:
+                return cached[1]
                 
-            with open(macro_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            with open(macro_file, 'rb') as f:
+                data = orjson.loads(f.read())
             
-            return Macro.from_dict(data)
+            macro = Macro.from_dict(data)
+            self._macro_cache[macro_id] = (mtime_ns, macro)
+            return macro
             
         except Exception as e:
-            logger.error(f"Failed to load macro {macro_id}: {e}")
+            logger.error("Failed to load macro %s: %s", macro_id, e)
             return None
     
     def list_macros(self) -> List[Macro]:
         """List all saved macros"""
         try:
-            if not self.macros_index_file.exists():
-                return []
-            
-            with open(self.macros_index_file, 'r', encoding='utf-8') as f:
-                index = json.load(f)
+            macro_ids = self._load_index().get('macros', [])
             
-            macros = []
-            for macro_id in index.get('macros', []):
-                macro = self.load_macro(macro_id)
-                if macro:
-                    macros.append(macro)
+            # Cached macros cost a stat(); the rest are read and parsed in parallel
+            if all(macro_id in self._macro_cache for macro_id in macro_ids):
+                loaded = map(self.load_macro, macro_ids)
+            else:
+                with ThreadPoolExecutor(max_workers=MACRO_LOAD_WORKERS) as pool:
+                    loaded = list(pool.map(self.load_macro, macro_ids))
+            macros = [macro for macro in loaded if macro]
             
             # Sort by creation date (newest first)
             macros.sort(key=lambda m: m.created_at, reverse=True)
             return macros
             
         except Exception as e:
-            logger.error(f"Failed to list macros: {e}")
+            logger.error("Failed to list macros: %s", e)
             return []
     
     def delete_macro(self, macro_id: str) -> bool:
@@ -929,132 +1343,41 @@ class MacroStorage:
             macro_file = self.storage_dir / f"{macro_id}.json"
             if macro_file.exists():
                 macro_file.unlink()
+            self._macro_cache.pop(macro_id, None)
             
             # Remove from index
             self._remove_from_index(macro_id)
             
-            logger.info(f"Deleted macro: {macro_id}")
+            logger.info("Deleted macro: %s", macro_id)
             return True
             
         except Exception as e:
-            logger.error(f"Failed to delete macro {macro_id}: {e}")
+            logger.error("Failed to delete macro %s: %s", macro_id, e)
             return False
     
     def _update_index(self, macro: Macro):
         """Update the macros index file"""
         try:
-            index = {'macros': []}
-            if self.macros_index_file.exists():
-                with open(self.macros_index_file, 'r', encoding='utf-8') as f:
-                    index = json.load(f)
-            
-            if macro.id not in index['macros']:
-                index['macros'].append(macro.id)
+            index = self._load_index()
             
-            with open(self.macros_index_file, 'w', encoding='utf-8') as f:
-                json.dump(index, f, indent=2)
+            # Re-saving an existing macro (e.g. a rename) leaves the index untouched
+            if macro.id in index['macros']:
+                return
+            self._set_index({'macros': index['macros'] + [macro.id]})
                 
         except Exception as e:
-            logger.error(f"Failed to update index: {e}")
+            logger.error("Failed to update index: %s", e)
     
     def _remove_from_index(self, macro_id: str):
         """Remove a macro ID from the index"""
         try:
-            if not self.macros_index_file.exists():
-                return
-            
-            with open(self.macros_index_file, 'r', encoding='utf-8') as f:
-                index = json.load(f)
+            index = self._load_index()
             
             if macro_id in index.get('macros', []):
-                index['macros'].remove(macro_id)
-                
-                with open(self.macros_index_file, 'w', encoding='utf-8') as f:
-                    json.dump(index, f, indent=2)
+                self._set_index({'macros': [m for m in index['macros'] if m != macro_id]})
                     
         except Exception as e:
-            logger.error(f"Failed to remove from index: {e}")
-
-class MacroRecorderManager:
-    """Manages recording sessions and macro storage"""
-    
-    def __init__(self):
-        self.active_sessions: Dict[str, RecordingSession] = {}
-        self.storage = MacroStorage()
-    
-    async def start_recording_session(self, url: str, macro_name: str = "") -> tuple[bool, str, str]:
-        """Start a new recording session"""
-        session_id = str(uuid.uuid4())
-        
-        try:
-            session = RecordingSession(session_id, url, macro_name)
-            
-            # Initialize the browser
-            if await session.initialize_browser():
-                self.active_sessions[session_id] = session
-                logger.info(f"Started recording session {session_id} for {url}")
-                return True, session_id, "Recording session started successfully"
-            else:
-                return False, "", "Failed to initialize browser"
-                
-        except Exception as e:
-            logger.error(f"Failed to start recording session: {e}")
-            return False, "", str(e)
-    
-    def get_session(self, session_id: str) -> Optional[RecordingSession]:
-        """Get an active recording session"""
-        return self.active_sessions.get(session_id)
-    
-    async def stop_recording_session(self, session_id: str, save_macro: bool = True) -> tuple[bool, Optional[str], str]:
-        """Stop a recording session and optionally save as macro"""
-        session = self.active_sessions.get(session_id)
-        if not session:
-            return False, None, "Session not found"
-        
-        try:
-            session.is_active = False
-            
-            # Convert to macro and save if requested
-            macro_id = None
-            if save_macro and session.actions:
-                macro = session.to_macro()
-                if self.storage.save_macro(macro):
-                    macro_id = macro.id
-                else:
-                    return False, None, "Failed to save macro"
-            
-            # Cleanup browser resources
-            await session.cleanup()
-            
-            # Remove from active sessions
-            del self.active_sessions[session_id]
-            
-            # Log detailed summary of recorded actions
-            logger.info(f"Recording session stopped. {len(session.actions)} actions recorded:")
-            for i, action in enumerate(session.actions, 1):
-                logger.info(f"  {i}. {action.description or action.action_type} - {action.selector}")
-            
-            message = f"Recording session stopped. {len(session.actions)} actions recorded."
-            if macro_id:
-                message += f" Macro saved with ID: {macro_id}"
-                logger.info(f"Macro saved with ID: {macro_id}")
-            
-            logger.info(message)
-            return True, macro_id, message
-            
-        except Exception as e:
-            logger.error(f"Failed to stop recording session {session_id}: {e}")
-            return False, None, str(e)
-    
-    async def cleanup_all_sessions(self):
-        """Cleanup all active sessions (called on shutdown)"""
-        for session_id, session in self.active_sessions.items():
-            try:
-                await session.cleanup()
-            except Exception as e:
-                logger.error(f"Error cleaning up session {session_id}: {e}")
-        
-        self.active_sessions.clear()
+            logger.error("Failed to remove from index: %s", e)
 
 class PlaybackSession:
     """Manages macro playback"""
@@ -1067,37 +1390,50 @@ class PlaybackSession:
         self.page: Optional[Page] = None
         self.browser: Optional[Browser] = None
         self.context: Optional[BrowserContext] = None
+        self._owns_browser = False  # only a visible (headful) browser is launched per session
         self.playback_listeners = []
+        self._pending_events: List[Dict[str, Any]] = []  # buffered until the next flush_events
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()  # one batch in delivery at a time, in order
+        self.on_ready = None  # optional async callback(playback), run after the browser is up
+        self._scope_locator = None  # open collapse panel used to scope click strategies
+        self._click_plan: Dict[int, List[tuple]] = {}  # id(action) -> click candidates, built at start
+        # action_type -> bound executor, built once instead of walking an if/elif chain per action
+        self._action_handlers = {
+            'click': self.execute_click,
+            'scroll': self.execute_scroll,
+            'type': self.execute_type,
+            'hover': self.execute_hover,
+            'navigate': self.execute_navigate,
+            'pageload': self.execute_pageload,
+        }
+    
+    async def __aenter__(self) -> 'PlaybackSession':
+        """Initialize the browser unless that already happened; cleanup is guaranteed on exit"""
+        if self.page is None and not await self.initialize_browser():
+            raise RuntimeError(f"Failed to initialize browser for playback session {self.playback_id}")
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.cleanup()
         
     async def initialize_browser(self) -> bool:
         """Initialize browser for playback"""
         try:
-            # Import playwright here to ensure it's available
-            from playwright.async_api import async_playwright
-            
-            playwright = await async_playwright().start()
-            
-            # Try to launch browser with more permissive settings
-            try:
-                self.browser = await playwright.chromium.launch(
-                    headless=False,  # Show browser during playback
-                    args=[
-                        '--no-sandbox', 
-                        '--disable-web-security',
-                        '--disable-dev-shm-usage',
-                        '--disable-extensions',
-                        '--disable-gpu',
-                        '--no-first-run'
-                    ]
-                )
-            except Exception as launch_error:
-                logger.error(f"Failed to launch playback browser: {launch_error}")
-                # Try headless mode as fallback
-                logger.info("Attempting fallback to headless mode for playback...")
-                self.browser = await playwright.chromium.launch(
-                    headless=True,
-                    args=['--no-sandbox', '--disable-web-security']
-                )
+            if PLAYBACK_HEADLESS:
+                # Headless playback shares the warm session browser and only gets its own context
+                self.browser = await get_shared_browser(SESSION_BROWSER_ARGS)
+            else:
+                # Show browser during playback only when opted in; that needs its own headful launch
+                playwright = await get_playwright()
+                try:
+                    self.browser = await playwright.chromium.launch(headless=False, args=SESSION_BROWSER_ARGS)
+                    self._owns_browser = True
+                except Exception as launch_error:
+                    logger.error("Failed to launch playback browser: %s", launch_error)
+                    # Fall back to the shared headless browser
+                    logger.info("Attempting fallback to headless mode for playback...")
+                    self.browser = await get_shared_browser(SESSION_BROWSER_ARGS)
             
             self.context = await self.browser.new_context(
                 viewport={'width': 1920, 'height': 1080},
@@ -1107,16 +1443,16 @@ class PlaybackSession:
             self.page = await self.context.new_page()
             
             # Navigate to the original URL
-            logger.info(f"Navigating to {self.macro.url} for playback")
+            logger.info("Navigating to %s for playback", self.macro.url)
             await self.page.goto(self.macro.url, wait_until='domcontentloaded', timeout=30000)
-            await self.page.wait_for_timeout(2000)
+            await self.wait_for_settle()
             
-            logger.info(f"Playback browser initialized successfully for {self.playback_id}")
+            logger.info("Playback browser initialized successfully for %s", self.playback_id)
             return True
             
         except Exception as e:
-            logger.error(f"Failed to initialize playback browser: {e}")
-            logger.error(f"Error details: {traceback.format_exc()}")
+            logger.error("Failed to initialize playback browser: %s", e)
+            logger.error("Error details: %s", traceback.format_exc())
             await self.cleanup()
             return False
     
@@ -1132,6 +1468,14 @@ class PlaybackSession:
                 'total_actions': len(self.macro.actions)
             })
             
+            # Build every click's locator strategies up front; locators are lazy page-bound
+            # queries, so they stay valid for the whole playback
+            self._click_plan = {
+                id(action): self._click_candidates(action)
+                for action in self.macro.actions
+                if action.action_type == 'click'
+            }
+            
             for i, action in enumerate(self.macro.actions):
                 if not self.is_active:
                     break
@@ -1173,128 +1517,97 @@ class PlaybackSession:
             return True
             
         except Exception as e:
-            logger.error(f"Playback error: {e}")
+            logger.error("Playback error: %s", e)
             await self.notify_listeners({
                 'type': 'error',
                 'message': f'Playback error: {str(e)}'
             })
             return False
+        finally:
+            # A stopped playback ends without a 'complete' event; deliver what is still buffered
+            await self.flush_events()
     
     async def execute_action(self, action: MacroAction) -> bool:
         """Execute a single action"""
         try:
-            if action.action_type == 'click':
-                return await self.execute_click(action)
-            elif action.action_type == 'scroll':
-                return await self.execute_scroll(action)
-            elif action.action_type == 'type':
-                return await self.execute_type(action)
-            elif action.action_type == 'hover':
-                return await self.execute_hover(action)
-            elif action.action_type == 'navigate':
-                return await self.execute_navigate(action)
-            elif action.action_type == 'pageload':
-                # Page loads are already handled, just mark as successful
-                return True
-            else:
-                logger.warning(f"Unknown action type: {action.action_type}")
+            handler = self._action_handlers.get(action.action_type)
+            if handler is None:
+                logger.warning("Unknown action type: %s", action.action_type)
                 return True  # Don't fail on unknown actions
+            return await handler(action)
                 
         except Exception as e:
-            logger.error(f"Error executing action {action.action_type}: {e}")
+            logger.error("Error executing action %s: %s", action.action_type, e)
             return False
     
+    async def execute_pageload(self, action: MacroAction) -> bool:
+        """Page loads are already handled by navigation, just mark as successful"""
+        return True
+    
+    def _click_candidates(self, action: MacroAction) -> List[tuple]:
+        """(locator, visibility timeout ms) for each click strategy, most specific first"""
+        bundle = action.locator_bundle or {}
+        # Scope based on ancestors (prefer collapse.in container on PRH). Locators resolve
+        # lazily on each use, so one built per page stays valid across navigations.
+        if self._scope_locator is None:
+            self._scope_locator = self.page.locator('div[id^="collapse"].in').first
+        const_scope = self._scope_locator
+        candidates = []
+        
+        # 1) Role + name scoped
+        if bundle.get('role') and bundle.get('name'):
+            locator = self.page.get_by_role(bundle['role'], name=bundle['name']).filter(has=const_scope)
+            candidates.append((locator.first, 4000))
+        
+        # 2) Attribute-based
+        href = bundle.get('href')
+        if href:
+            locator = self.page.locator(f'a[href*="{href.split("/")[2]}"]') if '//' in href else self.page.locator(f'a[href*="{href}"]')
+            if bundle.get('name'):
+                locator = locator.filter(has_text=bundle['name'])
+            candidates.append((const_scope.locator(locator).first, 3000))
+        
+        # 3) Scoped CSS within visible container
+        candidates.append((self.page.locator('div[id^="collapse"].in ' + action.selector).first, 3000))
+        
+        # 4) Raw selector
+        candidates.append((self.page.locator(action.selector).first, 3000))
+        
+        # 5) XPath fallback
+        xpath = (bundle.get('xpath') if isinstance(bundle.get('xpath'), str) else None)
+        if xpath:
+            candidates.append((self.page.locator(f'xpath={xpath}').first, 3000))
+        
+        # 6) Text-based selector
+        if action.text:
+            candidates.append((self.page.locator(f":has-text('{action.text[:30]}')").first, 3000))
+        
+        return candidates
+    
     async def execute_click(self, action: MacroAction) -> bool:
         """Execute a click action"""
         try:
-            # Try robust strategies in order: role+name (scoped), attribute-based, scoped CSS, raw selector, XPath, coordinates
-            locator = None
-            bundle = action.locator_bundle or {}
-            # Build a scope based on ancestors (prefer collapse.in container on PRH)
-            const_scope = None
-            try:
-                const_scope = self.page.locator('div[id^="collapse"].in').first
-            except Exception:
-                const_scope = None
-
-            # 1) Role + name scoped
-            if bundle.get('role') and bundle.get('name'):
-                try:
-                    locator = self.page.get_by_role(bundle['role'], name=bundle['name'])
-                    if const_scope:
-                        locator = locator.filter(has=const_scope)
-                    await locator.first.scroll_into_view_if_needed()
-                    await locator.first.wait_for(state='visible', timeout=4000)
-                    await locator.first.click()
-                    await self.page.wait_for_timeout(500)
-                    return True
-                except Exception:
-                    pass
-
-            # 2) Attribute-based
-            href = bundle.get('href')
-            if href:
-                try:
-                    locator = self.page.locator(f'a[href*="{href.split("/")[2]}"]') if '//' in href else self.page.locator(f'a[href*="{href}"]')
-                    if bundle.get('name'):
-                        locator = locator.filter(has_text=bundle['name'])
-                    if const_scope:
-                        locator = const_scope.locator(locator)
-                    await locator.first.scroll_into_view_if_needed()
-                    await locator.first.wait_for(state='visible', timeout=3000)
-                    await locator.first.click()
-                    await self.page.wait_for_timeout(500)
-                    return True
-                except Exception:
-                    pass
-
-            # 3) Scoped CSS within visible container
-            try:
-                scoped_css = 'div[id^="collapse"].in ' + action.selector
-                locator = self.page.locator(scoped_css)
-                await locator.first.wait_for(state='visible', timeout=3000)
-                await locator.first.scroll_into_view_if_needed()
-                await locator.first.click()
-                await self.page.wait_for_timeout(500)
-                return True
-            except Exception:
-                pass
-
-            # 4) Raw selector
+            # All visibility probes run at once, so strategies that miss cost the longest timeout
+            # instead of the sum of them; the most specific strategy that finds its element still wins
+            candidates = self._click_plan.get(id(action)) or self._click_candidates(action)
+            probes = [
+                asyncio.create_task(locator.wait_for(state='visible', timeout=timeout))
+                for locator, timeout in candidates
+            ]
             try:
-                element = await self.page.wait_for_selector(action.selector, timeout=3000)
-                await element.scroll_into_view_if_needed()
-                await element.wait_for(state='visible', timeout=2000)
-                await element.click()
-                await self.page.wait_for_timeout(500)
-                return True
-            except Exception:
-                pass
-
-            # 5) XPath fallback
-            xpath = (bundle.get('xpath') if isinstance(bundle.get('xpath'), str) else None)
-            if xpath:
-                try:
-                    locator = self.page.locator(f'xpath={xpath}')
-                    await locator.first.wait_for(state='visible', timeout=3000)
-                    await locator.first.scroll_into_view_if_needed()
-                    await locator.first.click()
-                    await self.page.wait_for_timeout(500)
-                    return True
-                except Exception:
-                    pass
-            
-            # If that fails, try text-based selector
-            if action.text:
-                try:
-                    text_selector = f":has-text('{action.text[:30]}')"
-                    element = await self.page.wait_for_selector(text_selector, timeout=3000)
-                    if element:
-                        await element.click()
-                        await self.page.wait_for_timeout(500)
+                for (locator, _), probe in zip(candidates, probes):
+                    try:
+                        await probe
+                        await locator.scroll_into_view_if_needed()
+                        await locator.click()
+                        await self.wait_for_action_effects()
                         return True
-                except:
-                    pass
+                    except Exception:
+                        continue  # Try next strategy
+            finally:
+                for probe in probes:
+                    probe.cancel()
+                await asyncio.gather(*probes, return_exceptions=True)
             
             # If still fails, try clicking by coordinates
             if action.coordinates:
@@ -1303,16 +1616,16 @@ class PlaybackSession:
                         action.coordinates.get('pageX', action.coordinates.get('x', 0)),
                         action.coordinates.get('pageY', action.coordinates.get('y', 0))
                     )
-                    await self.page.wait_for_timeout(500)
+                    await self.wait_for_action_effects()
                     return True
                 except:
                     pass
             
-            logger.warning(f"Failed to find element for click: {action.selector}")
+            logger.warning("Failed to find element for click: %s", action.selector)
             return False
             
         except Exception as e:
-            logger.error(f"Error in execute_click: {e}")
+            logger.error("Error in execute_click: %s", e)
             return False
     
     async def execute_scroll(self, action: MacroAction) -> bool:
@@ -1321,12 +1634,12 @@ class PlaybackSession:
             if action.coordinates:
                 x = action.coordinates.get('x', 0)
                 y = action.coordinates.get('y', 0)
-                await self.page.evaluate(f"window.scrollTo({x}, {y})")
-                await self.page.wait_for_timeout(300)
+                await self.page.evaluate("([x, y]) => window.scrollTo(x, y)", [x, y])
+                await self.wait_for_action_effects()
                 return True
             return False
         except Exception as e:
-            logger.error(f"Error in execute_scroll: {e}")
+            logger.error("Error in execute_scroll: %s", e)
             return False
     
     async def execute_type(self, action: MacroAction) -> bool:
@@ -1338,11 +1651,11 @@ class PlaybackSession:
                 await element.click()
                 await self.page.keyboard.press('Control+a')
                 await element.type(action.text or '', delay=50)  # Slight delay between keystrokes
-                await self.page.wait_for_timeout(300)
+                await self.wait_for_action_effects()
                 return True
             return False
         except Exception as e:
-            logger.error(f"Error in execute_type: {e}")
+            logger.error("Error in execute_type: %s", e)
             return False
     
     async def execute_hover(self, action: MacroAction) -> bool:
@@ -1351,25 +1664,47 @@ class PlaybackSession:
             element = await self.page.wait_for_selector(action.selector, timeout=5000)
             if element:
                 await element.hover()
-                await self.page.wait_for_timeout(200)
+                await self.wait_for_action_effects()
                 return True
             return False
         except Exception as e:
-            logger.error(f"Error in execute_hover: {e}")
+            logger.error("Error in execute_hover: %s", e)
             return False
     
     async def execute_navigate(self, action: MacroAction) -> bool:
         """Execute a navigation action"""
         try:
             await self.page.goto(action.text or self.macro.url, wait_until='domcontentloaded')
-            await self.page.wait_for_timeout(2000)
+            await self.wait_for_settle()
             return True
         except Exception as e:
-            logger.error(f"Error in execute_navigate: {e}")
+            logger.error("Error in execute_navigate: %s", e)
             return False
     
+    async def wait_for_settle(self):
+        """Let the page settle after navigation, but stop waiting as soon as the network goes quiet"""
+        try:
+            await self.page.wait_for_load_state('networkidle', timeout=PLAYBACK_SETTLE_TIMEOUT_MS)
+        except PlaywrightTimeoutError:
+            pass  # Long-polling pages never go idle; the cap keeps them to the old fixed wait
+    
+    async def wait_for_action_effects(self):
+        """
+        Wait until the browser has painted an action's effect, or, if the action started a
+        navigation, until the new document is parsed. start_playback's delay between actions
+        (at least 0.5s) still paces the macro, so no fixed sleep is needed here.
+        """
+        try:
+            await self.page.evaluate(WAIT_FOR_PAINT_SCRIPT)
+        except Exception:
+            # The action navigated and the old document went away mid-evaluate
+            try:
+                await self.page.wait_for_load_state('domcontentloaded', timeout=PLAYBACK_SETTLE_TIMEOUT_MS)
+            except PlaywrightTimeoutError:
+                pass
+    
     def add_playback_listener(self, listener):
-        """Add a listener for playback events"""
+        """Add a listener for playback events; it is awaited with a list of one or more events"""
         self.playback_listeners.append(listener)
     
     def remove_playback_listener(self, listener):
@@ -1378,26 +1713,71 @@ class PlaybackSession:
             self.playback_listeners.remove(listener)
     
     async def notify_listeners(self, data):
-        """Notify all listeners of a playback event"""
-        for listener in self.playback_listeners:
-            try:
-                await listener(data)
-            except Exception as e:
-                logger.error(f"Error notifying playback listener: {e}")
+        """
+        Buffer a playback event. Events emitted within PLAYBACK_EVENT_BATCH_WINDOW go to the
+        listeners together, as one list; a final ('complete'/'error') event or a full batch is
+        delivered right away.
+        """
+        self._pending_events.append(data)
+        if data.get('type') in ('complete', 'error') or len(self._pending_events) >= PLAYBACK_EVENT_BATCH_MAX:
+            await self.flush_events()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_after_window())
+    
+    async def _flush_after_window(self):
+        await asyncio.sleep(PLAYBACK_EVENT_BATCH_WINDOW)
+        self._flush_task = None
+        await self.flush_events()
+    
+    async def flush_events(self):
+        """Deliver buffered events to all listeners concurrently, so one slow listener can't stall the rest"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()  # Still sleeping; this flush covers its events
+            self._flush_task = None
+        # A batch the window timer is already delivering must reach the listeners before a
+        # later one, such as the final 'complete' flushed inline
+        async with self._flush_lock:
+            batch, self._pending_events = self._pending_events, []
+            # Snapshot: a stream disconnecting mid-dispatch removes its listener from the list
+            listeners = tuple(self.playback_listeners)
+            if not batch or not listeners:
+                return
+            if len(listeners) == 1:
+                # The usual case (one SSE stream): await it directly, no gather bookkeeping
+                try:
+                    await listeners[0](batch)
+                except Exception as e:
+                    logger.error("Error notifying playback listener: %s", e)
+                return
+            results = await asyncio.gather(
+                *(listener(batch) for listener in listeners),
+                return_exceptions=True
+            )
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error("Error notifying playback listener: %s", result)
     
     def stop_playback(self):
         """Stop the current playback"""
         self.is_active = False
     
     async def cleanup(self):
-        """Clean up browser resources"""
-        try:
-            if self.context:
-                await self.context.close()
-            if self.browser:
+        """
+        Clean up browser resources; the browser is closed only if this session launched it.
+        Safe to call twice.
+        """
+        context, self.context = self.context, None
+        if context:
+            try:
+                await context.close()
+            except Exception as e:
+                logger.error("Error closing context during playback cleanup: %s", e)
+        if self.browser and self._owns_browser:
+            self._owns_browser = False
+            try:
                 await self.browser.close()
-        except Exception as e:
-            logger.error(f"Error during playback cleanup: {e}")
+            except Exception as e:
+                logger.error("Error closing browser during playback cleanup: %s", e)
 
 class MacroRecorderManager:
     """Manages recording sessions and macro storage"""
@@ -1406,6 +1786,41 @@ class MacroRecorderManager:
         self.active_sessions: Dict[str, RecordingSession] = {}
         self.active_playbacks: Dict[str, PlaybackSession] = {}
         self.storage = MacroStorage()
+        self._stop_results: Dict[str, tuple] = {}
+        # Playback id suffixes; unique per process even for back-to-back starts
+        self._playback_ids = itertools.count(1)
+        # Created on first playback, inside the running event loop
+        self._playback_queue: Optional[asyncio.Queue] = None
+        self._playback_workers: List[asyncio.Task] = []
+    
+    def _ensure_playback_workers(self) -> asyncio.Queue:
+        """Start the fixed pool of playback workers on first use"""
+        if self._playback_queue is None:
+            self._playback_queue = asyncio.Queue()
+            self._playback_workers = [
+                asyncio.create_task(self._playback_worker()) for _ in range(MAX_CONCURRENT_PLAYBACKS)
+            ]
+        return self._playback_queue
+    
+    async def shutdown_playback_workers(self):
+        """Cancel the playback workers and wait for them to finish (application shutdown)"""
+        workers, self._playback_workers = self._playback_workers, []
+        self._playback_queue = None
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+    
+    async def _playback_worker(self):
+        """Run queued playbacks one at a time, for as long as the process lives"""
+        queue = self._playback_queue
+        while True:
+            playback_id = await queue.get()
+            try:
+                await self._run_playback(playback_id)
+            except Exception as e:
+                logger.error("Playback %s failed: %s", playback_id, e)
+            finally:
+                queue.task_done()
     
     async def start_recording_session(self, url: str, macro_name: str = "") -> tuple[bool, str, str]:
         """Start a new recording session"""
@@ -1417,51 +1832,66 @@ class MacroRecorderManager:
             # Initialize the browser
             if await session.initialize_browser():
                 self.active_sessions[session_id] = session
-                logger.info(f"Started recording session {session_id} for {url}")
+                logger.info("Started recording session %s for %s", session_id, url)
                 return True, session_id, "Recording session started successfully"
             else:
                 return False, "", "Failed to initialize browser"
                 
         except Exception as e:
-            logger.error(f"Failed to start recording session: {e}")
+            logger.error("Failed to start recording session: %s", e)
             return False, "", str(e)
     
-    async def start_playback_session(self, macro_id: str) -> tuple[bool, str, str]:
-        """Start a new playback session"""
+    async def start_playback_session(
+        self,
+        macro_id: str,
+        on_ready: Optional[Callable[[PlaybackSession], Awaitable[None]]] = None
+    ) -> tuple[bool, str, str]:
+        """
+        Start a new playback session. The browser is opened by the worker that runs it, so a
+        playback waiting for a free worker holds no context; on_ready, if given, is awaited
+        once its page is loaded and before the first action.
+        """
         try:
             macro = self.storage.load_macro(macro_id)
             if not macro:
                 return False, "", "Macro not found"
             
-            playback_id = f"playback_{macro_id}_{int(time.time())}"
+            playback_id = f"playback_{macro_id}_{next(self._playback_ids)}"
             playback = PlaybackSession(playback_id, macro)
+            playback.on_ready = on_ready
+            self.active_playbacks[playback_id] = playback
             
-            # Initialize the browser
-            if await playback.initialize_browser():
-                self.active_playbacks[playback_id] = playback
-                
-                # Start playback in background
-                asyncio.create_task(self._run_playback(playback_id))
-                
-                logger.info(f"Started playback session {playback_id} for macro {macro.name}")
-                return True, playback_id, "Playback session started successfully"
-            else:
-                return False, "", "Failed to initialize playback browser"
+            # Hand the run to the worker pool; it waits there if all workers are busy
+            self._ensure_playback_workers().put_nowait(playback_id)
+            
+            logger.info("Queued playback session %s for macro %s", playback_id, macro.name)
+            return True, playback_id, "Playback session started successfully"
                 
         except Exception as e:
-            logger.error(f"Failed to start playback session: {e}")
+            logger.error("Failed to start playback session: %s", e)
             return False, "", str(e)
     
     async def _run_playback(self, playback_id: str):
         """Run playback in background"""
         playback = self.active_playbacks.get(playback_id)
-        if playback:
-            try:
+        if playback is None:
+            return
+        try:
+            if not playback.is_active:
+                # Stopped while still queued; don't open a browser just to find that out
+                return
+            # Opens the browser now that a worker is free, and closes the playback's context
+            # however this ends, cancellation included
+            async with playback:
+                if playback.on_ready is not None:
+                    await playback.on_ready(playback)
                 await playback.start_playback()
-            finally:
-                await playback.cleanup()
-                if playback_id in self.active_playbacks:
-                    del self.active_playbacks[playback_id]
+        except RuntimeError as e:
+            # Browser initialization failed; tell any attached stream and let it close
+            playback.is_active = False
+            await playback.notify_listeners({'type': 'error', 'message': str(e)})
+        finally:
+            self.active_playbacks.pop(playback_id, None)
     
     def get_session(self, session_id: str) -> Optional[RecordingSession]:
         """Get an active recording session"""
@@ -1472,11 +1902,20 @@ class MacroRecorderManager:
         return self.active_playbacks.get(playback_id)
     
     async def stop_recording_session(self, session_id: str, save_macro: bool = True) -> tuple[bool, Optional[str], str]:
-        """Stop a recording session and optionally save as macro"""
-        session = self.active_sessions.get(session_id)
+        """
+        Stop a recording session and optionally save as macro.
+        Repeated calls for an already-stopped session return the original result without
+        saving the macro again.
+        """
+        if session_id in self._stop_results:
+            return self._stop_results[session_id]
+        
+        # Taken out of the registry up front so a concurrent second stop can't save it twice
+        session = self.active_sessions.pop(session_id, None)
         if not session:
             return False, None, "Session not found"
         
+        was_active = session.is_active
         try:
             session.is_active = False
             
@@ -1486,51 +1925,60 @@ class MacroRecorderManager:
                 macro = session.to_macro()
                 if self.storage.save_macro(macro):
                     macro_id = macro.id
+                    # A stopped recording must be listed even if the process exits right after
+                    self.storage.flush_index()
                 else:
+                    # Keep the session around, still recording, so the save can be retried;
+                    # the unsaved macro that shared its action list is discarded
+                    session.is_active = was_active
+                    self.active_sessions[session_id] = session
                     return False, None, "Failed to save macro"
             
             # Cleanup browser resources
             await session.cleanup()
             
-            # Remove from active sessions
-            del self.active_sessions[session_id]
-            
             # Log detailed summary of recorded actions
-            logger.info(f"Recording session stopped. {len(session.actions)} actions recorded:")
-            for i, action in enumerate(session.actions, 1):
-                logger.info(f"  {i}. {action.description or action.action_type} - {action.selector}")
+            logger.info("Recording session stopped. %d actions recorded", len(session.actions))
+            if logger.isEnabledFor(logging.DEBUG):
+                for i, action in enumerate(session.actions, 1):
+                    logger.debug("  %d. %s - %s", i, action.description or action.action_type, action.selector)
             
             message = f"Recording session stopped. {len(session.actions)} actions recorded."
             if macro_id:
                 message += f" Macro saved with ID: {macro_id}"
-                logger.info(f"Macro saved with ID: {macro_id}")
+                logger.info("Macro saved with ID: %s", macro_id)
             
             logger.info(message)
+            if len(self._stop_results) >= STOPPED_SESSION_RESULTS_LIMIT:
+                self._stop_results.pop(next(iter(self._stop_results)))
+            self._stop_results[session_id] = (True, macro_id, message)
             return True, macro_id, message
             
         except Exception as e:
-            logger.error(f"Failed to stop recording session {session_id}: {e}")
+            logger.error("Failed to stop recording session %s: %s", session_id, e)
             return False, None, str(e)
     
+    async def _safe_cleanup(self, kind: str, session_id: str, session):
+        """Clean up one session, logging instead of raising so sibling cleanups still run"""
+        try:
+            if isinstance(session, PlaybackSession):
+                session.stop_playback()
+            await session.cleanup()
+        except Exception as e:
+            logger.error("Error cleaning up %s session %s: %s", kind, session_id, e)
+    
     async def cleanup_all_sessions(self):
         """Cleanup all active sessions (called on shutdown)"""
-        # Cleanup recording sessions
-        for session_id, session in self.active_sessions.items():
-            try:
-                await session.cleanup()
-            except Exception as e:
-                logger.error(f"Error cleaning up recording session {session_id}: {e}")
+        # Take the registries over up front: a playback finishing mid-cleanup deletes its own
+        # entry, which would break iterating the live dicts
+        sessions, self.active_sessions = self.active_sessions, {}
+        playbacks, self.active_playbacks = self.active_playbacks, {}
         
-        # Cleanup playback sessions
-        for playback_id, playback in self.active_playbacks.items():
-            try:
-                playback.stop_playback()
-                await playback.cleanup()
-            except Exception as e:
-                logger.error(f"Error cleaning up playback session {playback_id}: {e}")
-        
-        self.active_sessions.clear()
-        self.active_playbacks.clear()
+        # Each session only closes its own context, so they can all be torn down at once
+        await asyncio.gather(
+            *(self._safe_cleanup("recording", sid, s) for sid, s in sessions.items()),
+            *(self._safe_cleanup("playback", pid, p) for pid, p in playbacks.items())
+        )
 
 # Global recorder manager instance
 recorder_manager = MacroRecorderManager()
\ No newline at end of file
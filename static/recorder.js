@@ -1351,7 +1351,7 @@ class MacroRecorder {
         
         const macrosHtml = macros.map((macro, index) => {
             const hostname = new URL(macro.url).hostname;
-            const actionsCount = macro.actions ? macro.actions.length : 0;
+            const actionsCount = macro.action_count ?? (macro.actions ? macro.actions.length : 0);
             const duration = this.formatTime(macro.duration || 0);
             const createdDate = new Date(macro.created_at).toLocaleDateString();
             const macroId = macro.id;
@@ -2799,6 +2799,7 @@ class MacroRecorder {
         if (this.screenshotPolling) {
             clearInterval(this.screenshotPolling);
         }
+        this.screenshotSeq = 0; // frame sequence numbers are per session
         
         this.screenshotPolling = setInterval(async () => {
             if (this.sessionId && this.isRecording) {
@@ -2809,21 +2810,28 @@ class MacroRecorder {
     
     async updateViewportScreenshot() {
         try {
-            const response = await fetch(`/api/browser/${this.sessionId}/screenshot`);
-            const data = await response.json();
+            // Raw JPEG bytes; 204 means the frame hasn't changed since the last poll
+            const since = this.screenshotSeq || 0;
+            const response = await fetch(`/api/browser/${this.sessionId}/frame?since=${since}`);
+            if (response.status !== 200) return;
+            
+            this.screenshotSeq = parseInt(response.headers.get('X-Frame-Seq'), 10) || 0;
+            const frameUrl = URL.createObjectURL(await response.blob());
+            
+            const browserFrame = document.getElementById('browser-frame');
+            if (browserFrame) {
+                browserFrame.src = frameUrl;
+                browserFrame.style.display = 'block';
+            }
+            if (this.screenshotUrl) {
+                URL.revokeObjectURL(this.screenshotUrl);
+            }
+            this.screenshotUrl = frameUrl;
             
-            if (data.success && data.screenshot) {
-                const browserFrame = document.getElementById('browser-frame');
-                if (browserFrame) {
-                    browserFrame.src = data.screenshot;
-                    browserFrame.style.display = 'block';
-                }
-                
-                // Hide loading indicator
-                const loading = document.getElementById('viewport-loading');
-                if (loading) {
-                    loading.style.display = 'none';
-                }
+            // Hide loading indicator
+            const loading = document.getElementById('viewport-loading');
+            if (loading) {
+                loading.style.display = 'none';
             }
         } catch (error) {
             console.error('Screenshot update failed:', error);
@@ -3011,21 +3019,42 @@ class MacroRecorder {
             clearInterval(this.tealiumMonitoring);
         }
         
+        // Events and beacons received so far; their lengths are the cursors for the next poll
+        this.tealiumEvents = [];
+        this.networkBeacons = [];
+        
+        this.tealiumPollPending = false;
         this.tealiumMonitoring = setInterval(async () => {
-            if (this.sessionId && this.isRecording) {
-                await this.updateTealiumEvents();
+            // Skip the tick while a slow poll is still out; it would reuse the same cursors
+            if (this.sessionId && this.isRecording && !this.tealiumPollPending) {
+                this.tealiumPollPending = true;
+                try {
+                    await this.updateTealiumEvents();
+                } finally {
+                    this.tealiumPollPending = false;
+                }
             }
         }, 1000); // Check every second
     }
     
     async updateTealiumEvents() {
         try {
-            const response = await fetch(`/api/browser/${this.sessionId}/tealium-events`);
+            const params = new URLSearchParams({
+                events_since: this.tealiumEvents.length,
+                beacons_since: this.networkBeacons.length
+            });
+            const response = await fetch(`/api/browser/${this.sessionId}/tealium-events?${params}`);
             const data = await response.json();
             
             if (data.success) {
-                this.updateTealiumDisplay(data.events);
-                this.updateNetworkBeacons(data.network_beacons);
+                // The server only sends what arrived after our cursors; the totals give each
+                // batch's start index, so anything we already hold is dropped
+                const eventsStart = data.events_total - data.events.length;
+                const beaconsStart = data.beacons_total - data.network_beacons.length;
+                this.tealiumEvents.push(...data.events.slice(Math.max(0, this.tealiumEvents.length - eventsStart)));
+                this.networkBeacons.push(...data.network_beacons.slice(Math.max(0, this.networkBeacons.length - beaconsStart)));
+                this.updateTealiumDisplay(this.tealiumEvents);
+                this.updateNetworkBeacons(this.networkBeacons);
             }
         } catch (error) {
             console.error('Tealium events update failed:', error);